@@ -1,4 +1,4 @@
-from flask import Flask, send_from_directory
+from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
@@ -60,11 +60,100 @@ def create_app():
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
     app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(days=30)
 
+    # Caché en proceso del catálogo público (TTL en segundos, nº máx. de entradas)
+    app.config['CATALOG_CACHE_ENABLED'] = os.environ.get('CATALOG_CACHE_ENABLED', 'true').lower() == 'true'
+    app.config['CATALOG_CACHE_TTL'] = int(os.environ.get('CATALOG_CACHE_TTL', 60))
+    app.config['CATALOG_CACHE_MAXSIZE'] = int(os.environ.get('CATALOG_CACHE_MAXSIZE', 512))
+    app.config['PRODUCT_FRAGMENT_CACHE_MAXSIZE'] = int(os.environ.get('PRODUCT_FRAGMENT_CACHE_MAXSIZE', 5000))
+
+    # JSON con orjson si está instalado (mismo formato que el provider de Flask)
+    app.config['FAST_JSON'] = os.environ.get('FAST_JSON', 'true').lower() == 'true'
+
+    # Compresión de respuestas JSON/texto (gzip; brotli si está instalado)
+    app.config['COMPRESS_ENABLED'] = os.environ.get('COMPRESS_ENABLED', 'true').lower() == 'true'
+    app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    app.config['COMPRESS_LEVEL'] = int(os.environ.get('COMPRESS_LEVEL', 6))
+    app.config['COMPRESS_BR_LEVEL'] = int(os.environ.get('COMPRESS_BR_LEVEL', 4))
+
+    # Importación masiva de productos: filas por lote (INSERT ... ON CONFLICT / executemany)
+    app.config['IMPORT_BATCH_SIZE'] = int(os.environ.get('IMPORT_BATCH_SIZE', 500))
+
+    # Imágenes de producto: variantes generadas en un pool de hilos
+    app.config['UPLOAD_URL_PREFIX'] = os.environ.get('UPLOAD_URL_PREFIX', 'http://localhost:5000/static/uploads')
+    app.config['IMAGE_WORKERS'] = int(os.environ.get('IMAGE_WORKERS', 2))
+    app.config['IMAGE_PROCESSING_ASYNC'] = os.environ.get('IMAGE_PROCESSING_ASYNC', 'true').lower() == 'true'
+    # '' = Flask envía el fichero | 'x-accel' (nginx) | 'x-sendfile' (Apache/lighttpd)
+    app.config['UPLOADS_SENDFILE_MODE'] = os.environ.get('UPLOADS_SENDFILE_MODE', '')
+    app.config['UPLOADS_ACCEL_PREFIX'] = os.environ.get('UPLOADS_ACCEL_PREFIX', '/_uploads')
+
+    # Idempotency-Key (orders/create, coupons/apply, payments/create-intent)
+    app.config['IDEMPOTENCY_TTL'] = int(os.environ.get('IDEMPOTENCY_TTL', 86400))
+    app.config['IDEMPOTENCY_WAIT_TIMEOUT'] = float(os.environ.get('IDEMPOTENCY_WAIT_TIMEOUT', 10))
+    app.config['IDEMPOTENCY_LOCK_TIMEOUT'] = int(os.environ.get('IDEMPOTENCY_LOCK_TIMEOUT', 60))
+    app.config['IDEMPOTENCY_SWEEP_INTERVAL'] = int(os.environ.get('IDEMPOTENCY_SWEEP_INTERVAL', 300))
+
+    # Outbox de efectos secundarios (worker: python -m scripts.outbox_worker)
+    app.config['OUTBOX_BATCH_SIZE'] = int(os.environ.get('OUTBOX_BATCH_SIZE', 50))
+    app.config['OUTBOX_MAX_ATTEMPTS'] = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 8))
+    app.config['OUTBOX_BACKOFF_BASE'] = float(os.environ.get('OUTBOX_BACKOFF_BASE', 5))
+    app.config['OUTBOX_BACKOFF_MAX'] = float(os.environ.get('OUTBOX_BACKOFF_MAX', 3600))
+    app.config['OUTBOX_LOCK_TIMEOUT'] = int(os.environ.get('OUTBOX_LOCK_TIMEOUT', 300))
+    app.config['OUTBOX_POLL_INTERVAL'] = float(os.environ.get('OUTBOX_POLL_INTERVAL', 2))
+    app.config['INVOICE_AUTO_CREATE'] = os.environ.get('INVOICE_AUTO_CREATE', 'true').lower() == 'true'
+    app.config['STOCK_ALERT_THRESHOLD'] = int(os.environ.get('STOCK_ALERT_THRESHOLD', 5))
+    app.config['STOCK_ALERT_EMAIL'] = os.environ.get('STOCK_ALERT_EMAIL')
+
+    # Email (SMTP); sin MAIL_SERVER los emails solo se registran en el log
+    app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER')
+    app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 587))
+    app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
+    app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
+    app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', 'true').lower() == 'true'
+    app.config['MAIL_FROM'] = os.environ.get('MAIL_FROM', 'no-reply@blitzshop.com')
+
+    # Contador de consultas SQL por petición (cabecera X-Query-Count / presupuestos @max_queries)
+    app.config['QUERY_COUNT_HEADER'] = os.environ.get('QUERY_COUNT_HEADER', 'false').lower() == 'true'
+    app.config['QUERY_BUDGET_STRICT'] = os.environ.get('QUERY_BUDGET_STRICT', 'false').lower() == 'true'
+
+    # Pasarela de pago (services/payment_gateway.py): stripe | fake (benchmarks sin red)
+    app.config['PAYMENT_GATEWAY'] = os.environ.get('PAYMENT_GATEWAY', 'stripe')
+    app.config['STRIPE_SECRET_KEY'] = os.environ.get('STRIPE_SECRET_KEY')
+    app.config['STRIPE_POOL_SIZE'] = int(os.environ.get('STRIPE_POOL_SIZE', 10))
+    app.config['STRIPE_CONNECT_TIMEOUT'] = float(os.environ.get('STRIPE_CONNECT_TIMEOUT', 3))
+    app.config['STRIPE_CREATE_TIMEOUT'] = float(os.environ.get('STRIPE_CREATE_TIMEOUT', 10))
+    app.config['STRIPE_RETRIEVE_TIMEOUT'] = float(os.environ.get('STRIPE_RETRIEVE_TIMEOUT', 5))
+    app.config['STRIPE_MAX_RETRIES'] = int(os.environ.get('STRIPE_MAX_RETRIES', 2))
+    app.config['STRIPE_RETRY_BACKOFF'] = float(os.environ.get('STRIPE_RETRY_BACKOFF', 0.2))
+    app.config['PAYMENT_BREAKER_THRESHOLD'] = int(os.environ.get('PAYMENT_BREAKER_THRESHOLD', 5))
+    app.config['PAYMENT_BREAKER_RESET'] = float(os.environ.get('PAYMENT_BREAKER_RESET', 30))
+    app.config['PAYMENT_FAKE_LATENCY_MS'] = float(os.environ.get('PAYMENT_FAKE_LATENCY_MS', 0))
+    app.config['PAYMENT_FAKE_FAILURE_RATE'] = float(os.environ.get('PAYMENT_FAKE_FAILURE_RATE', 0))
+
+    # PDF de facturas: pool de procesos (0 = en línea) y caché en disco (por defecto instance/invoice_pdfs)
+    app.config['INVOICE_PDF_WORKERS'] = int(os.environ.get('INVOICE_PDF_WORKERS', 2))
+    app.config['INVOICE_PDF_TIMEOUT'] = float(os.environ.get('INVOICE_PDF_TIMEOUT', 30))
+    app.config['INVOICE_PDF_DIR'] = os.environ.get('INVOICE_PDF_DIR')
+    app.config['INVOICE_EXPORT_CHUNK'] = int(os.environ.get('INVOICE_EXPORT_CHUNK', 32))
+    app.config['INVOICE_BULK_BATCH_SIZE'] = int(os.environ.get('INVOICE_BULK_BATCH_SIZE', 500))
+    app.config['INVOICE_SETTINGS_CACHE_TTL'] = int(os.environ.get('INVOICE_SETTINGS_CACHE_TTL', 300))
+    # Cada cuánto (s) se comprueba updated_at: retraso máximo de un cambio hecho en otro worker
+    app.config['INVOICE_SETTINGS_VERSION_CHECK'] = float(os.environ.get('INVOICE_SETTINGS_VERSION_CHECK', 5))
+
+    # Conciliación de órdenes pendientes (scripts/reconcile_payments.py)
+    app.config['RECONCILE_BATCH_SIZE'] = int(os.environ.get('RECONCILE_BATCH_SIZE', 100))
+    app.config['RECONCILE_MIN_AGE_MINUTES'] = int(os.environ.get('RECONCILE_MIN_AGE_MINUTES', 30))
+
     # Inicializar extensiones con la app
     db.init_app(app)
     jwt.init_app(app)
     migrate.init_app(app, db)
 
+    from app.services import catalog_cache, compression, json_provider, query_counter
+    catalog_cache.init_app(app)
+    json_provider.init_app(app)
+    compression.init_app(app)
+    query_counter.init_app(app)
+
     # ---------- CORS PROFESIONAL (Netlify + localhost) ----------
     # Puedes configurar ALLOWED_ORIGINS en Render (separadas por coma).
     raw_origins = os.environ.get(
@@ -80,7 +169,8 @@ def create_app():
         resources={r"/api/*": {
             "origins": allowed_origins,
             "methods": ["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"],
+            "allow_headers": ["Content-Type", "Authorization", "Idempotency-Key"],
+            "expose_headers": ["Idempotent-Replayed"],
         }}
     )
     # ------------------------------------------------------------
@@ -115,15 +205,19 @@ def create_app():
         db.create_all()
         app.logger.info("[app.db] Tablas OK (create_all ejecutado)")
 
+        # Índice full-text del catálogo (FTS5 en SQLite, tsvector+GIN en Postgres)
+        from app.services.search import ensure_search_index
+        ensure_search_index()
+
     @app.route('/api/health')
     def health_check():
         return {'status': 'healthy', 'message': 'BlitzShop API is running!'}
 
     @app.route('/static/uploads/<filename>')
     def uploaded_file(filename):
-        """Servir archivos subidos"""
-        uploads_dir = os.path.join(os.getcwd(), 'static', 'uploads')
-        return send_from_directory(uploads_dir, filename)
+        """Servir archivos subidos (caché inmutable / offload al proxy)"""
+        from app.services.uploads import send_upload
+        return send_upload(filename)
 
     app.logger.info("[app.ready] BlitzShop API lista")
     return app
@@ -0,0 +1,28 @@
+from datetime import datetime, timezone
+from app import db
+
+
+class IdempotencyKey(db.Model):
+    """Respuesta guardada por cabecera Idempotency-Key (ver app/services/idempotency.py)"""
+    __tablename__ = 'idempotency_keys'
+
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(200), nullable=False)  # endpoint:user_id
+    key = db.Column(db.String(255), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)
+
+    status = db.Column(db.String(20), nullable=False, default='in_progress')  # in_progress | completed
+    response_status = db.Column(db.Integer)
+    response_mimetype = db.Column(db.String(100))
+    response_body = db.Column(db.LargeBinary)
+
+    locked_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('scope', 'key', name='uq_idempotency_scope_key'),
+    )
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.scope} {self.key} {self.status}>'
@@ -1,7 +1,12 @@
 from app import db
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
-from sqlalchemy import func
+from time import monotonic
+from types import SimpleNamespace
+import threading
+from flask import current_app
+from sqlalchemy import func, update
+from sqlalchemy.dialects import postgresql, sqlite
 
 class Invoice(db.Model):
     __tablename__ = 'invoices'
@@ -61,6 +66,12 @@ class Invoice(db.Model):
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
     
+    # Índice para paginación keyset (created_at, id); una factura por pedido
+    __table_args__ = (
+        db.Index('ix_invoices_user_created_at_id', 'user_id', 'created_at', 'id'),
+        db.UniqueConstraint('order_id', name='uq_invoices_order_id'),
+    )
+    
     # Relationships
     order = db.relationship('Order', backref='invoices', lazy=True)
     user = db.relationship('User', backref='invoices', lazy=True)
@@ -68,24 +79,21 @@ class Invoice(db.Model):
     @staticmethod
     def generate_invoice_number(prefix='INV'):
         """
-        Generate sequential invoice number with format: INV-2025-00001
+        Next sequential invoice number with format: INV-2025-00001
+        (counter row per prefix/year, see InvoiceSequence)
+        """
+        return Invoice.allocate_invoice_numbers(prefix, 1)[0]
+    
+    @staticmethod
+    def allocate_invoice_numbers(prefix='INV', count=1):
+        """
+        Reserve ``count`` consecutive invoice numbers for the current year.
+        Must run in the same transaction that inserts the invoices: a rollback
+        gives the numbers back, so the series stays gap-free.
         """
         current_year = datetime.now(timezone.utc).year
-        
-        # Get the last invoice number for current year
-        last_invoice = db.session.query(Invoice).filter(
-            Invoice.invoice_number.like(f'{prefix}-{current_year}-%')
-        ).order_by(Invoice.id.desc()).first()
-        
-        if last_invoice:
-            # Extract the sequential number and increment
-            last_number = int(last_invoice.invoice_number.split('-')[-1])
-            new_number = last_number + 1
-        else:
-            # First invoice of the year
-            new_number = 1
-        
-        return f"{prefix}-{current_year}-{new_number:05d}"
+        last = InvoiceSequence.allocate(prefix, current_year, count)
+        return [f"{prefix}-{current_year}-{n:05d}" for n in range(last - count + 1, last + 1)]
     
     @staticmethod
     def calculate_totals(order, tax_rate=21, shipping_cost=0, discount_amount=0):
@@ -112,6 +120,88 @@ class Invoice(db.Model):
             'total_amount': total
         }
     
+    @staticmethod
+    def from_order(order, settings, data=None):
+        """
+        Build (unsaved) invoice for an order: totals from its items, billing data
+        from ``data`` (admin form) falling back to the user's profile, company
+        data from settings.
+        """
+        data = data or {}
+        user = order.user
+        tax_rate = data.get('tax_rate', float(settings.default_tax_rate))
+        shipping_cost = data.get('shipping_cost', 0)
+        discount_amount = data.get('discount_amount', 0)
+
+        totals = Invoice.calculate_totals(
+            order,
+            tax_rate=tax_rate,
+            shipping_cost=shipping_cost,
+            discount_amount=discount_amount
+        )
+
+        now = datetime.now(timezone.utc)
+        return Invoice(
+            invoice_number=Invoice.generate_invoice_number(settings.invoice_prefix),
+            order_id=order.id,
+            user_id=order.user_id,
+            issue_date=now,
+            due_date=now + timedelta(days=settings.payment_terms_days),
+            subtotal=totals['subtotal'],
+            tax_rate=Decimal(str(tax_rate)),
+            tax_amount=totals['tax_amount'],
+            shipping_cost=Decimal(str(shipping_cost)),
+            discount_amount=Decimal(str(discount_amount)),
+            total_amount=totals['total_amount'],
+            status='pending',
+            payment_method='stripe',
+            **Invoice.billing_fields(user, settings, data),
+            **Invoice.company_fields(settings),
+            notes=data.get('notes', ''),
+        )
+
+    @staticmethod
+    def billing_fields(user, settings, data=None):
+        """Billing info - prefer form data, fallback to user profile"""
+        data = data or {}
+
+        # Determine billing name - from form or user profile
+        billing_name = data.get('billing_name')
+        if not billing_name:
+            if user.company_name:
+                billing_name = user.company_name
+            elif user.first_name and user.last_name:
+                billing_name = f"{user.first_name} {user.last_name}"
+            else:
+                billing_name = user.username
+
+        return {
+            'billing_name': billing_name,
+            'billing_email': user.email,
+            'billing_phone': data.get('billing_phone', user.phone or ''),
+            'billing_address': data.get('billing_address', user.address or ''),
+            'billing_city': data.get('billing_city', user.city or ''),
+            'billing_state': data.get('billing_state', user.state or ''),
+            'billing_postal_code': data.get('billing_postal_code', user.postal_code or ''),
+            'billing_country': data.get('billing_country', user.country or settings.company_country or 'ES'),
+        }
+
+    @staticmethod
+    def company_fields(settings):
+        """Company info from settings (your company) + currency and terms"""
+        return {
+            'company_name': settings.company_name,
+            'company_tax_id': settings.company_tax_id,
+            'company_address': settings.company_address,
+            'company_city': settings.company_city,
+            'company_postal_code': settings.company_postal_code,
+            'company_country': settings.company_country,
+            'company_email': settings.company_email,
+            'company_phone': settings.company_phone,
+            'currency': settings.default_currency,
+            'terms_conditions': settings.terms_conditions,
+        }
+
     def to_dict(self):
         """Convert invoice to dictionary for JSON response"""
         return {
@@ -157,6 +247,11 @@ class Invoice(db.Model):
         }
 
 
+# Process-level cache for InvoiceSettings.cached(): {'settings': {expires_at, checked_at, snapshot}}
+_settings_cache = {}
+_settings_cache_lock = threading.Lock()
+
+
 class InvoiceSettings(db.Model):
     """Global invoice settings for the company"""
     __tablename__ = 'invoice_settings'
@@ -197,10 +292,51 @@ class InvoiceSettings(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    @staticmethod
+    def cached():
+        """
+        Read-only snapshot of the settings, cached per process.
+
+        Between checks the snapshot is served without touching the database.
+        At most every INVOICE_SETTINGS_VERSION_CHECK seconds one single-column
+        SELECT compares ``updated_at`` and reloads if it changed, so a PUT
+        handled by another worker is seen within that interval (this process
+        clears its own cache on PUT). INVOICE_SETTINGS_CACHE_TTL caps the age
+        of a snapshot whatever its version (0 disables the cache).
+        Use get_settings() to modify them.
+        """
+        ttl = current_app.config.get('INVOICE_SETTINGS_CACHE_TTL', 300)
+        check_every = current_app.config.get('INVOICE_SETTINGS_VERSION_CHECK', 5)
+        now = monotonic()
+        with _settings_cache_lock:
+            entry = _settings_cache.get('settings')
+        if entry and ttl > 0 and entry['expires_at'] > now:
+            if now - entry['checked_at'] < check_every:
+                return entry['snapshot']
+            if entry['snapshot'].updated_at == InvoiceSettings.current_version():
+                with _settings_cache_lock:
+                    entry['checked_at'] = now
+                return entry['snapshot']
+        settings = InvoiceSettings.get_settings()
+        snapshot = SimpleNamespace(**{c.key: getattr(settings, c.key) for c in InvoiceSettings.__table__.columns})
+        with _settings_cache_lock:
+            _settings_cache['settings'] = {'expires_at': now + ttl, 'checked_at': now, 'snapshot': snapshot}
+        return snapshot
+    
+    @staticmethod
+    def current_version():
+        """``updated_at`` of the settings row (None if not created yet)."""
+        return db.session.query(InvoiceSettings.updated_at).order_by(InvoiceSettings.id).limit(1).scalar()
+    
+    @staticmethod
+    def invalidate_cache():
+        with _settings_cache_lock:
+            _settings_cache.clear()
+    
     @staticmethod
     def get_settings():
         """Get or create default settings"""
-        settings = db.session.query(InvoiceSettings).first()
+        settings = db.session.query(InvoiceSettings).order_by(InvoiceSettings.id).first()
         if not settings:
             # Create default settings
             settings = InvoiceSettings(
@@ -242,4 +378,76 @@ class InvoiceSettings(db.Model):
             'bank_iban': self.bank_iban,
             'bank_swift': self.bank_swift,
             'logo_url': self.logo_url
-        }
\ No newline at end of file
+        }
+
+
+class InvoiceSequence(db.Model):
+    """
+    Last invoice number issued per (prefix, year).
+
+    ``allocate`` increments the row with a single UPDATE ... RETURNING: the row
+    lock is held until the transaction ends, so concurrent invoice creation is
+    serialized on this one row (no table scan, no unique-constraint collisions)
+    and a rollback also undoes the increment. A database SEQUENCE would be
+    lock-free but leaves gaps on rollback, which invoice numbering can't have.
+    """
+    __tablename__ = 'invoice_sequences'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    prefix = db.Column(db.String(10), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    last_number = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('prefix', 'year', name='uq_invoice_sequences_prefix_year'),
+    )
+    
+    @staticmethod
+    def _existing_max(prefix, year):
+        """
+        Highest number already issued (invoices created before the counter existed).
+        Numeric, not string, max: a longer suffix is a bigger number (INV-2025-100000
+        sorts after INV-2025-99999). startswith() escapes ``%``/``_`` in the prefix.
+        """
+        series = f'{prefix}-{year}-'
+        candidates = (
+            db.session.query(Invoice.invoice_number)
+            .filter(Invoice.invoice_number.startswith(series, autoescape=True))
+            .order_by(func.length(Invoice.invoice_number).desc(), Invoice.invoice_number.desc())
+        )
+        for (number,) in candidates.yield_per(100):
+            suffix = number[len(series):]
+            if suffix.isdigit():
+                return int(suffix)
+        return 0
+    
+    @staticmethod
+    def allocate(prefix, year, count=1):
+        """Reserve ``count`` numbers; returns the last one of the block. No commit."""
+        if count < 1:
+            raise ValueError("count must be >= 1")
+        now = datetime.utcnow()
+        last = db.session.execute(
+            update(InvoiceSequence)
+            .where(InvoiceSequence.prefix == prefix, InvoiceSequence.year == year)
+            .values(last_number=InvoiceSequence.last_number + count, updated_at=now)
+            .returning(InvoiceSequence.last_number)
+        ).scalar()
+        if last is not None:
+            return last
+        
+        # First number of this prefix/year: create the row, continuing any existing series.
+        # If another transaction creates it first, ON CONFLICT turns this into the increment.
+        dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+        stmt = dialect.insert(InvoiceSequence).values(
+            prefix=prefix,
+            year=year,
+            last_number=InvoiceSequence._existing_max(prefix, year) + count,
+            updated_at=now,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['prefix', 'year'],
+            set_={'last_number': InvoiceSequence.last_number + count, 'updated_at': now},
+        ).returning(InvoiceSequence.last_number)
+        return db.session.execute(stmt).scalar()
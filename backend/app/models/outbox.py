@@ -0,0 +1,49 @@
+from datetime import datetime, timezone
+from app import db
+
+
+class OutboxEvent(db.Model):
+    """Efecto secundario pendiente, escrito en la misma transacción que el cambio que lo origina"""
+    __tablename__ = 'outbox_events'
+
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)   # order.created, order.paid, ...
+    handler = db.Column(db.String(50), nullable=False)      # invoice.create, email.order_paid, ...
+    aggregate_type = db.Column(db.String(30))
+    aggregate_id = db.Column(db.Integer)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, processing, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    available_at = db.Column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+    locked_at = db.Column(db.DateTime)
+    lock_token = db.Column(db.String(32))
+    last_error = db.Column(db.Text)
+
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    processed_at = db.Column(db.DateTime)
+
+    # El worker busca "pending con available_at <= now" en orden de id
+    __table_args__ = (
+        db.Index('ix_outbox_status_available', 'status', 'available_at', 'id'),
+        db.Index('ix_outbox_lock_token', 'lock_token'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'event_type': self.event_type,
+            'handler': self.handler,
+            'aggregate_type': self.aggregate_type,
+            'aggregate_id': self.aggregate_id,
+            'payload': self.payload,
+            'status': self.status,
+            'attempts': self.attempts,
+            'available_at': self.available_at.isoformat() if self.available_at else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'processed_at': self.processed_at.isoformat() if self.processed_at else None,
+        }
+
+    def __repr__(self):
+        return f'<OutboxEvent {self.id} {self.event_type}->{self.handler} {self.status}>'
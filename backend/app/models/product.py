@@ -11,12 +11,21 @@ class Product(db.Model):
     stock = db.Column(db.Integer, nullable=False, default=0)
     category = db.Column(db.String(100))
     image_url = db.Column(db.String(500))
+    # {"thumb"|"medium"|"large": {"webp": url, "jpg": url, "width": w, "height": h}} (app/services/images.py)
+    image_variants = db.Column(db.JSON)
     is_active = db.Column(db.Boolean, default=True)
     discount_percentage = db.Column(db.Integer, default=0)  # NUEVO CAMPO
     shopify_product_id = db.Column(db.String(100), unique=True)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))  # ARREGLADO
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))  # ARREGLADO
     
+    # Índice para listado público y paginación keyset (created_at, id)
+    # + MAX(updated_at) para los ETags del catálogo
+    __table_args__ = (
+        db.Index('ix_products_active_created_at_id', 'is_active', 'created_at', 'id'),
+        db.Index('ix_products_updated_at', 'updated_at'),
+    )
+    
     # Relationships
     order_items = db.relationship('OrderItem', backref='product', lazy=True)
     cart_items = db.relationship('CartItem', backref='product', lazy=True)
@@ -57,6 +66,7 @@ class Product(db.Model):
             'stock_quantity': self.stock,
             'category': self.category,
             'image_url': self.image_url,
+            'image_variants': self.image_variants,
             'is_active': self.is_active,
             'shopify_product_id': self.shopify_product_id,
             'created_at': self.created_at.isoformat() if self.created_at else None
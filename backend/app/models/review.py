@@ -19,6 +19,11 @@ class Review(db.Model):
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
     
+    # COUNT + MAX(updated_at) por producto (ETag del listado de reviews)
+    __table_args__ = (
+        db.Index('ix_reviews_product_updated_at', 'product_id', 'updated_at'),
+    )
+    
     # Relationships
     product = db.relationship('Product', backref=db.backref('reviews', lazy='dynamic', cascade='all, delete-orphan'))
     user = db.relationship('User', backref=db.backref('reviews', lazy='dynamic'))
@@ -0,0 +1,41 @@
+from datetime import datetime, timezone
+from app import db
+
+
+class StripeEvent(db.Model):
+    """Evento de webhook de Stripe verificado, tal cual llegó (log durable + deduplicación)"""
+    __tablename__ = 'stripe_events'
+
+    id = db.Column(db.Integer, primary_key=True)
+    stripe_event_id = db.Column(db.String(100), unique=True, nullable=False)  # evt_...
+    event_type = db.Column(db.String(100), nullable=False)
+    payment_intent_id = db.Column(db.String(200))
+    stripe_created = db.Column(db.Integer)  # epoch de Stripe: orden de aplicación por intent
+    livemode = db.Column(db.Boolean, default=False)
+    payload = db.Column(db.JSON, nullable=False)
+
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, processed, ignored
+    order_id = db.Column(db.Integer)
+
+    received_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    processed_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_stripe_events_intent_status', 'payment_intent_id', 'status', 'stripe_created', 'id'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'stripe_event_id': self.stripe_event_id,
+            'event_type': self.event_type,
+            'payment_intent_id': self.payment_intent_id,
+            'stripe_created': self.stripe_created,
+            'status': self.status,
+            'order_id': self.order_id,
+            'received_at': self.received_at.isoformat() if self.received_at else None,
+            'processed_at': self.processed_at.isoformat() if self.processed_at else None,
+        }
+
+    def __repr__(self):
+        return f'<StripeEvent {self.stripe_event_id} {self.event_type} {self.status}>'
@@ -1,25 +1,29 @@
 # app/routes/admin.py — BlitzShop (con soporte para descuentos)
 import os
 import uuid
+import json
 import logging
 from time import perf_counter
 from decimal import Decimal, InvalidOperation
 from datetime import datetime, timezone
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import case, func, update
 from werkzeug.utils import secure_filename
 
 from app import db
 from app.models.user import User
 from app.models.product import Product
-from app.models.order import Order, OrderItem
+from app.models.order import Order
+from app.services import catalog_cache, catalog_import, images, loading, outbox, pagination, search
+from app.services.query_counter import max_queries
 
 admin_bp = Blueprint("admin", __name__, url_prefix="/api/admin")
 logger = logging.getLogger(__name__)
 
 # --- Uploads ---
-UPLOAD_FOLDER = "static/uploads"
+# Carpeta/URL en app.services.images (las variantes se generan en segundo plano)
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp"}
 
 def allowed_file(filename: str) -> bool:
@@ -86,6 +90,7 @@ def get_all_products():
             "discount_percentage": p.discount_percentage,
             "category": p.category,
             "image_url": p.image_url,
+            "image_variants": p.image_variants,
             "stock_quantity": p.stock,
             "is_active": p.is_active,
             "created_at": p.created_at.isoformat() if p.created_at else None,
@@ -161,15 +166,16 @@ def create_product():
             return error_response(400, "Product with this name already exists")
 
         image_url = None
+        filepath = None
         if image_file and image_file.filename:
             if not allowed_file(image_file.filename):
                 return error_response(400, "Invalid image format. Use PNG, JPG, JPEG, GIF or WEBP")
-            os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+            os.makedirs(images.upload_folder(), exist_ok=True)
             filename = secure_filename(image_file.filename)
             unique = f"{uuid.uuid4()}_{filename}"
-            filepath = os.path.join(UPLOAD_FOLDER, unique)
+            filepath = os.path.join(images.upload_folder(), unique)
             image_file.save(filepath)
-            image_url = f"http://localhost:5000/static/uploads/{unique}"
+            image_url = images.public_url(unique)
 
         product = Product(
             name=name,
@@ -182,7 +188,13 @@ def create_product():
             discount_percentage=discount_percentage,
         )
         db.session.add(product)
+        db.session.flush()
+        search.sync_products([product.id])
         db.session.commit()
+        catalog_cache.bump_catalog_version("admin.products.create")
+        if filepath:
+            # Variantes thumb/medium/large en el pool (fuera de la petición)
+            images.schedule_product_image(product.id, filepath, image_url)
 
         resp = {
             "message": "Product created successfully",
@@ -194,6 +206,7 @@ def create_product():
                 "discount_percentage": product.discount_percentage,
                 "category": product.category,
                 "image_url": product.image_url,
+                "image_variants": product.image_variants,
                 "stock_quantity": product.stock,
                 "is_active": product.is_active,
             },
@@ -290,25 +303,27 @@ def update_product(product_id):
         if is_active is not None:
             product.is_active = bool(is_active)
 
+        filepath = None
         if image_file and image_file.filename:
             if not allowed_file(image_file.filename):
                 return error_response(400, "Invalid image format")
-            if product.image_url and "localhost:5000" in product.image_url:
-                old_filename = product.image_url.split("/")[-1]
-                old_path = os.path.join(UPLOAD_FOLDER, old_filename)
-                if os.path.exists(old_path):
-                    try:
-                        os.remove(old_path)
-                    except Exception:
-                        pass
-            os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+            # Las variantes van por hash de contenido y pueden compartirse: solo se borra un original sin procesar
+            if product.image_url and not product.image_variants:
+                images.remove_original(product.image_url, exclude_product_id=product.id)
+            os.makedirs(images.upload_folder(), exist_ok=True)
             filename = secure_filename(image_file.filename)
             unique = f"{uuid.uuid4()}_{filename}"
-            filepath = os.path.join(UPLOAD_FOLDER, unique)
+            filepath = os.path.join(images.upload_folder(), unique)
             image_file.save(filepath)
-            product.image_url = f"http://localhost:5000/static/uploads/{unique}"
+            product.image_url = images.public_url(unique)
+            product.image_variants = None
 
+        db.session.flush()
+        search.sync_products([product.id])
         db.session.commit()
+        catalog_cache.bump_catalog_version("admin.products.update")
+        if filepath:
+            images.schedule_product_image(product.id, filepath, product.image_url)
 
         resp = {
             "message": "Product updated successfully",
@@ -320,6 +335,7 @@ def update_product(product_id):
                 "discount_percentage": product.discount_percentage,
                 "category": product.category,
                 "image_url": product.image_url,
+                "image_variants": product.image_variants,
                 "stock_quantity": product.stock,
                 "is_active": product.is_active,
             },
@@ -353,17 +369,13 @@ def delete_product(product_id):
             logger.info("[admin.products.delete.ok] id=%s status=404 ms=%.2f", product_id, dt)
             return error_response(404, "Product not found")
 
-        if product.image_url and "localhost:5000" in product.image_url:
-            old_filename = product.image_url.split("/")[-1]
-            old_path = os.path.join(UPLOAD_FOLDER, old_filename)
-            if os.path.exists(old_path):
-                try:
-                    os.remove(old_path)
-                except Exception:
-                    pass
+        if product.image_url and not product.image_variants:
+            images.remove_original(product.image_url, exclude_product_id=product.id)
 
         db.session.delete(product)
+        search.remove_products([product_id])
         db.session.commit()
+        catalog_cache.bump_catalog_version("admin.products.delete")
 
         dt = (perf_counter() - t0) * 1000
         logger.info("[admin.products.delete.ok] id=%s status=200 ms=%.2f", product_id, dt)
@@ -375,6 +387,194 @@ def delete_product(product_id):
         logger.exception("[admin.products.delete.error] id=%s ms=%.2f err=%s", product_id, dt, str(e))
         return error_response(500, "Error deleting product", str(e))
 
+@admin_bp.route("/products/import", methods=["POST"])
+@admin_required
+def import_products():
+    """
+    Importación masiva (CSV o JSON lines) con upsert por lotes.
+
+    Cuerpo: fichero multipart ``file`` o el CSV/NDJSON directamente en el body.
+    Query: ``key`` (shopify_product_id | name), ``batch_size``, ``format`` (csv | ndjson),
+    ``stream=true`` para recibir el progreso lote a lote como NDJSON.
+    """
+    t0 = perf_counter()
+    logger.info("[admin.products.import.start]")
+    key = request.args.get("key", "shopify_product_id")
+    try:
+        result = catalog_import.start_import(
+            key, request.args.get("batch_size", current_app.config.get("IMPORT_BATCH_SIZE"), type=int)
+        )
+    except ValueError as e:
+        return error_response(400, str(e))
+
+    upload = request.files.get("file")
+    if upload is not None:
+        stream, filename, content_type = upload.stream, upload.filename, upload.mimetype
+    else:
+        stream, filename, content_type = request.stream, None, request.mimetype
+    fmt = request.args.get("format") or catalog_import.detect_format(filename, content_type)
+    if fmt not in catalog_import.FORMATS:
+        return error_response(400, f"format must be one of {catalog_import.FORMATS}")
+
+    rows = catalog_import.iter_rows(stream, fmt)
+
+    if request.args.get("stream", "").lower() == "true":
+        def generate():
+            try:
+                for progress in catalog_import.import_batches(rows, result):
+                    yield json.dumps({"event": "progress", **progress.to_dict(include_errors=False)}) + "\n"
+                yield json.dumps({"event": "done", **result.to_dict()}) + "\n"
+            except Exception as e:
+                db.session.rollback()
+                logger.exception("[admin.products.import.error] err=%s", str(e))
+                yield json.dumps({"event": "error", "error": str(e), **result.to_dict()}) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+    try:
+        for _ in catalog_import.import_batches(rows, result):
+            pass
+    except Exception as e:
+        db.session.rollback()
+        dt = (perf_counter() - t0) * 1000
+        logger.exception("[admin.products.import.error] ms=%.2f err=%s", dt, str(e))
+        return jsonify({"error": "Import failed", "message": str(e), **result.to_dict()}), 500
+
+    dt = (perf_counter() - t0) * 1000
+    logger.info("[admin.products.import.ok] status=200 ms=%.2f processed=%s failed=%s",
+                dt, result.processed, result.failed)
+    return jsonify(result.to_dict()), 200
+
+
+BULK_MAX_IDS = 10000
+
+
+def _finite_decimal(value, field):
+    """Decimal finito: ``float()`` acepta "nan"/"inf" y NUMERIC de PostgreSQL guarda NaN."""
+    try:
+        number = Decimal(str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        raise ValueError(f"{field} must be a number")
+    if not number.is_finite():
+        raise ValueError(f"{field} must be a finite number")
+    return number
+
+
+def build_bulk_patch(patch: dict) -> dict:
+    """Valida el patch del endpoint bulk y lo traduce a valores/expresiones SQL para un único UPDATE."""
+    values = {}
+    if "price" in patch and "price_percent" in patch:
+        raise ValueError("Use either price or price_percent, not both")
+    if "stock" in patch and "stock_delta" in patch:
+        raise ValueError("Use either stock or stock_delta, not both")
+
+    if "price" in patch:
+        price = _finite_decimal(patch["price"], "price")
+        if price < 0:
+            raise ValueError("Price cannot be negative")
+        values["price"] = price
+    if "price_percent" in patch:
+        # p.ej. -10 = rebaja del 10 % sobre el precio actual de cada producto
+        pct = _finite_decimal(patch["price_percent"], "price_percent")
+        if pct <= -100:
+            raise ValueError("price_percent must be greater than -100")
+        values["price"] = func.round(Product.price * (1 + float(pct) / 100.0), 2)
+    if "stock" in patch:
+        stock = int(patch["stock"])
+        if stock < 0:
+            raise ValueError("Stock cannot be negative")
+        values["stock"] = stock
+    if "stock_delta" in patch:
+        delta = int(patch["stock_delta"])
+        new_stock = Product.stock + delta
+        values["stock"] = case((new_stock < 0, 0), else_=new_stock)
+    if "discount_percentage" in patch:
+        discount = int(patch["discount_percentage"])
+        if discount < 0 or discount > 99:
+            raise ValueError("Discount must be between 0 and 99")
+        values["discount_percentage"] = discount
+    if "is_active" in patch:
+        if not isinstance(patch["is_active"], bool):
+            raise ValueError("is_active must be a boolean")
+        values["is_active"] = patch["is_active"]
+
+    if not values:
+        raise ValueError("patch must include price, price_percent, stock, stock_delta, discount_percentage or is_active")
+    return values
+
+
+@admin_bp.route("/products/bulk", methods=["PATCH"])
+@admin_required
+def bulk_update_products():
+    """
+    Cambio masivo en una sola sentencia UPDATE.
+
+    Body: {"ids": [...]} o {"filter": {"category": "...", "is_active": true}}
+          + {"patch": {"price" | "price_percent", "stock" | "stock_delta", "discount_percentage", "is_active"}}
+    """
+    t0 = perf_counter()
+    logger.info("[admin.products.bulk.start]")
+    try:
+        data = request.get_json() or {}
+        ids = data.get("ids")
+        filters = data.get("filter") or {}
+        if not isinstance(data.get("patch"), dict):
+            return error_response(400, "patch object is required")
+        if not isinstance(filters, dict):
+            return error_response(400, "filter must be an object")
+
+        try:
+            values = build_bulk_patch(data["patch"])
+        except (ValueError, TypeError) as e:
+            return error_response(400, "Invalid patch", str(e))
+
+        criteria = []
+        if ids is not None:
+            if not isinstance(ids, list) or not ids:
+                return error_response(400, "ids must be a non-empty list")
+            if len(ids) > BULK_MAX_IDS:
+                return error_response(400, f"At most {BULK_MAX_IDS} ids per request")
+            try:
+                criteria.append(Product.id.in_({int(i) for i in ids}))
+            except (ValueError, TypeError):
+                return error_response(400, "ids must be integers")
+        if filters.get("category"):
+            criteria.append(Product.category == filters["category"])
+        if "is_active" in filters:
+            # bool("false") es True: se invertiría el conjunto de productos afectados
+            if not isinstance(filters["is_active"], bool):
+                return error_response(400, "filter.is_active must be a boolean")
+            criteria.append(Product.is_active.is_(filters["is_active"]))
+        if not criteria:
+            # Nunca un UPDATE de todo el catálogo por accidente
+            return error_response(400, "ids or filter (category / is_active) is required")
+
+        values["updated_at"] = datetime.now(timezone.utc)
+        result = db.session.execute(
+            update(Product).where(*criteria).values(**values).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        affected = result.rowcount
+        # name/description no cambian: el índice full-text no se toca
+        if affected:
+            catalog_cache.bump_catalog_version("admin.products.bulk")
+
+        dt = (perf_counter() - t0) * 1000
+        logger.info("[admin.products.bulk.ok] status=200 ms=%.2f affected=%s fields=%s",
+                    dt, affected, ",".join(sorted(data["patch"])))
+        return jsonify({
+            "message": "Products updated successfully",
+            "affected": affected,
+            "fields": sorted(data["patch"]),
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        dt = (perf_counter() - t0) * 1000
+        logger.exception("[admin.products.bulk.error] ms=%.2f err=%s", dt, str(e))
+        return error_response(500, "Error updating products", str(e))
+
+
 @admin_bp.route("/products/<int:product_id>/toggle-status", methods=["PATCH"])
 @admin_required
 def toggle_product_status(product_id):
@@ -390,6 +590,7 @@ def toggle_product_status(product_id):
 
         product.is_active = not product.is_active
         db.session.commit()
+        catalog_cache.bump_catalog_version("admin.products.toggle_status")
 
         resp = {"message": f"Product {'activated' if product.is_active else 'deactivated'} successfully",
                 "is_active": product.is_active}
@@ -422,12 +623,19 @@ def get_categories():
         logger.exception("[admin.categories.error] ms=%.2f err=%s", dt, str(e))
         return error_response(500, "Error fetching categories", str(e))
 
+@admin_bp.route("/cache/stats", methods=["GET"])
+@admin_required
+def get_cache_stats():
+    """Contadores hit/miss de la caché del catálogo (por proceso worker)"""
+    return jsonify({"catalog": catalog_cache.stats()}), 200
+
 # =========================
 # Órdenes (ADMIN)
 # =========================
 
 @admin_bp.route("/orders", methods=["GET"])
 @admin_required
+@max_queries(5)
 def get_all_orders():
     """Listado admin de órdenes"""
     t0 = perf_counter()
@@ -437,33 +645,50 @@ def get_all_orders():
         page = request.args.get("page", 1, type=int)
         per_page = request.args.get("per_page", 20, type=int)
 
-        query = Order.query
+        query = Order.query.options(*loading.profile("order.items"))
         if status and status != "all":
             query = query.filter(Order.status == status)
 
+        def serialize_orders(orders):
+            orders_list = []
+            for order in orders:
+                order_items = order.items
+                orders_list.append({
+                    "id": order.id,
+                    "user_id": order.user_id,
+                    "total_amount": to_float(order.total_amount),
+                    "status": order.status,
+                    "created_at": order.created_at.isoformat() if order.created_at else None,
+                    "updated_at": order.updated_at.isoformat() if order.updated_at else None,
+                    "shipping_address": order.shipping_address,
+                    "billing_address": order.billing_address,
+                    "items": [{
+                        "id": item.id,
+                        "product_name": item.product_name,
+                        "quantity": item.quantity,
+                        "unit_price": to_float(item.unit_price),
+                        "total_price": to_float(getattr(item, "total_price", item.unit_price * item.quantity)),
+                    } for item in order_items],
+                })
+            return orders_list
+
+        # Modo cursor (opt-in): keyset sobre (created_at, id), sin COUNT por defecto
+        if pagination.cursor_requested():
+            try:
+                kp = pagination.keyset_page(query, Order, per_page)
+            except pagination.InvalidCursor:
+                return error_response(400, "Invalid cursor")
+            resp = {"orders": serialize_orders(kp.items), "next_cursor": kp.next_cursor, "has_next": kp.has_next}
+            if kp.total is not None:
+                resp["total"] = kp.total
+            dt = (perf_counter() - t0) * 1000
+            logger.info("[admin.orders.list.ok] status=200 ms=%.2f mode=cursor per_page=%s count=%s",
+                        dt, per_page, len(kp.items))
+            return jsonify(resp), 200
+
         query = query.order_by(Order.created_at.desc())
         paginated = query.paginate(page=page, per_page=per_page, error_out=False)
-
-        orders_list = []
-        for order in paginated.items:
-            order_items = OrderItem.query.filter_by(order_id=order.id).all()
-            orders_list.append({
-                "id": order.id,
-                "user_id": order.user_id,
-                "total_amount": to_float(order.total_amount),
-                "status": order.status,
-                "created_at": order.created_at.isoformat() if order.created_at else None,
-                "updated_at": order.updated_at.isoformat() if order.updated_at else None,
-                "shipping_address": order.shipping_address,
-                "billing_address": order.billing_address,
-                "items": [{
-                    "id": item.id,
-                    "product_name": item.product_name,
-                    "quantity": item.quantity,
-                    "unit_price": to_float(item.unit_price),
-                    "total_price": to_float(getattr(item, "total_price", item.unit_price * item.quantity)),
-                } for item in order_items],
-            })
+        orders_list = serialize_orders(paginated.items)
 
         resp = {
             "orders": orders_list,
@@ -501,8 +726,10 @@ def update_order_status(order_id):
         if new_status not in valid:
             return error_response(400, "Invalid status")
 
+        old_status = order.status
         order.status = new_status
         order.updated_at = datetime.now(timezone.utc)
+        outbox.enqueue_order_status(order, old_status)
         db.session.commit()
 
         resp = {"message": "Order status updated", "order_id": order_id, "new_status": new_status}
@@ -5,6 +5,7 @@ from decimal import Decimal, InvalidOperation
 
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import insert
 
 from app import db
 from app.models.cart import CartItem
@@ -36,27 +37,37 @@ def error_response(status: int, error: str, message: str | None = None):
 
 
 def _serialize_cart(user_id: int):
-    """Nuevo formato interno: items + total."""
-    cart_items = CartItem.query.filter_by(user_id=user_id).all()
+    """Nuevo formato interno: items + total (una sola consulta con JOIN a products)."""
+    rows = (
+        db.session.query(
+            CartItem.id,
+            CartItem.quantity,
+            Product.id.label("product_id"),
+            Product.name,
+            Product.description,
+            Product.image_url,
+            Product.price,
+        )
+        .join(Product, Product.id == CartItem.product_id)
+        .filter(CartItem.user_id == user_id, Product.is_active.isnot(False))
+        .order_by(CartItem.id)
+        .all()
+    )
 
     items = []
     total = 0.0
 
-    for ci in cart_items:
-        product = Product.query.get(ci.product_id)
-        if not product or not getattr(product, "is_active", True):
-            continue
-
-        unit_price = to_float(getattr(product, "price", 0))
-        quantity = int(getattr(ci, "quantity", 0) or 0)
+    for row in rows:
+        unit_price = to_float(row.price)
+        quantity = int(row.quantity or 0)
         line_total = unit_price * quantity
 
         items.append({
-            "id": ci.id,  # CRÍTICO: ID del cart_item para Remove
-            "product_id": product.id,
-            "name": getattr(product, "name", None),
-            "description": getattr(product, "description", None),  # Añadido
-            "image_url": getattr(product, "image_url", None),  # Añadido
+            "id": row.id,  # CRÍTICO: ID del cart_item para Remove
+            "product_id": row.product_id,
+            "name": row.name,
+            "description": row.description,  # Añadido
+            "image_url": row.image_url,  # Añadido
             "unit_price": unit_price,
             "quantity": quantity,
             "line_total": round(line_total, 2),
@@ -89,6 +100,117 @@ def _legacy_cart(resp):
         "total_price": resp.get("total", 0.0)
     }
 
+
+BATCH_MAX_OPERATIONS = 100
+
+
+class CartOperationError(Exception):
+    def __init__(self, status, error, index, message=None):
+        super().__init__(error)
+        self.status = status
+        self.error = error
+        self.index = index
+        self.message = message
+
+
+def _positive_int(value, index, allow_zero=False):
+    try:
+        value = int(value)
+    except (ValueError, TypeError):
+        raise CartOperationError(400, "Valid quantity is required", index)
+    if value < 0 or (value == 0 and not allow_zero):
+        raise CartOperationError(400, "Quantity must be positive", index)
+    return value
+
+
+def _apply_cart_operations(user_id, operations):
+    """
+    Aplica add/update/remove en memoria sobre el carrito actual y escribe el
+    resultado de una vez. Consultas: carrito + productos implicados (IN).
+    Cualquier operación inválida aborta el lote completo (nada se escribe).
+    """
+    items = CartItem.query.filter_by(user_id=user_id).all()
+    by_id = {ci.id: ci for ci in items}
+    quantities = {ci.product_id: ci.quantity for ci in items}  # estado final deseado
+
+    product_ids = set(quantities)
+    for op in operations:
+        if isinstance(op, dict) and op.get("product_id") is not None:
+            try:
+                product_ids.add(int(op["product_id"]))
+            except (ValueError, TypeError):
+                pass
+    products = {p.id: p for p in Product.query.filter(Product.id.in_(product_ids)).all()} if product_ids else {}
+
+    def resolve_product_id(op, index):
+        if op.get("cart_item_id") is not None:
+            try:
+                ci = by_id.get(int(op["cart_item_id"]))
+            except (ValueError, TypeError):
+                ci = None
+            if not ci:
+                raise CartOperationError(404, "Cart item not found", index)
+            return ci.product_id
+        if op.get("product_id") is not None:
+            try:
+                return int(op["product_id"])
+            except (ValueError, TypeError):
+                raise CartOperationError(400, "Invalid product_id", index)
+        raise CartOperationError(400, "cart_item_id or product_id is required", index)
+
+    touched = set()
+    for index, op in enumerate(operations):
+        if not isinstance(op, dict):
+            raise CartOperationError(400, "Each operation must be an object", index)
+        kind = op.get("op")
+        if kind == "add":
+            product_id = resolve_product_id(op, index)
+            quantity = _positive_int(op.get("quantity", 1), index)
+            product = products.get(product_id)
+            if not product or not getattr(product, "is_active", True):
+                raise CartOperationError(404, "Product not found", index)
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+        elif kind == "update":
+            product_id = resolve_product_id(op, index)
+            if product_id not in quantities:
+                raise CartOperationError(404, "Cart item not found", index)
+            product = products.get(product_id)
+            if not product or not getattr(product, "is_active", True):
+                raise CartOperationError(404, "Product not found", index)
+            quantities[product_id] = _positive_int(op.get("quantity"), index, allow_zero=True)
+        elif kind == "remove":
+            product_id = resolve_product_id(op, index)
+            if product_id not in quantities:
+                raise CartOperationError(404, "Cart item not found", index)
+            quantities[product_id] = 0
+        else:
+            raise CartOperationError(400, "op must be add, update or remove", index)
+        touched.add((product_id, index))
+
+    # Stock contra la cantidad final (igual que los endpoints unitarios)
+    for product_id, index in sorted(touched, key=lambda t: t[1]):
+        qty = quantities.get(product_id, 0)
+        product = products.get(product_id)
+        if qty > 0 and (product is None or product.stock is None or product.stock < qty):
+            raise CartOperationError(400, "Insufficient stock", index,
+                                     f"product_id={product_id} requested={qty}")
+
+    existing = {ci.product_id: ci for ci in items}
+    new_rows = []
+    for product_id, qty in quantities.items():
+        ci = existing.get(product_id)
+        if qty <= 0:
+            if ci:
+                db.session.delete(ci)
+        elif ci is None:
+            new_rows.append({"user_id": user_id, "product_id": product_id, "quantity": qty})
+        elif ci.quantity != qty:
+            ci.quantity = qty
+    db.session.flush()
+    if new_rows:
+        # executemany sin RETURNING: el carrito se relee después con _serialize_cart
+        db.session.execute(insert(CartItem), new_rows)
+
 # -----------------------------
 # Endpoints (sin cambios)
 # -----------------------------
@@ -274,4 +396,52 @@ def clear_cart():
         db.session.rollback()
         dt = (perf_counter() - t0) * 1000
         logger.exception("[cart.clear.error] user_id=%s ms=%.2f err=%s", user_id, dt, str(e))
-        return error_response(500, "Internal error", str(e))
\ No newline at end of file
+        return error_response(500, "Internal error", str(e))
+
+
+@cart_bp.route("/batch", methods=["POST"])
+@jwt_required()
+def batch_cart():
+    """
+    Varias operaciones en una transacción; devuelve el carrito una sola vez.
+    Body: {"operations": [{"op": "add", "product_id": 1, "quantity": 2},
+                          {"op": "update", "cart_item_id": 7, "quantity": 3},
+                          {"op": "remove", "product_id": 4}]}
+    """
+    t0 = perf_counter()
+    user_id = get_jwt_identity()
+    logger.info("[cart.batch.start] user_id=%s", user_id)
+    try:
+        data = request.get_json() or {}
+        operations = data.get("operations")
+        if not isinstance(operations, list) or not operations:
+            return error_response(400, "operations must be a non-empty list")
+        if len(operations) > BATCH_MAX_OPERATIONS:
+            return error_response(400, f"At most {BATCH_MAX_OPERATIONS} operations per request")
+
+        try:
+            _apply_cart_operations(user_id, operations)
+        except CartOperationError as e:
+            db.session.rollback()
+            dt = (perf_counter() - t0) * 1000
+            logger.info("[cart.batch.ok] user_id=%s status=%s ms=%.2f failed_op=%s",
+                        user_id, e.status, dt, e.index)
+            payload = {"error": e.error, "operation": e.index}
+            if e.message:
+                payload["message"] = e.message
+            return jsonify(payload), e.status
+
+        db.session.commit()
+
+        resp = _serialize_cart(user_id)
+        legacy = _legacy_cart(resp)
+        dt = (perf_counter() - t0) * 1000
+        logger.info("[cart.batch.ok] user_id=%s status=200 ms=%.2f ops=%s items=%s",
+                    user_id, dt, len(operations), len(resp["items"]))
+        return jsonify(legacy), 200
+
+    except Exception as e:
+        db.session.rollback()
+        dt = (perf_counter() - t0) * 1000
+        logger.exception("[cart.batch.error] user_id=%s ms=%.2f err=%s", user_id, dt, str(e))
+        return error_response(500, "Internal error", str(e))
@@ -5,6 +5,7 @@ from app import db
 from app.models.coupon import Coupon, CouponUsage
 from app.models.user import User
 from app.routes.admin import admin_required
+from app.services.idempotency import idempotent
 from datetime import datetime, timezone
 from sqlalchemy import or_, and_
 from decimal import Decimal
@@ -90,6 +91,7 @@ def validate_coupon():
 
 @coupons_bp.route('/apply', methods=['POST'])
 @jwt_required()
+@idempotent
 def apply_coupon():
     """Apply a coupon to an order (called during checkout)"""
     try:
@@ -1,28 +1,17 @@
-from flask import Blueprint, request, jsonify, make_response
+from flask import Blueprint, Response, request, jsonify, make_response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy.exc import IntegrityError
 from app import db
 from app.models.invoice import Invoice, InvoiceSettings
 from app.models.order import Order
 from app.models.user import User
 from app.routes.admin import admin_required
-from datetime import datetime, timedelta, timezone
+from app.services import invoice_export, invoice_pdf, invoicing, pagination
+from app.services.query_counter import max_queries
+from datetime import datetime, timezone
 from decimal import Decimal
 import logging
 from time import perf_counter
-from io import BytesIO
-
-# PDF Support - todos los imports juntos arriba
-try:
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib import colors
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import mm
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-    from reportlab.lib.enums import TA_CENTER, TA_RIGHT
-    PDF_SUPPORT = True
-except ImportError:
-    PDF_SUPPORT = False
-    logging.warning("ReportLab not installed. PDF generation disabled.")
 
 logger = logging.getLogger(__name__)
 invoices_bp = Blueprint('invoices', __name__)
@@ -31,6 +20,7 @@ invoices_bp = Blueprint('invoices', __name__)
 
 @invoices_bp.route('/api/invoices', methods=['GET'])
 @jwt_required()
+@max_queries(3)
 def get_user_invoices():
     """Get all invoices for current user"""
     start_time = perf_counter()
@@ -42,18 +32,39 @@ def get_user_invoices():
         per_page = request.args.get('per_page', 10, type=int)
         
         # Query user's invoices
-        query = Invoice.query.filter_by(user_id=user_id).order_by(Invoice.created_at.desc())
-        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        query = Invoice.query.filter_by(user_id=user_id)
+        
+        # Cursor mode (opt-in): keyset on (created_at, id), no COUNT unless with_total=true
+        if pagination.cursor_requested():
+            try:
+                kp = pagination.keyset_page(query, Invoice, per_page)
+            except pagination.InvalidCursor:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            invoices = [invoice.to_dict() for invoice in kp.items]
+            resp = {
+                'invoices': invoices,
+                'per_page': per_page,
+                'next_cursor': kp.next_cursor,
+                'has_next': kp.has_next
+            }
+            if kp.total is not None:
+                resp['total'] = kp.total
+            elapsed = perf_counter() - start_time
+            logger.info(f"Retrieved {len(invoices)} invoices (cursor) for user {user_id} in {elapsed:.3f}s")
+            return jsonify(resp), 200
+        
+        query = query.order_by(Invoice.created_at.desc())
+        paginated = query.paginate(page=page, per_page=per_page, error_out=False)
         
-        invoices = [invoice.to_dict() for invoice in pagination.items]
+        invoices = [invoice.to_dict() for invoice in paginated.items]
         
         elapsed = perf_counter() - start_time
         logger.info(f"Retrieved {len(invoices)} invoices for user {user_id} in {elapsed:.3f}s")
         
         return jsonify({
             'invoices': invoices,
-            'total': pagination.total,
-            'pages': pagination.pages,
+            'total': paginated.total,
+            'pages': paginated.pages,
             'current_page': page
         }), 200
         
@@ -93,7 +104,7 @@ def get_invoice(invoice_id):
 @jwt_required()
 def download_invoice(invoice_id):
     """Download invoice as PDF"""
-    if not PDF_SUPPORT:
+    if not invoice_pdf.PDF_SUPPORT:
         return jsonify({'error': 'PDF generation not available'}), 503
     
     start_time = perf_counter()
@@ -109,13 +120,13 @@ def download_invoice(invoice_id):
         if invoice.user_id != user_id and not user.is_admin:
             return jsonify({'error': 'Unauthorized access'}), 403
         
-        # Generate PDF
-        pdf_buffer = generate_invoice_pdf(invoice)
+        # PDF cacheado en disco, o render en el pool de procesos
+        pdf_bytes, cached = invoice_pdf.get_pdf(invoice)
         
         elapsed = perf_counter() - start_time
-        logger.info(f"Generated PDF for invoice {invoice_id} in {elapsed:.3f}s")
+        logger.info(f"{'Served cached' if cached else 'Generated'} PDF for invoice {invoice_id} in {elapsed:.3f}s")
         
-        response = make_response(pdf_buffer.getvalue())
+        response = make_response(pdf_bytes)
         response.headers['Content-Type'] = 'application/pdf'
         response.headers['Content-Disposition'] = f'attachment; filename=invoice_{invoice.invoice_number}.pdf'
         return response
@@ -126,9 +137,31 @@ def download_invoice(invoice_id):
 
 # ==================== ADMIN ROUTES ====================
 
+def _filtered_invoices_query():
+    """Filtros del listado admin (status, user_id, from_date, to_date) sobre Invoice.query"""
+    status = request.args.get('status')
+    user_id = request.args.get('user_id', type=int)
+    from_date = request.args.get('from_date')
+    to_date = request.args.get('to_date')
+    
+    query = Invoice.query
+    
+    if status:
+        query = query.filter_by(status=status)
+    if user_id:
+        query = query.filter_by(user_id=user_id)
+    if from_date:
+        query = query.filter(Invoice.issue_date >= datetime.fromisoformat(from_date))
+    if to_date:
+        query = query.filter(Invoice.issue_date <= datetime.fromisoformat(to_date))
+    
+    return query
+
+
 @invoices_bp.route('/api/admin/invoices', methods=['GET'])
 @jwt_required()
 @admin_required
+@max_queries(4)
 def admin_get_all_invoices():
     """Admin: Get all invoices with filters"""
     start_time = perf_counter()
@@ -138,27 +171,12 @@ def admin_get_all_invoices():
         per_page = request.args.get('per_page', 20, type=int)
         
         # Filters
-        status = request.args.get('status')
-        user_id = request.args.get('user_id', type=int)
-        from_date = request.args.get('from_date')
-        to_date = request.args.get('to_date')
-        
-        # Build query
-        query = Invoice.query
-        
-        if status:
-            query = query.filter_by(status=status)
-        if user_id:
-            query = query.filter_by(user_id=user_id)
-        if from_date:
-            query = query.filter(Invoice.issue_date >= datetime.fromisoformat(from_date))
-        if to_date:
-            query = query.filter(Invoice.issue_date <= datetime.fromisoformat(to_date))
+        query = _filtered_invoices_query()
         
         query = query.order_by(Invoice.created_at.desc())
-        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        paginated = query.paginate(page=page, per_page=per_page, error_out=False)
         
-        invoices = [invoice.to_dict() for invoice in pagination.items]
+        invoices = [invoice.to_dict() for invoice in paginated.items]
         
         # Calculate totals
         total_amount = db.session.query(db.func.sum(Invoice.total_amount)).scalar() or 0
@@ -168,12 +186,12 @@ def admin_get_all_invoices():
         
         return jsonify({
             'invoices': invoices,
-            'total': pagination.total,
-            'pages': pagination.pages,
+            'total': paginated.total,
+            'pages': paginated.pages,
             'current_page': page,
             'stats': {
                 'total_invoiced': float(total_amount),
-                'total_invoices': pagination.total
+                'total_invoices': paginated.total
             }
         }), 200
         
@@ -182,6 +200,34 @@ def admin_get_all_invoices():
         return jsonify({'error': 'Failed to retrieve invoices'}), 500
 
 
+@invoices_bp.route('/api/admin/invoices/export', methods=['GET'])
+@jwt_required()
+@admin_required
+def admin_export_invoices():
+    """Admin: ZIP with the PDFs of the filtered invoices plus a CSV ledger (streamed)"""
+    if not invoice_pdf.PDF_SUPPORT:
+        return jsonify({'error': 'PDF generation not available'}), 503
+    
+    try:
+        query = _filtered_invoices_query()
+        count = query.order_by(None).count()
+    except ValueError:
+        return jsonify({'error': 'Invalid date filter (use ISO format, e.g. 2025-01-31)'}), 400
+    
+    if count == 0:
+        return jsonify({'error': 'No invoices match the filters'}), 404
+    
+    logger.info(f"Admin exporting {count} invoices as ZIP")
+    period = '_'.join(filter(None, [request.args.get('from_date'), request.args.get('to_date')])).replace(':', '') or 'all'
+    response = Response(
+        stream_with_context(invoice_export.stream_zip(query)),
+        mimetype='application/zip',
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename=invoices_{period}.zip'
+    response.headers['X-Invoice-Count'] = str(count)
+    return response
+
+
 @invoices_bp.route('/api/admin/invoices/create/<int:order_id>', methods=['POST'])
 @jwt_required()
 @admin_required
@@ -199,76 +245,14 @@ def admin_create_invoice(order_id):
         if existing_invoice:
             return jsonify({'error': 'Invoice already exists for this order'}), 400
         
-        # Get invoice settings
-        settings = InvoiceSettings.get_settings()
+        # Get invoice settings (process cache, read-only)
+        settings = InvoiceSettings.cached()
         
         # Get request data
         data = request.get_json() or {}
         
-        # Get user with professional fields
-        user = order.user
-        
-        # Calculate totals
-        totals = Invoice.calculate_totals(
-            order,
-            tax_rate=data.get('tax_rate', float(settings.default_tax_rate)),
-            shipping_cost=data.get('shipping_cost', 0),
-            discount_amount=data.get('discount_amount', 0)
-        )
-        
-        # Determine billing name - from form or user profile
-        billing_name = data.get('billing_name')
-        if not billing_name:
-            if user.company_name:
-                billing_name = user.company_name
-            elif user.first_name and user.last_name:
-                billing_name = f"{user.first_name} {user.last_name}"
-            else:
-                billing_name = user.username
-        
-        # Create invoice with user profile data or form data
-        invoice = Invoice(
-            invoice_number=Invoice.generate_invoice_number(settings.invoice_prefix),
-            order_id=order_id,
-            user_id=order.user_id,
-            issue_date=datetime.now(timezone.utc),
-            due_date=datetime.now(timezone.utc) + timedelta(days=settings.payment_terms_days),
-            subtotal=totals['subtotal'],
-            tax_rate=Decimal(str(data.get('tax_rate', float(settings.default_tax_rate)))),
-            tax_amount=totals['tax_amount'],
-            shipping_cost=Decimal(str(data.get('shipping_cost', 0))),
-            discount_amount=Decimal(str(data.get('discount_amount', 0))),
-            total_amount=totals['total_amount'],
-            status='pending',
-            payment_method='stripe',
-            
-            # Billing info - prefer form data, fallback to user profile
-            billing_name=billing_name,
-            billing_email=user.email,
-            billing_phone=data.get('billing_phone', user.phone or ''),
-            billing_address=data.get('billing_address', user.address or ''),
-            billing_city=data.get('billing_city', user.city or ''),
-            billing_state=data.get('billing_state', user.state or ''),
-            billing_postal_code=data.get('billing_postal_code', user.postal_code or ''),
-            billing_country=data.get('billing_country', user.country or settings.company_country or 'ES'),
-            # Note: if you have billing_tax_id field in Invoice model, uncomment:
-            # billing_tax_id=data.get('billing_tax_id', user.tax_id or ''),
-            
-            # Company info from settings (your company)
-            company_name=settings.company_name,
-            company_tax_id=settings.company_tax_id,
-            company_address=settings.company_address,
-            company_city=settings.company_city,
-            company_postal_code=settings.company_postal_code,
-            company_country=settings.company_country,
-            company_email=settings.company_email,
-            company_phone=settings.company_phone,
-            
-            # Additional fields
-            currency=settings.default_currency,
-            notes=data.get('notes', ''),
-            terms_conditions=settings.terms_conditions
-        )
+        # Totals + billing (form data or user profile) + company info from settings
+        invoice = Invoice.from_order(order, settings, data)
         
         db.session.add(invoice)
         db.session.commit()
@@ -281,12 +265,43 @@ def admin_create_invoice(order_id):
             'invoice': invoice.to_dict()
         }), 201
         
+    except IntegrityError:
+        # Concurrent creation (worker or bulk run) won uq_invoices_order_id
+        db.session.rollback()
+        return jsonify({'error': 'Invoice already exists for this order'}), 400
     except Exception as e:
         logger.error(f"Error creating invoice: {str(e)}")
         db.session.rollback()
         return jsonify({'error': 'Failed to create invoice'}), 500
 
 
+@invoices_bp.route('/api/admin/invoices/auto-create', methods=['POST'])
+@jwt_required()
+@admin_required
+def admin_auto_create_invoices():
+    """Admin: Create invoices for every paid order without one (batch job)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        limit = data.get('limit')
+        report = invoicing.invoice_paid_orders(
+            limit=int(limit) if limit else None,
+            render_pdfs=bool(data.get('render_pdfs', False)),
+            dry_run=bool(data.get('dry_run', False)),
+        )
+        logger.info(f"Auto-invoicing created {report.created} invoices in {report.elapsed_ms / 1000:.3f}s")
+        return jsonify({
+            'message': f'{report.created} invoices created',
+            'report': report.to_dict()
+        }), 200
+        
+    except (TypeError, ValueError):
+        return jsonify({'error': 'limit must be an integer'}), 400
+    except Exception as e:
+        logger.error(f"Error in auto-invoicing: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': 'Failed to create invoices'}), 500
+
+
 @invoices_bp.route('/api/admin/invoices/<int:invoice_id>', methods=['PUT'])
 @jwt_required()
 @admin_required
@@ -299,6 +314,7 @@ def admin_update_invoice(invoice_id):
             return jsonify({'error': 'Invoice not found'}), 404
         
         data = request.get_json()
+        rendered_before = invoice.status, invoice.notes
         
         # Update allowed fields
         if 'status' in data:
@@ -312,6 +328,10 @@ def admin_update_invoice(invoice_id):
         if 'payment_method' in data:
             invoice.payment_method = data['payment_method']
         
+        # El PDF cacheado pinta estado y notas (no el método/fecha de pago)
+        if (invoice.status, invoice.notes) != rendered_before:
+            invoice_pdf.invalidate(invoice)
+        
         invoice.updated_at = datetime.now(timezone.utc)
         db.session.commit()
         
@@ -341,7 +361,9 @@ def admin_delete_invoice(invoice_id):
             return jsonify({'error': 'Invoice not found'}), 404
         
         # Soft delete - just change status
-        invoice.status = 'cancelled'
+        if invoice.status != 'cancelled':
+            invoice.status = 'cancelled'
+            invoice_pdf.invalidate(invoice)
         invoice.updated_at = datetime.now(timezone.utc)
         db.session.commit()
         
@@ -383,7 +405,7 @@ def download_invoice_admin_options(invoice_id):
 @admin_required
 def download_invoice_admin(invoice_id):
     """Admin download invoice as PDF"""
-    if not PDF_SUPPORT:
+    if not invoice_pdf.PDF_SUPPORT:
         return jsonify({'error': 'PDF generation not available'}), 503
     
     start_time = perf_counter()
@@ -393,13 +415,13 @@ def download_invoice_admin(invoice_id):
         if not invoice:
             return jsonify({'error': 'Invoice not found'}), 404
         
-        # Generate PDF
-        pdf_buffer = generate_invoice_pdf(invoice)
+        # PDF cacheado en disco, o render en el pool de procesos
+        pdf_bytes, cached = invoice_pdf.get_pdf(invoice)
         
         elapsed = perf_counter() - start_time
-        logger.info(f"Admin generated PDF for invoice {invoice_id} in {elapsed:.3f}s")
+        logger.info(f"Admin {'served cached' if cached else 'generated'} PDF for invoice {invoice_id} in {elapsed:.3f}s")
         
-        response = make_response(pdf_buffer.getvalue())
+        response = make_response(pdf_bytes)
         response.headers['Content-Type'] = 'application/pdf'
         response.headers['Content-Disposition'] = f'attachment; filename=invoice_{invoice.invoice_number}.pdf'
         
@@ -444,6 +466,8 @@ def update_invoice_settings():
         settings = InvoiceSettings.get_settings()
         data = request.get_json()
         
+        rendered_before = invoice_pdf.settings_values(settings)
+        
         # Update fields
         for field in ['company_name', 'company_tax_id', 'company_address', 
                       'company_city', 'company_postal_code', 'company_country',
@@ -460,8 +484,14 @@ def update_invoice_settings():
                 else:
                     setattr(settings, field, data[field])
         
+        # Los PDFs cacheados pintan algunos ajustes (pie): se regeneran al descargarlos
+        if invoice_pdf.settings_values(settings) != rendered_before:
+            invalidated = invoice_pdf.invalidate_all()
+            logger.info(f"Invoice settings change invalidated {invalidated} cached PDFs")
+        
         settings.updated_at = datetime.now(timezone.utc)
         db.session.commit()
+        InvoiceSettings.invalidate_cache()
         
         logger.info("Invoice settings updated successfully")
         return jsonify({
@@ -473,132 +503,3 @@ def update_invoice_settings():
         logger.error(f"Error updating invoice settings: {str(e)}")
         db.session.rollback()
         return jsonify({'error': 'Failed to update settings'}), 500
-
-
-# ==================== HELPER FUNCTIONS ====================
-
-def generate_invoice_pdf(invoice):
-    """Generate PDF for invoice"""
-    if not PDF_SUPPORT:
-        raise Exception("PDF generation not available")
-    
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    story = []
-    styles = getSampleStyleSheet()
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#2c3e50'),
-        alignment=TA_CENTER
-    )
-    
-    # Title
-    story.append(Paragraph("INVOICE", title_style))
-    story.append(Spacer(1, 20))
-    
-    # Invoice details
-    invoice_data = [
-        ['Invoice Number:', invoice.invoice_number],
-        ['Date:', invoice.issue_date.strftime('%Y-%m-%d')],
-        ['Due Date:', invoice.due_date.strftime('%Y-%m-%d') if invoice.due_date else 'N/A'],
-        ['Status:', invoice.status.upper()]
-    ]
-    
-    invoice_table = Table(invoice_data, colWidths=[100, 200])
-    invoice_table.setStyle(TableStyle([
-        ('FONT', (0, 0), (-1, -1), 'Helvetica', 10),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-    ]))
-    story.append(invoice_table)
-    story.append(Spacer(1, 20))
-    
-    # Company and billing info
-    company_billing_data = [
-        ['FROM:', 'BILL TO:'],
-        [invoice.company_name or 'Company Name', invoice.billing_name],
-        [invoice.company_address or '', invoice.billing_address or ''],
-        [f"{invoice.company_city}, {invoice.company_postal_code}", 
-         f"{invoice.billing_city}, {invoice.billing_postal_code}" if invoice.billing_city else ''],
-        [invoice.company_email or '', invoice.billing_email],
-    ]
-    
-    # Add tax ID if company invoice
-    if hasattr(invoice, 'billing_tax_id') and invoice.billing_tax_id:
-        company_billing_data.append([
-            f"Tax ID: {invoice.company_tax_id or ''}", 
-            f"Tax ID: {invoice.billing_tax_id}"
-        ])
-    
-    company_billing_table = Table(company_billing_data, colWidths=[250, 250])
-    company_billing_table.setStyle(TableStyle([
-        ('FONT', (0, 0), (-1, -1), 'Helvetica', 10),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-    ]))
-    story.append(company_billing_table)
-    story.append(Spacer(1, 30))
-    
-    # Order items
-    if invoice.order and invoice.order.items:
-        items_data = [['Description', 'Qty', 'Price', 'Total']]
-        for item in invoice.order.items:
-            items_data.append([
-                item.product.name if item.product else 'Product',
-                str(item.quantity),
-                f"{invoice.currency} {item.unit_price:.2f}",
-                f"{invoice.currency} {(item.quantity * item.unit_price):.2f}"
-            ])
-        
-        items_table = Table(items_data, colWidths=[250, 50, 100, 100])
-        items_table.setStyle(TableStyle([
-            ('FONT', (0, 0), (-1, -1), 'Helvetica', 10),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
-            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#ecf0f1')),
-        ]))
-        story.append(items_table)
-        story.append(Spacer(1, 20))
-    
-    # Totals
-    totals_data = [
-        ['Subtotal:', f"{invoice.currency} {invoice.subtotal:.2f}"],
-        [f'Tax ({invoice.tax_rate}%):', f"{invoice.currency} {invoice.tax_amount:.2f}"],
-        ['Shipping:', f"{invoice.currency} {invoice.shipping_cost:.2f}"],
-    ]
-    
-    if invoice.discount_amount > 0:
-        totals_data.append(['Discount:', f"-{invoice.currency} {invoice.discount_amount:.2f}"])
-    
-    totals_data.append(['TOTAL:', f"{invoice.currency} {invoice.total_amount:.2f}"])
-    
-    totals_table = Table(totals_data, colWidths=[400, 100])
-    totals_table.setStyle(TableStyle([
-        ('FONT', (0, 0), (-1, -1), 'Helvetica', 10),
-        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, -1), (-1, -1), 12),
-        ('LINEABOVE', (0, -1), (-1, -1), 2, colors.black),
-    ]))
-    story.append(totals_table)
-    
-    # Notes and terms
-    if invoice.notes:
-        story.append(Spacer(1, 30))
-        story.append(Paragraph("Notes:", styles['Heading3']))
-        story.append(Paragraph(invoice.notes, styles['Normal']))
-    
-    if invoice.terms_conditions:
-        story.append(Spacer(1, 20))
-        story.append(Paragraph("Terms & Conditions:", styles['Heading3']))
-        story.append(Paragraph(invoice.terms_conditions, styles['Normal']))
-    
-    # Build PDF
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
\ No newline at end of file
@@ -4,9 +4,10 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from sqlalchemy import desc, and_
 from app import db
 from app.models.user import User
-from app.models.product import Product
-from app.models.cart import CartItem
-from app.models.order import Order, OrderItem
+from app.models.order import Order
+from app.services import checkout, loading, pagination
+from app.services.idempotency import idempotent
+from app.services.query_counter import max_queries
 from time import perf_counter
 from decimal import Decimal, InvalidOperation
 import logging
@@ -46,6 +47,7 @@ def admin_required(fn):
 
 @orders_bp.route('/create', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_order():
     """Crear una orden desde el carrito del usuario."""
     t0 = perf_counter()
@@ -53,73 +55,20 @@ def create_order():
     logger.info("[orders.create.start] user_id=%s", user_id)
     try:
         data = request.get_json(silent=True) or {}
-        print(f"RAW DATA RECEIVED: {data}")
 
-        # 1) Obtener items de carrito
-        cart_items = CartItem.query.filter_by(user_id=user_id).all()
-        print(f"CART_ITEMS: {len(cart_items)}")
-        
-        if not cart_items:
-            logger.info("[orders.create.error] user_id=%s empty_cart", user_id)
-            return jsonify({"error": "Cart is empty"}), 400
-
-        # 2) Validar stock y calcular total con Decimal
-        total_amount = Decimal("0")
-        order_items_data = []
-
-        for ci in cart_items:
-            product = Product.query.get(ci.product_id)
-            if not product or not getattr(product, "is_active", True):
-                return jsonify({"error": f"Product not available (id={ci.product_id})"}), 400
-
-            if product.stock < ci.quantity:
-                return jsonify({"error": f"Insufficient stock for {product.name}"}), 400
-
-            unit_price = product.price if isinstance(product.price, Decimal) else Decimal(str(product.price))
-            line_total = unit_price * ci.quantity
-            total_amount += line_total
-
-            order_items_data.append({
-                "product_id": product.id,
-                "product_name": product.name,
-                "product_image_url": getattr(product, "image_url", None),
-                "unit_price": unit_price,
-                "quantity": ci.quantity,
-            })
-
-        # 3) Crear Order
-        order = Order(
-            user_id=user_id,
-            total_amount=total_amount,
-            shipping_address=data.get("shipping_address"),
-            billing_address=data.get("billing_address"),
-        )
-        db.session.add(order)
-        db.session.flush()  # asegura order.id
-
-        # 4) Crear OrderItems
-        for item in order_items_data:
-            oi = OrderItem(
-                order_id=order.id,
-                product_id=item["product_id"],
-                product_name=item["product_name"],
-                product_image_url=item["product_image_url"],
-                unit_price=item["unit_price"],
-                quantity=item["quantity"],
+        # Carrito -> orden: stock descontado con un UPDATE condicional atómico (ver services/checkout.py)
+        try:
+            order = checkout.place_order(
+                user_id,
+                shipping_address=data.get("shipping_address"),
+                billing_address=data.get("billing_address"),
             )
-            db.session.add(oi)
-
-        # 5) Descontar stock
-        for ci in cart_items:
-            product = Product.query.get(ci.product_id)
-            product.stock -= ci.quantity
-
-        # 6) Limpiar carrito
-        CartItem.query.filter_by(user_id=user_id).delete()
+        except checkout.CheckoutError as e:
+            dt = (perf_counter() - t0) * 1000
+            logger.info("[orders.create.error] user_id=%s reason=%s ms=%.2f", user_id, e.message, dt)
+            return jsonify({"error": e.message}), e.status
 
-        db.session.commit()
-
-        # 7) Respuesta consistente
+        # Respuesta consistente
         payload = getattr(order, "to_dict", None)
         if callable(payload):
             body = {"message": "Order created successfully", "order": order.to_dict()}
@@ -154,7 +103,7 @@ def get_order(order_id):
     user_id = get_jwt_identity()
     logger.info("[orders.get.start] user_id=%s order_id=%s", user_id, order_id)
     try:
-        order = Order.query.filter_by(id=order_id, user_id=user_id).first()
+        order = Order.query.filter_by(id=order_id, user_id=user_id).options(*loading.profile("order.full")).first()
         if not order:
             logger.info("[orders.get.not_found] user_id=%s order_id=%s", user_id, order_id)
             return jsonify({"error": "Order not found"}), 404
@@ -185,6 +134,7 @@ def get_order(order_id):
 
 @orders_bp.route('/my', methods=['GET'])
 @jwt_required()
+@max_queries(5)
 def list_my_orders():
     """Listar órdenes del usuario autenticado (paginado)."""
     t0 = perf_counter()
@@ -193,9 +143,7 @@ def list_my_orders():
     limit = min(50, max(1, int(request.args.get("limit", 10))))
     logger.info("[orders.my.start] user_id=%s page=%s limit=%s", user_id, page, limit)
     try:
-        qs = Order.query.filter_by(user_id=user_id).order_by(desc(Order.created_at))
-        total_items = qs.count()
-        items = qs.offset((page - 1) * limit).limit(limit).all()
+        qs = Order.query.filter_by(user_id=user_id).options(*loading.profile("order.items"))
 
         def serialize(o: Order):
             return {
@@ -206,6 +154,27 @@ def list_my_orders():
                 "items_count": len(getattr(o, "items", []) or []),
             }
 
+        if pagination.cursor_requested():
+            try:
+                kp = pagination.keyset_page(qs, Order, limit)
+            except pagination.InvalidCursor:
+                return jsonify({"error": "Invalid cursor"}), 400
+            resp = {
+                "limit": limit,
+                "next_cursor": kp.next_cursor,
+                "has_next": kp.has_next,
+                "items": [serialize(o) for o in kp.items],
+            }
+            if kp.total is not None:
+                resp["total_items"] = kp.total
+            dt = (perf_counter() - t0) * 1000
+            logger.info("[orders.my.ok] user_id=%s status=200 mode=cursor count=%s ms=%.2f", user_id, len(kp.items), dt)
+            return jsonify(resp), 200
+
+        qs = qs.order_by(desc(Order.created_at))
+        total_items = qs.count()
+        items = qs.offset((page - 1) * limit).limit(limit).all()
+
         resp = {
             "page": page,
             "limit": limit,
@@ -226,6 +195,7 @@ def list_my_orders():
 
 @orders_bp.route('/admin/orders', methods=['GET'])
 @admin_required
+@max_queries(5)
 def admin_get_all_orders():
     """Admin endpoint compatible with ManageInvoices - returns full user data"""
     t0 = perf_counter()
@@ -236,7 +206,7 @@ def admin_get_all_orders():
     logger.info("[orders.admin_get_all.start] page=%s per_page=%s status=%s", page, per_page, status)
     
     try:
-        query = Order.query
+        query = Order.query.options(*loading.profile("order.user"))
         
         if status:
             query = query.filter(Order.status == status)
@@ -316,6 +286,7 @@ def admin_get_all_orders():
 # MANTENER el endpoint antiguo por compatibilidad
 @orders_bp.route('/admin/all', methods=['GET'])
 @admin_required
+@max_queries(5)
 def admin_list_orders():
     """Listado admin de todas las órdenes (endpoint antiguo - mantener por compatibilidad)"""
     t0 = perf_counter()
@@ -327,7 +298,7 @@ def admin_list_orders():
     logger.info("[orders.admin_list.start] page=%s limit=%s status=%s range=%s..%s",
                 page, limit, status, start_date, end_date)
     try:
-        qs = Order.query
+        qs = Order.query.options(*loading.profile("order.user"))
 
         if status:
             qs = qs.filter(Order.status == status)
@@ -345,12 +316,8 @@ def admin_list_orders():
             except ValueError:
                 return jsonify({"error": "Invalid end_date format. Use YYYY-MM-DD."}), 400
 
-        qs = qs.order_by(desc(Order.created_at))
-        total_items = qs.count()
-        rows = qs.offset((page - 1) * limit).limit(limit).all()
-
         def serialize_admin(o: Order):
-            u = User.query.get(o.user_id) if o.user_id else None
+            u = o.user
             return {
                 "id": o.id,
                 "user_id": o.user_id,
@@ -360,6 +327,27 @@ def admin_list_orders():
                 "created_at": getattr(o, "created_at", None).isoformat() if getattr(o, "created_at", None) else None,
             }
 
+        if pagination.cursor_requested():
+            try:
+                kp = pagination.keyset_page(qs, Order, limit)
+            except pagination.InvalidCursor:
+                return jsonify({"error": "Invalid cursor"}), 400
+            resp = {
+                "limit": limit,
+                "next_cursor": kp.next_cursor,
+                "has_next": kp.has_next,
+                "items": [serialize_admin(o) for o in kp.items],
+            }
+            if kp.total is not None:
+                resp["total_items"] = kp.total
+            dt = (perf_counter() - t0) * 1000
+            logger.info("[orders.admin_list.ok] status=200 mode=cursor count=%s ms=%.2f", len(kp.items), dt)
+            return jsonify(resp), 200
+
+        qs = qs.order_by(desc(Order.created_at))
+        total_items = qs.count()
+        rows = qs.offset((page - 1) * limit).limit(limit).all()
+
         resp = {
             "page": page,
             "limit": limit,
@@ -1,4 +1,5 @@
 # payments.py – BlitzShop (refactor consistente)
+import json
 import os
 import logging
 from time import perf_counter
@@ -11,10 +12,11 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 
 from app import db
 from app.models.order import Order
+from app.services import idempotency, payment_gateway, stripe_events
 
 load_dotenv()
 
-stripe.api_key = os.environ.get("STRIPE_SECRET_KEY")
+# Las llamadas a la API de Stripe pasan por services/payment_gateway.py
 STRIPE_WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET")
 
 payments_bp = Blueprint("payments", __name__)
@@ -42,13 +44,20 @@ def error_response(status: int, error: str, message: str | None = None):
     return jsonify(payload), status
 
 
-def _set_order_status(order: Order, new_status: str):
-    """Transición segura de estado."""
-    # Estados esperados: pending -> paid | cancelled
-    if new_status not in ("pending", "paid", "cancelled"):
-        return
-    order.status = new_status
+def _apply_intent_status(order: Order, intent) -> bool:
+    """
+    Estado del pedido según el intent, con las mismas transiciones que el webhook
+    y la conciliación (``stripe_events.ALLOWED_TRANSITIONS``): un pedido ya
+    pagado, enviado o entregado no cambia ni vuelve a encolar ``order.paid``.
+    """
+    locked = Order.query.filter_by(id=order.id)
+    if db.engine.dialect.name == "postgresql":
+        locked = locked.with_for_update()
+    order = locked.populate_existing().first()
+    new_status = stripe_events.INTENT_ORDER_STATUS.get(intent.status)
+    changed = bool(new_status) and stripe_events.apply_payment_status(order, new_status)
     db.session.commit()
+    return changed
 
 
 # -----------------------------
@@ -57,6 +66,7 @@ def _set_order_status(order: Order, new_status: str):
 
 @payments_bp.route("/create-intent", methods=["POST"])
 @jwt_required()
+@idempotency.idempotent
 def create_payment_intent():
     """Crear Stripe Payment Intent para una orden del usuario."""
     t0 = perf_counter()
@@ -82,14 +92,19 @@ def create_payment_intent():
         # Convertir a centavos para Stripe
         amount_cents = int(round(to_float(order.total_amount) * 100))
 
-        # Crear Payment Intent (no loguear client_secret)
-        intent = stripe.PaymentIntent.create(
+        # Crear Payment Intent (no loguear client_secret). La Idempotency-Key del
+        # cliente se reenvía a Stripe: un reintento tras caída del worker no crea otro intent
+        idempotency_key = None
+        if idempotency.current_key():
+            idempotency_key = f"intent-{order.id}-{idempotency.current_key()}"
+        intent = payment_gateway.get_gateway().create_intent(
             amount=amount_cents,
             currency="usd",
             metadata={
                 "order_id": str(order.id),
                 "user_id": str(user_id),
             },
+            idempotency_key=idempotency_key,
         )
 
         # Guardar payment_intent_id en la orden
@@ -110,11 +125,13 @@ def create_payment_intent():
                     user_id, order.id, dt)
         return jsonify(resp), 200
 
-    except stripe.error.StripeError as e:
+    except payment_gateway.PaymentGatewayError as e:
         dt = (perf_counter() - t0) * 1000
-        logger.warning("[payments.intent.error] user_id=%s ms=%.2f stripe_err=%s",
-                       user_id, dt, str(e))
-        return error_response(400, "Stripe error", str(e))
+        logger.warning("[payments.intent.error] user_id=%s ms=%.2f http=%s stripe_err=%s",
+                       user_id, dt, e.status, e.message)
+        if e.status == 503:
+            return error_response(503, "Payment provider unavailable", e.message)
+        return error_response(e.status, "Stripe error", e.message)
     except Exception as e:
         dt = (perf_counter() - t0) * 1000
         logger.exception("[payments.intent.error] user_id=%s ms=%.2f err=%s",
@@ -147,19 +164,15 @@ def confirm_payment():
             return error_response(404, "Order not found")
 
         # Consultar estado real en Stripe
-        intent = stripe.PaymentIntent.retrieve(payment_intent_id)
+        intent = payment_gateway.get_gateway().retrieve_intent(payment_intent_id)
 
-        # Update local state according to Stripe
-        if intent.status == "succeeded":
-            _set_order_status(order, "paid")
-        elif intent.status in ("canceled", "requires_payment_method"):
-            _set_order_status(order, "cancelled")
-        else:
-            # sigue pendiente / en proceso
-            _set_order_status(order, "pending")
+        # Update local state according to Stripe (sin mapeo: sigue pendiente / en proceso)
+        _apply_intent_status(order, intent)
+        # Recargar la página de éxito tras el envío sigue siendo un pago confirmado
+        paid = intent.status == "succeeded" and order.status != "cancelled"
 
         resp = {
-            "message": "Payment confirmed successfully" if order.status == "paid" else "Payment not completed",
+            "message": "Payment confirmed successfully" if paid else "Payment not completed",
             "order": order.to_dict() if hasattr(order, "to_dict") else {
                 "id": order.id,
                 "status": order.status,
@@ -168,17 +181,19 @@ def confirm_payment():
             },
         }
 
-        status_code = 200 if order.status == "paid" else 400
+        status_code = 200 if paid else 400
         dt = (perf_counter() - t0) * 1000
         logger.info("[payments.confirm.ok] user_id=%s order_id=%s status=%s http=%s ms=%.2f",
                     user_id, order.id, order.status, status_code, dt)
         return jsonify(resp), status_code
 
-    except stripe.error.StripeError as e:
+    except payment_gateway.PaymentGatewayError as e:
         dt = (perf_counter() - t0) * 1000
-        logger.warning("[payments.confirm.error] user_id=%s ms=%.2f stripe_err=%s",
-                       user_id, dt, str(e))
-        return error_response(400, "Stripe error", str(e))
+        logger.warning("[payments.confirm.error] user_id=%s ms=%.2f http=%s stripe_err=%s",
+                       user_id, dt, e.status, e.message)
+        if e.status == 503:
+            return error_response(503, "Payment provider unavailable", e.message)
+        return error_response(e.status, "Stripe error", e.message)
     except Exception as e:
         dt = (perf_counter() - t0) * 1000
         logger.exception("[payments.confirm.error] user_id=%s ms=%.2f err=%s",
@@ -190,7 +205,8 @@ def confirm_payment():
 def stripe_webhook():
     """
     Webhook Stripe (opcional pero recomendado).
-    Actualiza la orden según el evento oficial de Stripe.
+    Verifica la firma, guarda el evento y responde 2xx; la orden se actualiza
+    en segundo plano (worker del outbox).
     """
     t0 = perf_counter()
     logger.info("[payments.webhook.start]")
@@ -216,34 +232,15 @@ def stripe_webhook():
             logger.warning("[payments.webhook.error] signature_verification_failed err=%s", str(e))
             return error_response(400, "Invalid signature", str(e))
 
-        # Manejar eventos relevantes
-        if event["type"] in ("payment_intent.succeeded", "payment_intent.canceled", "payment_intent.payment_failed"):
-            intent = event["data"]["object"]
-            pi_id = intent.get("id")
-            metadata = intent.get("metadata", {}) or {}
-            order_id = metadata.get("order_id")
-
-            # Buscar orden por metadata o por pi id como fallback
-            order = None
-            if order_id:
-                order = Order.query.filter_by(id=int(order_id)).first()
-            if not order and pi_id:
-                order = Order.query.filter_by(stripe_payment_intent_id=pi_id).first()
-
-            if order:
-                if event["type"] == "payment_intent.succeeded":
-                    _set_order_status(order, "paid")
-                    logger.info("[payments.webhook.ok] event=succeeded order_id=%s", order.id)
-                elif event["type"] in ("payment_intent.canceled", "payment_intent.payment_failed"):
-                    _set_order_status(order, "cancelled")
-                    logger.info("[payments.webhook.ok] event=%s order_id=%s", event["type"], order.id)
-            else:
-                logger.warning("[payments.webhook.warn] order_not_found pi=%s order_id=%s", pi_id, order_id)
+        # Fast-ack: guardar el evento verificado (dedup por id de Stripe) y responder;
+        # el worker del outbox lo aplica a la orden (services/stripe_events.py)
+        row, created = stripe_events.record_event(json.loads(payload))
 
         dt = (perf_counter() - t0) * 1000
-        logger.info("[payments.webhook.ok] status=200 ms=%.2f type=%s", dt, event["type"])
+        logger.info("[payments.webhook.ok] status=200 ms=%.2f type=%s event_id=%s duplicate=%s",
+                    dt, event["type"], event["id"], not created)
         # Stripe expects 2xx without specific body
-        return jsonify({"ok": True}), 200
+        return jsonify({"ok": True, "duplicate": not created}), 200
 
     except Exception as e:
         dt = (perf_counter() - t0) * 1000
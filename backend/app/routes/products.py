@@ -4,12 +4,12 @@ from time import perf_counter
 from decimal import Decimal, InvalidOperation
 
 from flask import Blueprint, request, jsonify
-from sqlalchemy import or_
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 from app import db
 from app.models.product import Product
 from app.models.user import User
+from app.services import catalog_cache, facets, http_cache, json_provider, pagination, search
 
 products_bp = Blueprint("products", __name__)
 logger = logging.getLogger(__name__)
@@ -59,6 +59,7 @@ def serialize_product(p: Product):
         "stock": p.stock,
         "category": p.category,
         "image_url": p.image_url,
+        "image_variants": p.image_variants,
         "is_active": p.is_active,
         "created_at": p.created_at.isoformat() if getattr(p, "created_at", None) else None,
         "updated_at": p.updated_at.isoformat() if getattr(p, "updated_at", None) else None,
@@ -66,6 +67,41 @@ def serialize_product(p: Product):
     }
 
 
+def product_fragment(p: Product) -> bytes:
+    """``serialize_product`` ya codificado, cacheado por (id, updated_at)."""
+    updated = getattr(p, "updated_at", None)
+    if updated is None:
+        return json_provider.dumps_bytes(serialize_product(p))
+    key = (p.id, updated)
+    data = catalog_cache.get_fragment(key)
+    if data is None:
+        data = json_provider.dumps_bytes(serialize_product(p))
+        catalog_cache.put_fragment(key, data)
+    return data
+
+
+def encode_payload(fields: dict, key: str, raw: bytes) -> bytes:
+    """JSON de ``fields`` + la clave ``key`` con un valor ya codificado (``raw``)."""
+    head = json_provider.dumps_bytes(fields)
+    sep = b"," if fields else b""
+    return head[:-1] + sep + b'"' + key.encode() + b'":' + raw + b"}"
+
+
+def encode_product_list(products, fields: dict) -> bytes:
+    return encode_payload(fields, "products", b"[" + b",".join(product_fragment(p) for p in products) + b"]")
+
+
+def catalog_validators(cached, kind: str, params, *criteria):
+    """
+    ETag/Last-Modified de la respuesta: los guardados junto a la entrada de caché
+    o, si no hay, COUNT + MAX(updated_at) de products (sin cargar filas).
+    """
+    if cached is not None:
+        return cached[1]
+    count, last_updated = http_cache.table_fingerprint(Product, *criteria)
+    return http_cache.build_validators(kind, params, count, last_updated)
+
+
 # admin_required decorator according to your standard
 def admin_required(fn):
     @jwt_required()
@@ -94,17 +130,33 @@ def get_products():
         price = request.args.get("price")  # "min:max" | "min:" | ":max" | "99"
         in_stock = request.args.get("in_stock")
         page, per_page = get_pagination(default_limit=20)
+        facet_names = facets.requested_facets()  # facets=category,price,in_stock
+
+        # Caché por parámetros normalizados (+ versión del catálogo)
+        cache_key = catalog_cache.key("list", (
+            (q or "").lower(), category or "", price or "", str(in_stock or "").lower(),
+            page, per_page, request.args.get("cursor"), pagination.total_requested(), facet_names,
+        ))
+        cached = catalog_cache.get(cache_key)
+        validators = catalog_validators(cached, "products.list", cache_key[2])
+        if http_cache.is_not_modified(validators):
+            dt = (perf_counter() - t0) * 1000
+            logger.info("[products.list.ok] status=304 ms=%.2f", dt)
+            return http_cache.not_modified_response(validators)
+        if cached is not None:
+            dt = (perf_counter() - t0) * 1000
+            logger.info("[products.list.ok] status=200 ms=%.2f cache=hit", dt)
+            return http_cache.apply_validators(json_provider.json_response(cached[0]), validators)
 
         query = Product.query.filter_by(is_active=True)
 
         if category:
             query = query.filter(Product.category.ilike(f"%{category}%"))
 
+        rank_order = None
         if q:
-            like = f"%{q}%"
-            query = query.filter(
-                or_(Product.name.ilike(like), Product.description.ilike(like))
-            )
+            # Índice full-text (FTS5 / tsvector) con ranking; ILIKE solo como fallback
+            query, rank_order = search.apply_search(query, q)
 
         if price:
             try:
@@ -126,17 +178,41 @@ def get_products():
             elif flag == "false":
                 query = query.filter((Product.stock == 0) | (Product.stock.is_(None)))
 
-        query = query.order_by(Product.created_at.desc())
+        # Facetas del filtro actual: un único GROUP BY, antes de ordenar/paginar
+        facet_counts = facets.compute_facets(query, facet_names) if facet_names else None
+
+        # Modo cursor (opt-in): keyset sobre (created_at, id), sin COUNT por defecto
+        if pagination.cursor_requested():
+            try:
+                kp = pagination.keyset_page(query, Product, per_page)
+            except pagination.InvalidCursor:
+                return error_response(400, "Invalid cursor")
+            page_info = {"per_page": per_page, "next_cursor": kp.next_cursor, "has_next": kp.has_next}
+            if kp.total is not None:
+                page_info["total"] = kp.total
+            fields = {"pagination": page_info}
+            if facet_counts is not None:
+                fields["facets"] = facet_counts
+            body = encode_product_list(kp.items, fields)
+            catalog_cache.put(cache_key, (body, validators))
+
+            dt = (perf_counter() - t0) * 1000
+            logger.info("[products.list.ok] status=200 ms=%.2f mode=cursor per_page=%s count=%s",
+                        dt, per_page, len(kp.items))
+            return http_cache.apply_validators(json_provider.json_response(body), validators)
+
+        if rank_order is not None:
+            query = query.order_by(rank_order, Product.created_at.desc())
+        else:
+            query = query.order_by(Product.created_at.desc())
 
         total_items = query.count()
         items = query.offset((page - 1) * per_page).limit(per_page).all()
-        serialized = [serialize_product(p) for p in items]
 
         total_pages = (total_items + per_page - 1) // per_page if per_page else 1
 
-        # CONTRATO LEGACY para tu frontend
-        resp = {
-            "products": serialized,
+        # CONTRATO LEGACY para tu frontend ("products" se monta con fragmentos ya codificados)
+        fields = {
             "pagination": {
                 "page": page,
                 "pages": total_pages,
@@ -146,11 +222,15 @@ def get_products():
                 "has_prev": page > 1,
             },
         }
+        if facet_counts is not None:
+            fields["facets"] = facet_counts
+        body = encode_product_list(items, fields)
+        catalog_cache.put(cache_key, (body, validators))
 
         dt = (perf_counter() - t0) * 1000
         logger.info("[products.list.ok] status=200 ms=%.2f page=%s per_page=%s total=%s",
                     dt, page, per_page, total_items)
-        return jsonify(resp), 200
+        return http_cache.apply_validators(json_provider.json_response(body), validators)
 
     except Exception as e:
         dt = (perf_counter() - t0) * 1000
@@ -164,16 +244,29 @@ def get_product(product_id):
     t0 = perf_counter()
     logger.info("[products.get.start] id=%s", product_id)
     try:
+        cache_key = catalog_cache.key("product", product_id)
+        cached = catalog_cache.get(cache_key)
+        validators = catalog_validators(cached, "products.get", product_id, Product.id == product_id)
+        if http_cache.is_not_modified(validators):
+            dt = (perf_counter() - t0) * 1000
+            logger.info("[products.get.ok] id=%s status=304 ms=%.2f", product_id, dt)
+            return http_cache.not_modified_response(validators)
+        if cached is not None:
+            dt = (perf_counter() - t0) * 1000
+            logger.info("[products.get.ok] id=%s status=200 ms=%.2f cache=hit", product_id, dt)
+            return http_cache.apply_validators(json_provider.json_response(cached[0]), validators)
+
         product = Product.query.get(product_id)
         if not product or not product.is_active:
             dt = (perf_counter() - t0) * 1000
             logger.info("[products.get.ok] id=%s status=404 ms=%.2f", product_id, dt)
             return error_response(404, "Product not found")
 
-        resp = {"product": serialize_product(product)}
+        body = encode_payload({}, "product", product_fragment(product))
+        catalog_cache.put(cache_key, (body, validators))
         dt = (perf_counter() - t0) * 1000
         logger.info("[products.get.ok] id=%s status=200 ms=%.2f", product_id, dt)
-        return jsonify(resp), 200
+        return http_cache.apply_validators(json_provider.json_response(body), validators)
 
     except Exception as e:
         dt = (perf_counter() - t0) * 1000
@@ -215,7 +308,10 @@ def create_product():
         )
 
         db.session.add(product)
+        db.session.flush()
+        search.sync_products([product.id])
         db.session.commit()
+        catalog_cache.bump_catalog_version("products.create")
 
         resp = {
             "message": "Product created successfully",
@@ -271,7 +367,10 @@ def update_product(product_id: int):
         if "is_active" in data:
             product.is_active = bool(data["is_active"])
 
+        db.session.flush()
+        search.sync_products([product.id])
         db.session.commit()
+        catalog_cache.bump_catalog_version("products.update")
 
         resp = {
             "message": "Product updated successfully",
@@ -304,6 +403,7 @@ def delete_product(product_id: int):
 
         product.is_active = False
         db.session.commit()
+        catalog_cache.bump_catalog_version("products.delete")
 
         dt = (perf_counter() - t0) * 1000
         logger.info("[products.delete.ok] id=%s status=200 ms=%.2f", product_id, dt)
@@ -322,6 +422,18 @@ def get_categories():
     t0 = perf_counter()
     logger.info("[products.categories.start]")
     try:
+        cache_key = catalog_cache.key("categories", None)
+        cached = catalog_cache.get(cache_key)
+        validators = catalog_validators(cached, "products.categories", None)
+        if http_cache.is_not_modified(validators):
+            dt = (perf_counter() - t0) * 1000
+            logger.info("[products.categories.ok] status=304 ms=%.2f", dt)
+            return http_cache.not_modified_response(validators)
+        if cached is not None:
+            dt = (perf_counter() - t0) * 1000
+            logger.info("[products.categories.ok] status=200 ms=%.2f cache=hit", dt)
+            return http_cache.apply_validators(json_provider.json_response(cached[0]), validators)
+
         rows = (
             db.session.query(Product.category)
             .filter(
@@ -334,10 +446,11 @@ def get_categories():
         )
         categories = sorted([r[0] for r in rows if r and r[0]])
 
-        resp = {"categories": categories}
+        body = json_provider.dumps_bytes({"categories": categories})
+        catalog_cache.put(cache_key, (body, validators))
         dt = (perf_counter() - t0) * 1000
         logger.info("[products.categories.ok] status=200 ms=%.2f total=%s", dt, len(categories))
-        return jsonify(resp), 200
+        return http_cache.apply_validators(json_provider.json_response(body), validators)
 
     except Exception as e:
         dt = (perf_counter() - t0) * 1000
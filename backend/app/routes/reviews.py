@@ -8,6 +8,8 @@ from app.models.review import Review
 from app.models.product import Product
 from app.models.user import User
 from app.models.order import Order, OrderItem
+from app.services import http_cache, loading
+from app.services.query_counter import max_queries
 
 reviews_bp = Blueprint("reviews", __name__)
 logger = logging.getLogger(__name__)
@@ -21,6 +23,7 @@ def error_response(status: int, error: str, message: str | None = None):
 
 
 @reviews_bp.route("/products/<int:product_id>/reviews", methods=["GET"])
+@max_queries(6)
 def get_product_reviews(product_id):
     """Obtener todas las reviews de un producto"""
     try:
@@ -32,15 +35,29 @@ def get_product_reviews(product_id):
         page = request.args.get("page", 1, type=int)
         per_page = min(request.args.get("per_page", 10, type=int), 50)
         
+        # GET condicional: COUNT + MAX(updated_at) de las reviews y de sus autores
+        # (to_dict incluye username/email) antes de paginar/serializar
+        count, last_updated = http_cache.table_fingerprint(
+            Review, Review.product_id == product_id, related=(User, Review.user_id == User.id)
+        )
+        validators = http_cache.build_validators("reviews.list", (product_id, page, per_page), count, last_updated)
+        if http_cache.is_not_modified(validators):
+            return http_cache.not_modified_response(validators)
+        
         # Get reviews
-        reviews_query = Review.query.filter_by(product_id=product_id).order_by(Review.created_at.desc())
+        reviews_query = (
+            Review.query.filter_by(product_id=product_id)
+            .options(*loading.profile("review.user"))
+            .order_by(Review.created_at.desc())
+        )
         pagination = reviews_query.paginate(page=page, per_page=per_page, error_out=False)
         
         # Calculate average rating
-        avg_rating = db.session.query(func.avg(Review.rating)).filter(Review.product_id == product_id).scalar()
-        total_reviews = db.session.query(func.count(Review.id)).filter(Review.product_id == product_id).scalar()
+        avg_rating, total_reviews = db.session.query(
+            func.avg(Review.rating), func.count(Review.id)
+        ).filter(Review.product_id == product_id).one()
         
-        return jsonify({
+        return http_cache.apply_validators(jsonify({
             "reviews": [review.to_dict() for review in pagination.items],
             "total": pagination.total,
             "page": page,
@@ -48,7 +65,7 @@ def get_product_reviews(product_id):
             "pages": pagination.pages,
             "average_rating": float(avg_rating) if avg_rating else 0,
             "total_reviews": total_reviews or 0
-        }), 200
+        }), validators), 200
         
     except Exception as e:
         logger.error(f"Error getting reviews: {str(e)}")
@@ -211,12 +228,18 @@ def delete_review(review_id):
 
 @reviews_bp.route("/users/me/reviews", methods=["GET"])
 @jwt_required()
+@max_queries(2)
 def get_my_reviews():
     """Obtener todas las reviews del usuario actual"""
     try:
         current_user_id = get_jwt_identity()
         
-        reviews = Review.query.filter_by(user_id=current_user_id).order_by(Review.created_at.desc()).all()
+        reviews = (
+            Review.query.filter_by(user_id=current_user_id)
+            .options(*loading.profile("review.user"))
+            .order_by(Review.created_at.desc())
+            .all()
+        )
         
         return jsonify({
             "reviews": [review.to_dict() for review in reviews],
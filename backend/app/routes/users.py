@@ -7,7 +7,9 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
 from app.models.user import User
-from app.models.order import Order, OrderItem
+from app.models.order import Order
+from app.services import loading, pagination
+from app.services.query_counter import max_queries
 
 users_bp = Blueprint("users", __name__)
 logger = logging.getLogger(__name__)
@@ -281,6 +283,7 @@ def get_address():
 
 @users_bp.route("/orders", methods=["GET"])
 @jwt_required()
+@max_queries(5)
 def get_user_orders():
     """Obtener historial de órdenes del usuario (formato legacy para el front)"""
     t0 = perf_counter()
@@ -289,38 +292,61 @@ def get_user_orders():
     try:
         page, limit = get_pagination(default_limit=10)
 
-        query = Order.query.filter_by(user_id=uid).order_by(Order.created_at.desc())
-        total_items = query.count()
-        orders = query.offset((page - 1) * limit).limit(limit).all()
-
-        orders_list = []
-        for order in orders:
-            order_items = OrderItem.query.filter_by(order_id=order.id).all()
-            items_list = []
-            for item in order_items:
-                items_list.append({
-                    "id": item.id,
-                    "product_id": item.product_id,
-                    "product_name": item.product_name,
-                    "product_image_url": item.product_image_url,
-                    "quantity": item.quantity,
-                    "price": to_float(getattr(item, "unit_price", 0)),
-                    "total": to_float(getattr(item, "total_price", getattr(item, "unit_price", 0) * getattr(item, "quantity", 0))),
+        query = Order.query.filter_by(user_id=uid).options(*loading.profile("order.items"))
+
+        def serialize_orders(orders):
+            orders_list = []
+            for order in orders:
+                order_items = order.items
+                items_list = []
+                for item in order_items:
+                    items_list.append({
+                        "id": item.id,
+                        "product_id": item.product_id,
+                        "product_name": item.product_name,
+                        "product_image_url": item.product_image_url,
+                        "quantity": item.quantity,
+                        "price": to_float(getattr(item, "unit_price", 0)),
+                        "total": to_float(getattr(item, "total_price", getattr(item, "unit_price", 0) * getattr(item, "quantity", 0))),
+                    })
+
+                orders_list.append({
+                    "id": order.id,
+                    "order_number": f"ORD-{order.id:06d}",
+                    "status": order.status,
+                    "total_amount": to_float(getattr(order, "total_amount", 0)),
+                    "items_count": len(items_list),
+                    "items": items_list,
+                    "shipping_address": getattr(order, "shipping_address", None),
+                    "billing_address": getattr(order, "billing_address", None),
+                    "payment_method": "Stripe" if getattr(order, "stripe_payment_intent_id", None) else "Pending",
+                    "created_at": (order.created_at.isoformat() if getattr(order, "created_at", None) else None),
+                    "updated_at": (order.updated_at.isoformat() if getattr(order, "updated_at", None) else None),
                 })
+            return orders_list
+
+        if pagination.cursor_requested():
+            try:
+                kp = pagination.keyset_page(query, Order, limit)
+            except pagination.InvalidCursor:
+                return error_response(400, "Invalid cursor")
+            resp = {
+                "orders": serialize_orders(kp.items),
+                "per_page": limit,
+                "next_cursor": kp.next_cursor,
+                "has_next": kp.has_next,
+            }
+            if kp.total is not None:
+                resp["total"] = kp.total
+            dt = (perf_counter() - t0) * 1000
+            logger.info("[users.orders.list.ok] user_id=%s status=200 ms=%.2f mode=cursor limit=%s count=%s",
+                        uid, dt, limit, len(kp.items))
+            return jsonify(resp), 200
 
-            orders_list.append({
-                "id": order.id,
-                "order_number": f"ORD-{order.id:06d}",
-                "status": order.status,
-                "total_amount": to_float(getattr(order, "total_amount", 0)),
-                "items_count": len(items_list),
-                "items": items_list,
-                "shipping_address": getattr(order, "shipping_address", None),
-                "billing_address": getattr(order, "billing_address", None),
-                "payment_method": "Stripe" if getattr(order, "stripe_payment_intent_id", None) else "Pending",
-                "created_at": (order.created_at.isoformat() if getattr(order, "created_at", None) else None),
-                "updated_at": (order.updated_at.isoformat() if getattr(order, "updated_at", None) else None),
-            })
+        query = query.order_by(Order.created_at.desc())
+        total_items = query.count()
+        orders = query.offset((page - 1) * limit).limit(limit).all()
+        orders_list = serialize_orders(orders)
 
         total_pages = (total_items + limit - 1) // limit if limit else 1
 
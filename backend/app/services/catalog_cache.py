@@ -0,0 +1,169 @@
+# app/services/catalog_cache.py – BlitzShop (caché en proceso del catálogo público)
+"""
+Caché TTL + LRU para las lecturas públicas del catálogo (listado, detalle y
+categorías).
+
+Las claves incluyen un contador de versión del catálogo; cualquier escritura
+de admin (create/update/delete/toggle) llama a ``bump_catalog_version`` y todo
+lo cacheado queda invalidado de golpe. La caché vive en cada proceso worker:
+los demás workers ven el cambio como mucho ``CATALOG_CACHE_TTL`` segundos
+después. El stock que muestra una entrada cacheada puede ir igual de atrasado;
+el checkout siempre valida contra la base de datos.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 60
+DEFAULT_MAXSIZE = 512
+# Fragmentos JSON por producto: la clave (id, updated_at) ya identifica el contenido
+DEFAULT_FRAGMENT_MAXSIZE = 5000
+FRAGMENT_TTL = 3600
+
+
+class TTLCache:
+    """LRU acotado por tamaño con expiración por entrada. Thread-safe."""
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < monotonic():
+                del self._data[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expired": self.expired,
+            }
+
+
+class CatalogCache:
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL, enabled=True,
+                 fragment_maxsize=DEFAULT_FRAGMENT_MAXSIZE):
+        self.enabled = enabled
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        # No se vacía en bump(): un cambio del producto cambia su updated_at y por tanto la clave
+        self.fragments = TTLCache(maxsize=fragment_maxsize, ttl=FRAGMENT_TTL)
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def bump(self):
+        with self._lock:
+            self.version += 1
+            self.entries.clear()
+            return self.version
+
+
+def init_app(app):
+    app.extensions["catalog_cache"] = CatalogCache(
+        maxsize=app.config.get("CATALOG_CACHE_MAXSIZE", DEFAULT_MAXSIZE),
+        ttl=app.config.get("CATALOG_CACHE_TTL", DEFAULT_TTL),
+        enabled=app.config.get("CATALOG_CACHE_ENABLED", True),
+        fragment_maxsize=app.config.get("PRODUCT_FRAGMENT_CACHE_MAXSIZE", DEFAULT_FRAGMENT_MAXSIZE),
+    )
+
+
+def _state() -> CatalogCache:
+    return current_app.extensions["catalog_cache"]
+
+
+def catalog_version() -> int:
+    return _state().version
+
+
+def key(kind: str, params) -> tuple:
+    """
+    Clave versionada. Se calcula al empezar la petición: si durante la consulta
+    llega un bump, el payload se guarda bajo la versión vieja y nunca se sirve.
+    """
+    return (kind, _state().version, params)
+
+
+def get(cache_key):
+    """Devuelve el payload cacheado o None."""
+    state = _state()
+    if not state.enabled:
+        return None
+    return state.entries.get(cache_key)
+
+
+def put(cache_key, value):
+    state = _state()
+    if state.enabled and cache_key[1] == state.version:
+        state.entries.set(cache_key, value)
+
+
+def get_fragment(fragment_key):
+    """JSON ya codificado de un producto, clave ``(id, updated_at)``."""
+    state = _state()
+    if not state.enabled:
+        return None
+    return state.fragments.get(fragment_key)
+
+
+def put_fragment(fragment_key, data: bytes):
+    state = _state()
+    if state.enabled:
+        state.fragments.set(fragment_key, data)
+
+
+def bump_catalog_version(reason: str = "") -> int:
+    """Invalida todo el catálogo cacheado. Llamar después del commit."""
+    version = _state().bump()
+    logger.info("[catalog_cache.bump] version=%s reason=%s", version, reason)
+    return version
+
+
+def stats():
+    state = _state()
+    return {
+        "enabled": state.enabled,
+        "version": state.version,
+        **state.entries.stats(),
+        "fragments": state.fragments.stats(),
+    }
@@ -0,0 +1,387 @@
+# app/services/catalog_import.py – BlitzShop (importación masiva de productos)
+"""
+Importación de catálogo en streaming (CSV o JSON lines) con upsert por lotes.
+
+Las filas se leen una a una del stream, se validan y se agrupan en lotes de
+``batch_size``. Cada lote cuesta unas pocas sentencias en vez de un
+SELECT + UPDATE/INSERT por fila:
+
+- ``key="shopify_product_id"``: ``INSERT ... ON CONFLICT (shopify_product_id)
+  DO UPDATE`` (PostgreSQL / SQLite) en una sola sentencia multi-VALUES.
+- ``key="name"`` (el nombre no es único en la BD): un ``SELECT ... WHERE name IN``
+  para separar existentes/nuevos, UPDATE por PK en executemany e INSERT en bloque.
+
+Cada lote se confirma por separado (una importación de 50k filas que falla a la
+mitad deja hechos los lotes anteriores). Si un lote falla en la BD se reintenta
+fila a fila con SAVEPOINT para aislar y reportar las filas culpables.
+"""
+import csv
+import io
+import json
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from time import perf_counter
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.models.product import Product
+from app.services import catalog_cache, search
+
+logger = logging.getLogger(__name__)
+
+IMPORT_KEYS = ("shopify_product_id", "name")
+FORMATS = ("csv", "ndjson")
+DEFAULT_BATCH_SIZE = 500
+MAX_BATCH_SIZE = 2000
+MAX_REPORTED_ERRORS = 1000
+
+# Columnas que el import puede escribir (el resto las gestiona el modelo)
+UPDATABLE_FIELDS = (
+    "name", "description", "price", "stock", "category",
+    "image_url", "is_active", "discount_percentage", "shopify_product_id",
+)
+
+_TRUE = {"1", "true", "yes", "y", "si", "sí", "on"}
+_FALSE = {"0", "false", "no", "n", "off", ""}
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+@dataclass
+class ImportResult:
+    key: str
+    batch_size: int
+    processed: int = 0
+    inserted: int = 0
+    updated: int = 0
+    failed: int = 0
+    batches: int = 0
+    errors: list = field(default_factory=list)
+    elapsed_ms: float = 0.0
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def to_dict(self, include_errors=True):
+        data = {
+            "key": self.key,
+            "batch_size": self.batch_size,
+            "processed": self.processed,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "failed": self.failed,
+            "batches": self.batches,
+            "elapsed_ms": round(self.elapsed_ms, 2),
+        }
+        if include_errors:
+            data["errors"] = self.errors
+            data["errors_truncated"] = self.failed > len(self.errors)
+        return data
+
+
+# -----------------------------
+# Lectura
+# -----------------------------
+
+def detect_format(filename: str | None = None, content_type: str | None = None) -> str:
+    name = (filename or "").lower()
+    ctype = (content_type or "").lower()
+    if name.endswith((".jsonl", ".ndjson", ".json")) or "json" in ctype:
+        return "ndjson"
+    return "csv"
+
+
+def iter_rows(stream, fmt: str):
+    """
+    Genera ``(nº de línea, dict | ImportRowError)`` sin cargar el fichero entero.
+    ``stream`` puede ser binario o de texto.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    if not isinstance(stream, io.TextIOBase):
+        if isinstance(stream, io.RawIOBase):
+            stream = io.BufferedReader(stream)
+        stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError as e:
+            yield line_no, ImportRowError(f"Invalid JSON: {e}")
+            continue
+        if not isinstance(obj, dict):
+            yield line_no, ImportRowError("Each line must be a JSON object")
+            continue
+        yield line_no, obj
+
+
+def _clean(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+def _to_bool(value, default=True):
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise ImportRowError(f"Invalid boolean: {value!r}")
+
+
+def normalize_row(raw: dict, key: str) -> dict:
+    """Valida una fila y devuelve solo las columnas presentes (ausente = no tocar)."""
+    row = {}
+    name = _clean(raw.get("name"))
+    if name is not None:
+        row["name"] = str(name)[:200]
+
+    if _clean(raw.get("price")) is not None:
+        try:
+            price = Decimal(str(_clean(raw.get("price"))))
+        except (InvalidOperation, TypeError, ValueError):
+            raise ImportRowError(f"Invalid price: {raw.get('price')!r}")
+        if not price.is_finite():
+            raise ImportRowError(f"Invalid price: {raw.get('price')!r}")
+        if price < 0:
+            raise ImportRowError("Price cannot be negative")
+        row["price"] = price
+
+    stock_raw = raw.get("stock", raw.get("stock_quantity"))
+    if stock_raw is not None and _clean(stock_raw) is not None:
+        try:
+            row["stock"] = max(0, int(Decimal(str(_clean(stock_raw)))))
+        except (InvalidOperation, TypeError, ValueError):
+            raise ImportRowError(f"Invalid stock: {stock_raw!r}")
+
+    if "discount_percentage" in raw and _clean(raw.get("discount_percentage")) is not None:
+        try:
+            discount = int(str(_clean(raw.get("discount_percentage"))))
+        except (TypeError, ValueError):
+            raise ImportRowError(f"Invalid discount_percentage: {raw.get('discount_percentage')!r}")
+        row["discount_percentage"] = discount if 0 <= discount <= 99 else 0
+
+    for col in ("description", "category", "image_url"):
+        if col in raw:
+            row[col] = _clean(raw.get(col))
+    if "is_active" in raw:
+        row["is_active"] = _to_bool(_clean(raw.get("is_active")))
+
+    shopify_id = _clean(raw.get("shopify_product_id"))
+    if shopify_id is not None:
+        row["shopify_product_id"] = str(shopify_id)[:100]
+
+    if key == "shopify_product_id" and "shopify_product_id" not in row:
+        raise ImportRowError("shopify_product_id is required (key=shopify_product_id)")
+    if key == "name" and "name" not in row:
+        raise ImportRowError("name is required (key=name)")
+    return row
+
+
+def _insert_defaults(row: dict) -> dict:
+    """Una fila nueva necesita name y price; el resto toma los defaults del modelo."""
+    if "name" not in row or "price" not in row:
+        raise ImportRowError("name and price are required for new products")
+    now = datetime.now(timezone.utc)
+    return {
+        "description": None, "stock": 0, "category": None, "image_url": None,
+        "is_active": True, "discount_percentage": 0, "shopify_product_id": None,
+        **row, "created_at": now, "updated_at": now,
+    }
+
+
+# -----------------------------
+# Escritura por lotes
+# -----------------------------
+
+def _dialect() -> str:
+    return db.engine.dialect.name
+
+
+def _split_batch(batch, key):
+    """
+    Un SELECT por lote separa filas existentes y nuevas. Las nuevas sin
+    name/price se reportan aquí sin tumbar el lote entero.
+    """
+    key_col = getattr(Product, key)
+    keys = [row[key] for _, row in batch]
+    existing = set(db.session.scalars(select(key_col).where(key_col.in_(keys))))
+
+    new_rows, old_rows, invalid = [], [], []
+    for line, row in batch:
+        if row[key] in existing:
+            old_rows.append(row)
+            continue
+        try:
+            new_rows.append(_insert_defaults(row))
+        except ImportRowError as e:
+            invalid.append((line, str(e)))
+    return new_rows, old_rows, invalid
+
+
+def _insert_new(new_rows, key):
+    """INSERT en bloque; por shopify_product_id con ON CONFLICT DO UPDATE (PostgreSQL / SQLite)."""
+    dialect = _dialect()
+    if key == "shopify_product_id" and dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(Product.__table__).values(new_rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Product.shopify_product_id],
+            set_={c: stmt.excluded[c] for c in UPDATABLE_FIELDS + ("updated_at",) if c != key},
+        ).returning(Product.id)
+        return list(db.session.execute(stmt).scalars())
+    return list(db.session.scalars(insert(Product).returning(Product.id), new_rows))
+
+
+def _update_existing(rows, key):
+    """UPDATE por PK en executemany (agrupado por conjunto de columnas)."""
+    key_col = getattr(Product, key)
+    keys = [r[key] for r in rows]
+    id_map = {}
+    for pid, k in db.session.execute(select(Product.id, key_col).where(key_col.in_(keys))):
+        id_map.setdefault(k, []).append(pid)
+
+    now = datetime.now(timezone.utc)
+    by_shape = {}
+    for r in rows:
+        # key=name: el nombre no es único, se actualizan todas las coincidencias
+        for pid in id_map.get(r[key], ()):
+            params = {**r, "id": pid, "updated_at": now}
+            by_shape.setdefault(tuple(sorted(params)), []).append(params)
+
+    ids = []
+    for params_list in by_shape.values():
+        db.session.execute(update(Product), params_list)
+        ids.extend(p["id"] for p in params_list)
+    return ids
+
+
+def _write_batch(batch, key):
+    """Devuelve (insertados, actualizados, [(línea, error)]). No hace commit."""
+    new_rows, old_rows, invalid = _split_batch(batch, key)
+    ids = []
+    if new_rows:
+        ids.extend(_insert_new(new_rows, key))
+    if old_rows:
+        ids.extend(_update_existing(old_rows, key))
+    db.session.flush()
+    search.sync_products(ids)
+    return len(new_rows), len(old_rows), invalid
+
+
+def _flush_batch(batch, key, result):
+    if not batch:
+        return
+    try:
+        inserted, updated, invalid = _write_batch(batch, key)
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.warning("[catalog_import.batch.retry] rows=%s err=%s", len(batch), str(e).splitlines()[0])
+        # Fila a fila con SAVEPOINT para reportar exactamente qué falló
+        inserted = updated = 0
+        invalid = []
+        for line, row in batch:
+            try:
+                with db.session.begin_nested():
+                    ins, upd, bad = _write_batch([(line, row)], key)
+                inserted += ins
+                updated += upd
+                invalid.extend(bad)
+            except SQLAlchemyError as row_err:
+                invalid.append((line, str(row_err).splitlines()[0]))
+        db.session.commit()
+
+    result.inserted += inserted
+    result.updated += updated
+    for line, message in sorted(invalid):
+        result.add_error(line, message)
+    result.batches += 1
+
+
+def start_import(key: str = "shopify_product_id", batch_size: int = DEFAULT_BATCH_SIZE) -> ImportResult:
+    if key not in IMPORT_KEYS:
+        raise ValueError(f"key must be one of {IMPORT_KEYS}")
+    batch_size = max(1, min(int(batch_size or DEFAULT_BATCH_SIZE), MAX_BATCH_SIZE))
+    return ImportResult(key=key, batch_size=batch_size)
+
+
+def import_batches(rows, result: ImportResult):
+    """
+    Generador que hace la importación y cede ``result`` tras cada lote
+    confirmado (para reportar progreso en streaming). ``rows`` es un iterable
+    de ``(línea, dict)`` como el de ``iter_rows``. Invalida la caché del
+    catálogo una sola vez al final.
+    """
+    key = result.key
+    t0 = perf_counter()
+    # Dentro de un lote, la última fila de cada clave gana (ON CONFLICT no
+    # puede tocar la misma fila dos veces en una sentencia)
+    batch = {}
+    try:
+        for line, raw in rows:
+            result.processed += 1
+            try:
+                if isinstance(raw, Exception):
+                    raise raw
+                row = normalize_row(raw, key)
+            except ImportRowError as e:
+                result.add_error(line, str(e))
+                continue
+            batch[row[key]] = (line, row)
+            if len(batch) >= result.batch_size:
+                _flush_batch(list(batch.values()), key, result)
+                batch = {}
+                result.elapsed_ms = (perf_counter() - t0) * 1000
+                yield result
+        if batch:
+            _flush_batch(list(batch.values()), key, result)
+            result.elapsed_ms = (perf_counter() - t0) * 1000
+            yield result
+    finally:
+        result.elapsed_ms = (perf_counter() - t0) * 1000
+        if result.inserted or result.updated:
+            catalog_cache.bump_catalog_version("catalog_import")
+        logger.info(
+            "[catalog_import.ok] key=%s processed=%s inserted=%s updated=%s failed=%s batches=%s ms=%.2f",
+            key, result.processed, result.inserted, result.updated, result.failed, result.batches,
+            result.elapsed_ms,
+        )
+
+
+def import_products(rows, key: str = "shopify_product_id", batch_size: int = DEFAULT_BATCH_SIZE,
+                    progress=None) -> ImportResult:
+    """Versión bloqueante de ``import_batches``; ``progress(result)`` se llama tras cada lote."""
+    result = start_import(key, batch_size)
+    for _ in import_batches(rows, result):
+        if progress:
+            progress(result)
+    return result
@@ -0,0 +1,151 @@
+# app/services/checkout.py – BlitzShop (checkout: carrito -> orden con descuento de stock atómico)
+"""
+Creación de órdenes a partir del carrito sin sobreventa bajo concurrencia.
+
+1. Una consulta trae las líneas del carrito con precio/nombre/stock del producto.
+2. En PostgreSQL se bloquean las filas de producto con ``SELECT ... FOR UPDATE``
+   en orden de id (orden determinista: dos checkouts con productos cruzados no
+   se bloquean mutuamente en ciclo).
+3. Un único ``UPDATE products SET stock = stock - CASE id ... END WHERE id IN (...)
+   AND stock >= CASE id ... END`` descuenta todas las líneas. Si el número de filas
+   afectadas no coincide con el de productos, algún stock no alcanzaba: rollback
+   y no se crea nada. La condición la evalúa la BD sobre el valor vigente, así
+   que dos checkouts simultáneos no pueden dejar el stock en negativo.
+4. Orden + items (INSERT en bloque) + vaciado del carrito + evento
+   ``order.created`` en el outbox, todo en la misma transacción.
+"""
+import logging
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from sqlalchemy import case, insert, select, update
+
+from app import db
+from app.models.cart import CartItem
+from app.models.order import Order, OrderItem
+from app.models.product import Product
+from app.services import outbox
+
+logger = logging.getLogger(__name__)
+
+
+class CheckoutError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _cart_lines(user_id):
+    return (
+        db.session.query(
+            CartItem.product_id,
+            CartItem.quantity,
+            Product.name,
+            Product.price,
+            Product.image_url,
+            Product.stock,
+            Product.is_active,
+        )
+        .outerjoin(Product, Product.id == CartItem.product_id)
+        .filter(CartItem.user_id == user_id)
+        .order_by(CartItem.product_id)
+        .all()
+    )
+
+
+def _lock_products(product_ids):
+    """FOR UPDATE en orden de id (solo PostgreSQL; SQLite bloquea la BD entera al escribir)."""
+    if db.engine.dialect.name != "postgresql":
+        return
+    db.session.execute(
+        select(Product.id).where(Product.id.in_(product_ids)).order_by(Product.id).with_for_update()
+    ).all()
+
+
+def decrement_stock(quantities: dict):
+    """
+    ``{product_id: qty}`` -> descuenta todo o nada con un UPDATE condicional.
+    Devuelve la lista de product_id sin stock suficiente (vacía si se aplicó).
+    """
+    qty_case = case(quantities, value=Product.id)
+    result = db.session.execute(
+        update(Product)
+        .where(
+            Product.id.in_(list(quantities)),
+            Product.is_active.isnot(False),
+            Product.stock >= qty_case,
+        )
+        .values(stock=Product.stock - qty_case, updated_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == len(quantities):
+        return []
+
+    # No se aplicó entero: averiguar qué líneas fallan (para el mensaje) y deshacer
+    rows = db.session.execute(
+        select(Product.id, Product.stock, Product.is_active).where(Product.id.in_(list(quantities)))
+    ).all()
+    by_id = {r.id: r for r in rows}
+    return [
+        pid for pid, qty in quantities.items()
+        if pid not in by_id or by_id[pid].is_active is False or (by_id[pid].stock or 0) < qty
+    ] or list(quantities)
+
+
+def place_order(user_id, shipping_address=None, billing_address=None) -> Order:
+    """Crea la orden desde el carrito y hace commit. Lanza CheckoutError si no es posible."""
+    lines = _cart_lines(user_id)
+    if not lines:
+        raise CheckoutError("Cart is empty")
+
+    total_amount = Decimal("0")
+    quantities = {}
+    items_data = []
+    for line in lines:
+        if line.name is None or line.is_active is False:
+            raise CheckoutError(f"Product not available (id={line.product_id})")
+        # Comprobación previa barata; la definitiva la hace el UPDATE condicional
+        if (line.stock or 0) < line.quantity:
+            raise CheckoutError(f"Insufficient stock for {line.name}")
+
+        unit_price = line.price if isinstance(line.price, Decimal) else Decimal(str(line.price))
+        total_amount += unit_price * line.quantity
+        quantities[line.product_id] = quantities.get(line.product_id, 0) + line.quantity
+        items_data.append({
+            "product_id": line.product_id,
+            "product_name": line.name,
+            "product_image_url": line.image_url,
+            "unit_price": unit_price,
+            "quantity": line.quantity,
+        })
+
+    try:
+        _lock_products(sorted(quantities))
+        failed = decrement_stock(quantities)
+        if failed:
+            names = {line.product_id: line.name for line in lines}
+            db.session.rollback()
+            logger.info("[checkout.stock_conflict] user_id=%s products=%s", user_id, failed)
+            raise CheckoutError(f"Insufficient stock for {names.get(failed[0], failed[0])}")
+
+        order = Order(
+            user_id=user_id,
+            total_amount=total_amount,
+            shipping_address=shipping_address,
+            billing_address=billing_address,
+        )
+        db.session.add(order)
+        db.session.flush()  # asegura order.id
+
+        db.session.execute(insert(OrderItem), [{**item, "order_id": order.id} for item in items_data])
+        CartItem.query.filter_by(user_id=user_id).delete(synchronize_session=False)
+        # Efectos secundarios (alertas de stock, ...) los ejecuta el worker del outbox
+        outbox.enqueue("order.created", {"order_id": order.id}, aggregate_type="order", aggregate_id=order.id)
+        db.session.commit()
+    except CheckoutError:
+        raise
+    except Exception:
+        db.session.rollback()
+        raise
+    return order
@@ -0,0 +1,133 @@
+# app/services/compression.py – BlitzShop (compresión gzip / brotli de respuestas)
+"""
+Compresión de respuestas en ``after_request``.
+
+- Negocia por ``Accept-Encoding``: brotli (si el paquete ``brotli`` está
+  instalado y el cliente lo acepta) o gzip.
+- Solo tipos de texto/JSON (``COMPRESS_MIMETYPES``); PDFs, imágenes, ZIPs y
+  ficheros servidos con ``send_file`` (``direct_passthrough``) pasan tal cual.
+- Respuestas pequeñas (< ``COMPRESS_MIN_SIZE`` bytes) no se comprimen.
+- Respuestas en streaming se comprimen trozo a trozo con flush en cada uno,
+  para que el progreso NDJSON siga llegando al cliente a tiempo.
+- El ETag pasa a débil (W/): el mismo recurso tiene ahora varias codificaciones.
+"""
+import gzip
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+    BROTLI_SUPPORT = True
+except ImportError:
+    brotli = None
+    BROTLI_SUPPORT = False
+
+DEFAULT_MIMETYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/html",
+    "text/plain",
+    "text/css",
+    "text/csv",
+    "text/xml",
+)
+
+
+def _choose_encoding(config):
+    accepted = request.accept_encodings
+    if BROTLI_SUPPORT and config.get("COMPRESS_BROTLI", True) and accepted.quality("br") > 0:
+        return "br"
+    if accepted.quality("gzip") > 0:
+        return "gzip"
+    return None
+
+
+def _add_vary(response):
+    response.vary.add("Accept-Encoding")
+
+
+def _weaken_etag(response):
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+
+def _compress_stream(chunks, encoding, config):
+    try:
+        yield from _compress_chunks(chunks, encoding, config)
+    finally:
+        # Cierra el iterable original (p.ej. stream_with_context libera su contexto)
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def _compress_chunks(chunks, encoding, config):
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=config.get("COMPRESS_BR_LEVEL", 4))
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+        return
+
+    compressor = zlib.compressobj(config.get("COMPRESS_LEVEL", 6), zlib.DEFLATED, 31)  # 31 = formato gzip
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def compress_response(response, config):
+    if not config.get("COMPRESS_ENABLED", True):
+        return response
+    if response.mimetype not in config.get("COMPRESS_MIMETYPES", DEFAULT_MIMETYPES):
+        return response
+
+    # El cuerpo depende de Accept-Encoding aunque esta vez no se comprima (tamaño, 304...)
+    _add_vary(response)
+
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+        or request.method == "HEAD"
+    ):
+        return response
+
+    encoding = _choose_encoding(config)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding, config)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < config.get("COMPRESS_MIN_SIZE", 1024):
+            return response
+        if encoding == "br":
+            data = brotli.compress(data, quality=config.get("COMPRESS_BR_LEVEL", 4))
+        else:
+            data = gzip.compress(data, compresslevel=config.get("COMPRESS_LEVEL", 6), mtime=0)
+        response.set_data(data)
+
+    response.headers["Content-Encoding"] = encoding
+    _weaken_etag(response)
+    return response
+
+
+def init_app(app):
+    @app.after_request
+    def _compress(response):
+        return compress_response(response, app.config)
@@ -0,0 +1,82 @@
+# app/services/facets.py – BlitzShop (facetas del listado de productos)
+"""
+Conteos por faceta (categoría, rango de precio, en stock) para el filtro actual.
+
+Todo sale de UNA consulta ``GROUP BY`` sobre la query ya filtrada: se agrupa
+solo por las dimensiones pedidas y el reparto en histogramas se hace en Python
+sobre unas pocas filas. Los conteos son del conjunto filtrado completo (no de
+la página actual).
+"""
+from flask import request
+from sqlalchemy import case, func, literal
+
+from app.models.product import Product
+
+FACETS = ("category", "price", "in_stock")
+
+# Límites de los rangos de precio; el último rango es abierto (500+)
+PRICE_BUCKETS = (0, 25, 50, 100, 250, 500)
+
+
+def requested_facets():
+    """``facets=category,price,in_stock`` -> tupla ordenada de facetas válidas."""
+    raw = request.args.get("facets") or ""
+    wanted = {f.strip().lower() for f in raw.split(",") if f.strip()}
+    return tuple(f for f in FACETS if f in wanted)
+
+
+def _price_bucket_expr():
+    whens = [(Product.price < upper, idx) for idx, upper in enumerate(PRICE_BUCKETS[1:])]
+    return case(*whens, else_=len(PRICE_BUCKETS) - 1)
+
+
+def _bucket_bounds(idx):
+    upper = PRICE_BUCKETS[idx + 1] if idx + 1 < len(PRICE_BUCKETS) else None
+    return PRICE_BUCKETS[idx], upper
+
+
+def compute_facets(query, facets):
+    """``query`` es la consulta de productos ya filtrada (sin ORDER BY/LIMIT)."""
+    if not facets:
+        return {}
+
+    exprs = {
+        "category": Product.category,
+        "price": _price_bucket_expr(),
+        "in_stock": case((Product.stock > 0, True), else_=False),
+    }
+    group_cols = [exprs[f].label(f) for f in facets]
+    rows = (
+        query.order_by(None)
+        .with_entities(*group_cols, func.count(literal(1)).label("n"))
+        .group_by(*[exprs[f] for f in facets])
+        .all()
+    )
+
+    categories, buckets, stock = {}, {}, {"true": 0, "false": 0}
+    for row in rows:
+        values = dict(zip(facets, row[:-1]))
+        n = int(row[-1] or 0)
+        if "category" in values and values["category"]:
+            categories[values["category"]] = categories.get(values["category"], 0) + n
+        if "price" in values and values["price"] is not None:
+            idx = int(values["price"])
+            buckets[idx] = buckets.get(idx, 0) + n
+        if "in_stock" in values:
+            key = "true" if values["in_stock"] else "false"
+            stock[key] += n
+
+    result = {}
+    if "category" in facets:
+        result["category"] = [
+            {"value": name, "count": count}
+            for name, count in sorted(categories.items(), key=lambda kv: (-kv[1], kv[0]))
+        ]
+    if "price" in facets:
+        result["price"] = []
+        for idx in range(len(PRICE_BUCKETS)):
+            low, high = _bucket_bounds(idx)
+            result["price"].append({"min": low, "max": high, "count": buckets.get(idx, 0)})
+    if "in_stock" in facets:
+        result["in_stock"] = stock
+    return result
@@ -0,0 +1,92 @@
+# app/services/http_cache.py – BlitzShop (GET condicional: ETag / Last-Modified)
+"""
+Validadores HTTP para los endpoints públicos del catálogo.
+
+El ETag se calcula con datos baratos de la base de datos (``COUNT`` +
+``MAX(updated_at)``) y los parámetros de la petición, *antes* de cargar y
+serializar filas: si el cliente/CDN ya tiene esa versión se responde 304 sin
+cuerpo. Al depender solo de la BD, todos los workers generan el mismo ETag
+para el mismo estado (la versión en proceso de ``catalog_cache`` no sirve
+para eso: cada worker lleva su propio contador).
+
+Si el formato del payload cambia, subir ``PAYLOAD_VERSION`` para invalidar
+los ETags que tengan guardados los clientes.
+"""
+import hashlib
+from collections import namedtuple
+from datetime import timezone
+
+from flask import Response, request
+from sqlalchemy import func
+
+from app import db
+
+PAYLOAD_VERSION = "1"
+CACHE_CONTROL = "public, max-age=0, must-revalidate"
+
+Validators = namedtuple("Validators", ["etag", "last_modified"])
+
+
+def _as_utc(dt):
+    """Los DateTime se guardan naive en UTC; HTTP trabaja con segundos enteros."""
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def table_fingerprint(model, *criteria, related=None):
+    """
+    ``(count, max(updated_at))`` de ``model`` en una sola consulta agregada.
+
+    Sin criterios cubre toda la tabla (incluidos inactivos): una baja lógica
+    toca ``updated_at`` y una baja física cambia el ``count``.
+
+    ``related=(Modelo, onclause)``: relación many-to-one cuyos campos también
+    salen en el payload (p.ej. el autor de cada review). Se une con LEFT JOIN
+    (no cambia el ``count``) y su ``MAX(updated_at)`` entra en el resultado.
+    """
+    columns = [func.count(model.id), func.max(model.updated_at)]
+    if related is not None:
+        columns.append(func.max(related[0].updated_at))
+    stmt = db.session.query(*columns).select_from(model)
+    if related is not None:
+        stmt = stmt.outerjoin(related[0], related[1])
+    if criteria:
+        stmt = stmt.filter(*criteria)
+    count, *updated = stmt.one()
+    updated = [dt for dt in updated if dt is not None]
+    last_updated = max(updated, key=lambda dt: dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)) if updated else None
+    return int(count or 0), last_updated
+
+
+def build_validators(kind: str, params, count, last_updated) -> Validators:
+    raw = repr((PAYLOAD_VERSION, kind, params, count, last_updated.isoformat() if last_updated else None))
+    etag = hashlib.sha1(raw.encode()).hexdigest()[:32]
+    return Validators(etag, _as_utc(last_updated))
+
+
+def is_not_modified(validators: Validators) -> bool:
+    """
+    RFC 9110: si viene If-None-Match se ignora If-Modified-Since.
+    If-None-Match usa comparación débil (una respuesta comprimida con ETag W/ sigue valiendo).
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(validators.etag)
+    ims = request.if_modified_since
+    if ims is not None and validators.last_modified is not None:
+        return validators.last_modified <= ims
+    return False
+
+
+def apply_validators(response: Response, validators: Validators) -> Response:
+    response.set_etag(validators.etag)
+    if validators.last_modified is not None:
+        response.last_modified = validators.last_modified
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return response
+
+
+def not_modified_response(validators: Validators) -> Response:
+    return apply_validators(Response(status=304), validators)
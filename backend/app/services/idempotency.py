@@ -0,0 +1,293 @@
+# app/services/idempotency.py – BlitzShop (cabecera Idempotency-Key)
+"""
+Peticiones idempotentes por cabecera ``Idempotency-Key``.
+
+``@idempotent`` (debajo de ``@jwt_required()``) guarda la respuesta de la
+primera petición con una clave y la devuelve tal cual (``Idempotent-Replayed:
+true``) a los reintentos con la misma clave, sin volver a ejecutar la vista:
+
+- La clave se reclama con un INSERT sobre ``(scope, key)`` único; scope =
+  endpoint + usuario, así dos usuarios no comparten claves.
+- Un duplicado concurrente espera a que termine la petición en curso (hasta
+  ``IDEMPOTENCY_WAIT_TIMEOUT`` s, luego 409) y recibe su misma respuesta.
+- Misma clave con otro cuerpo/ruta -> 422.
+- Respuestas 5xx o excepciones liberan la clave: el reintento se ejecuta.
+- Una clave ``in_progress`` más vieja que ``IDEMPOTENCY_LOCK_TIMEOUT`` (worker
+  caído) se puede volver a reclamar.
+- Las filas caducan a las ``IDEMPOTENCY_TTL`` s; ``sweep_expired`` las borra
+  (cada ``IDEMPOTENCY_SWEEP_INTERVAL`` s desde las propias peticiones y con
+  ``python -m scripts.sweep_idempotency_keys`` desde cron).
+
+Sin cabecera la vista se ejecuta normalmente.
+
+La tabla se escribe con conexiones propias (``db.engine.begin()``), fuera de
+la transacción de la vista, para que un rollback de la vista no se lleve la
+reserva de la clave.
+"""
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+
+from flask import current_app, g, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.idempotency import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+DEFAULT_TTL = 24 * 3600
+DEFAULT_WAIT_TIMEOUT = 10
+DEFAULT_LOCK_TIMEOUT = 60
+DEFAULT_SWEEP_INTERVAL = 300
+
+_table = IdempotencyKey.__table__
+_sweep_lock = threading.Lock()
+_last_sweep = 0.0
+# Peticiones en curso en este proceso: los duplicados locales despiertan al
+# terminar en vez de esperar al siguiente sondeo de la BD
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _config(name, default):
+    return current_app.config.get(name, default)
+
+
+def _error(status, error, message=None):
+    payload = {"error": error}
+    if message:
+        payload["message"] = message
+    return jsonify(payload), status
+
+
+def current_key():
+    """Clave de la petición en curso (para reenviarla p.ej. a Stripe) o None."""
+    return g.get("idempotency_key")
+
+
+def _request_hash():
+    h = hashlib.sha256()
+    h.update(request.method.encode())
+    h.update(b"\0")
+    h.update(request.full_path.encode())
+    h.update(b"\0")
+    h.update(request.get_data(cache=True))
+    return h.hexdigest()
+
+
+def _scope():
+    try:
+        identity = get_jwt_identity()
+    except Exception:
+        identity = None
+    return f"{request.endpoint}:{identity or '-'}"[:200]
+
+
+def _load(scope, key):
+    with db.engine.connect() as conn:
+        return conn.execute(
+            select(_table).where(_table.c.scope == scope, _table.c.key == key)
+        ).first()
+
+
+def _claim(scope, key, request_hash):
+    now = _utcnow()
+    try:
+        with db.engine.begin() as conn:
+            row_id = conn.execute(
+                insert(_table).values(
+                    scope=scope,
+                    key=key,
+                    request_hash=request_hash,
+                    status="in_progress",
+                    locked_at=now,
+                    created_at=now,
+                    expires_at=now + timedelta(seconds=_config("IDEMPOTENCY_TTL", DEFAULT_TTL)),
+                )
+            ).inserted_primary_key[0]
+        return row_id
+    except IntegrityError:
+        return None
+
+
+def _take_over(row, request_hash):
+    """Reclama una fila caducada o abandonada; solo gana uno (UPDATE condicional)."""
+    now = _utcnow()
+    with db.engine.begin() as conn:
+        result = conn.execute(
+            update(_table)
+            .where(_table.c.id == row.id, _table.c.locked_at == row.locked_at, _table.c.status == row.status)
+            .values(
+                request_hash=request_hash,
+                status="in_progress",
+                response_status=None,
+                response_mimetype=None,
+                response_body=None,
+                locked_at=now,
+                expires_at=now + timedelta(seconds=_config("IDEMPOTENCY_TTL", DEFAULT_TTL)),
+            )
+        )
+    return row.id if result.rowcount == 1 else None
+
+
+def _complete(row_id, response):
+    with db.engine.begin() as conn:
+        conn.execute(
+            update(_table)
+            .where(_table.c.id == row_id)
+            .values(
+                status="completed",
+                response_status=response.status_code,
+                response_mimetype=response.mimetype,
+                response_body=response.get_data(),
+            )
+        )
+
+
+def _release(row_id):
+    with db.engine.begin() as conn:
+        conn.execute(delete(_table).where(_table.c.id == row_id, _table.c.status == "in_progress"))
+
+
+def _replay(row):
+    response = current_app.response_class(row.response_body or b"", status=row.response_status,
+                                          mimetype=row.response_mimetype)
+    response.headers[REPLAYED_HEADER] = "true"
+    return response
+
+
+def sweep_expired(now=None):
+    """Borra claves caducadas y reservas abandonadas. Devuelve las filas borradas."""
+    now = now or _utcnow()
+    stale = now - timedelta(seconds=_config("IDEMPOTENCY_LOCK_TIMEOUT", DEFAULT_LOCK_TIMEOUT))
+    with db.engine.begin() as conn:
+        deleted = conn.execute(
+            delete(_table).where(
+                (_table.c.expires_at < now)
+                | ((_table.c.status == "in_progress") & (_table.c.locked_at < stale))
+            )
+        ).rowcount
+    if deleted:
+        logger.info("[idempotency.sweep] deleted=%s", deleted)
+    return deleted
+
+
+def _maybe_sweep():
+    global _last_sweep
+    interval = _config("IDEMPOTENCY_SWEEP_INTERVAL", DEFAULT_SWEEP_INTERVAL)
+    if not interval or time.monotonic() - _last_sweep < interval:
+        return
+    if not _sweep_lock.acquire(blocking=False):
+        return
+    try:
+        _last_sweep = time.monotonic()
+        sweep_expired()
+    except Exception as e:
+        logger.warning("[idempotency.sweep.error] err=%s", e)
+    finally:
+        _sweep_lock.release()
+
+
+def _acquire(scope, key, request_hash):
+    """
+    Devuelve ("run", row_id) si esta petición debe ejecutar la vista,
+    ("replay", row) si ya hay respuesta guardada o ("error", response).
+    """
+    deadline = time.monotonic() + _config("IDEMPOTENCY_WAIT_TIMEOUT", DEFAULT_WAIT_TIMEOUT)
+    lock_timeout = timedelta(seconds=_config("IDEMPOTENCY_LOCK_TIMEOUT", DEFAULT_LOCK_TIMEOUT))
+    delay = 0.02
+    while True:
+        row_id = _claim(scope, key, request_hash)
+        if row_id is not None:
+            return "run", row_id
+
+        row = _load(scope, key)
+        if row is None:
+            continue  # liberada entre el INSERT y la lectura: reintentar
+        now = _utcnow()
+        if row.expires_at < now or (row.status == "in_progress" and row.locked_at < now - lock_timeout):
+            row_id = _take_over(row, request_hash)
+            if row_id is not None:
+                return "run", row_id
+            continue
+        if row.request_hash != request_hash:
+            return "error", _error(422, "Idempotency-Key reused",
+                                   "This Idempotency-Key was already used with a different request")
+        if row.status == "completed":
+            return "replay", row
+
+        # En curso en otra petición: esperar a que termine
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return "error", _error(409, "Request in progress",
+                                   "A request with this Idempotency-Key is still being processed")
+        with _inflight_lock:
+            event = _inflight.get((scope, key))
+        if event is not None:
+            event.wait(min(remaining, 1.0))
+        else:
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.25)
+
+
+def idempotent(fn):
+    """Decorador de vistas POST: ver docstring del módulo."""
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = (request.headers.get(HEADER) or "").strip()
+        if not key:
+            return fn(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return _error(400, "Invalid Idempotency-Key", f"Maximum length is {MAX_KEY_LENGTH}")
+
+        t0 = time.perf_counter()
+        _maybe_sweep()
+        scope = _scope()
+        action, value = _acquire(scope, key, _request_hash())
+        if action == "replay":
+            logger.info("[idempotency.replay] scope=%s status=%s ms=%.2f",
+                        scope, value.response_status, (time.perf_counter() - t0) * 1000)
+            return _replay(value)
+        if action == "error":
+            return value
+
+        row_id = value
+        event = threading.Event()
+        with _inflight_lock:
+            _inflight[(scope, key)] = event
+        g.idempotency_key = key
+        try:
+            response = make_response(fn(*args, **kwargs))
+            # Cerrar la transacción de la vista antes de escribir con otra conexión
+            # (en SQLite un lector abierto bloquearía la escritura)
+            db.session.rollback()
+            if response.status_code >= 500 or response.is_streamed:
+                _release(row_id)
+            else:
+                _complete(row_id, response)
+            return response
+        except Exception:
+            db.session.rollback()
+            _release(row_id)
+            raise
+        finally:
+            with _inflight_lock:
+                _inflight.pop((scope, key), None)
+            event.set()
+
+    return wrapper
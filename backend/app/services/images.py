@@ -0,0 +1,199 @@
+# app/services/images.py – BlitzShop (procesado de imágenes de producto)
+"""
+Pipeline de imágenes de producto con Pillow, fuera del hilo de la petición.
+
+El admin sube la imagen, se guarda el original tal cual (rápido) y se encola
+un trabajo en un pool de hilos que genera las variantes ``thumb``/``medium``/
+``large`` en WebP y JPEG:
+
+- orientación EXIF aplicada y metadatos eliminados (se re-codifica sin EXIF/ICC),
+- nombres por hash del contenido (``<sha256>_<variante>.<ext>``): la misma
+  imagen subida dos veces no se procesa dos veces y las URLs son inmutables,
+- al terminar se rellena ``product.image_variants`` y ``image_url`` pasa a la
+  variante ``large`` en JPEG (compatible con cualquier cliente); el original
+  subido se borra salvo que otro producto lo siga usando.
+
+Pillow libera el GIL al redimensionar/codificar, así que un pool de hilos es
+suficiente. ``IMAGE_PROCESSING_ASYNC=false`` procesa en línea (scripts/tests).
+"""
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from flask import current_app
+from PIL import Image, ImageOps
+
+from app import db
+from app.models.product import Product
+from app.services import catalog_cache
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_FOLDER = os.path.join("static", "uploads")
+
+# (nombre, lado máximo en px); thumbnail() nunca amplía
+VARIANTS = (("thumb", 160), ("medium", 480), ("large", 1200))
+
+# (extensión, formato Pillow, opciones de guardado)
+OUTPUT_FORMATS = (
+    ("webp", "WEBP", {"quality": 80, "method": 4}),
+    ("jpg", "JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def upload_folder():
+    return current_app.config.get("UPLOAD_FOLDER", UPLOAD_FOLDER)
+
+
+def public_url(filename: str) -> str:
+    prefix = current_app.config.get("UPLOAD_URL_PREFIX", "http://localhost:5000/static/uploads")
+    return f"{prefix.rstrip('/')}/{filename}"
+
+
+def is_local_upload(url) -> bool:
+    """La URL apunta a un fichero subido a ``upload_folder()`` (``UPLOAD_URL_PREFIX``)."""
+    return bool(url) and url.startswith(public_url(""))
+
+
+def remove_original(url, path=None, exclude_product_id=None) -> bool:
+    """
+    Borra el original subido de ``url`` si ningún producto (salvo
+    ``exclude_product_id``) lo referencia. Solo para originales: las variantes
+    van por hash de contenido y pueden compartirse.
+    """
+    if path is None:
+        if not is_local_upload(url):
+            return False
+        path = os.path.join(upload_folder(), os.path.basename(url))
+    in_use = Product.query.filter(Product.image_url == url)
+    if exclude_product_id is not None:
+        in_use = in_use.filter(Product.id != exclude_product_id)
+    if db.session.query(in_use.exists()).scalar():
+        return False
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        logger.warning("[images.original.remove_error] path=%s err=%s", path, e)
+        return False
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:24]
+
+
+def _prepare(im):
+    """Modo apto para WebP (RGB/RGBA) conservando transparencia."""
+    has_alpha = im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info)
+    return im.convert("RGBA" if has_alpha else "RGB")
+
+
+def _flatten(im):
+    """JPEG no tiene alfa: se compone sobre blanco."""
+    if im.mode != "RGBA":
+        return im
+    background = Image.new("RGB", im.size, (255, 255, 255))
+    background.paste(im, mask=im.getchannel("A"))
+    return background
+
+
+def render_variants(data: bytes, dest_dir: str) -> dict:
+    """
+    Genera (si no existen ya) todas las variantes de ``data`` en ``dest_dir``.
+    Devuelve ``{variante: {"webp": fichero, "jpg": fichero, "width": w, "height": h}}``.
+    """
+    digest = content_hash(data)
+    os.makedirs(dest_dir, exist_ok=True)
+    result = {}
+    with Image.open(io.BytesIO(data)) as src:
+        im = _prepare(ImageOps.exif_transpose(src))
+    for name, edge in VARIANTS:
+        variant = im.copy()
+        variant.thumbnail((edge, edge), Image.LANCZOS)
+        entry = {"width": variant.width, "height": variant.height}
+        for ext, fmt, options in OUTPUT_FORMATS:
+            filename = f"{digest}_{name}.{ext}"
+            path = os.path.join(dest_dir, filename)
+            if not os.path.exists(path):
+                out = _flatten(variant) if fmt == "JPEG" else variant
+                tmp = f"{path}.tmp"
+                out.save(tmp, fmt, **options)
+                os.replace(tmp, path)  # nunca se sirve un fichero a medio escribir
+            entry[ext] = filename
+        result[name] = entry
+    return result
+
+
+def _variant_urls(rendered: dict) -> dict:
+    return {
+        name: {key: (public_url(value) if key in ("webp", "jpg") else value) for key, value in entry.items()}
+        for name, entry in rendered.items()
+    }
+
+
+def process_product_image(product_id: int, source_path: str, source_url: str):
+    """
+    Trabajo del pool: genera variantes y las asigna al producto.
+    Si mientras tanto el producto cambió de imagen, el resultado se descarta.
+    """
+    t0 = perf_counter()
+    try:
+        with open(source_path, "rb") as fh:
+            data = fh.read()
+        rendered = render_variants(data, upload_folder())
+
+        product = db.session.get(Product, product_id)
+        if not product or product.image_url != source_url:
+            logger.info("[images.process.skip] product=%s (imagen reemplazada o producto borrado)", product_id)
+            remove_original(source_url, source_path)
+            return None
+        variants = _variant_urls(rendered)
+        product.image_variants = variants
+        product.image_url = variants["large"]["jpg"]
+        db.session.commit()
+        catalog_cache.bump_catalog_version("images.process")
+        # Ya no se sirve: el original de varios MB no se queda en disco
+        remove_original(source_url, source_path)
+
+        dt = (perf_counter() - t0) * 1000
+        logger.info("[images.process.ok] product=%s bytes=%s ms=%.2f", product_id, len(data), dt)
+        return variants
+    except Exception as e:
+        db.session.rollback()
+        dt = (perf_counter() - t0) * 1000
+        logger.exception("[images.process.error] product=%s ms=%.2f err=%s", product_id, dt, str(e))
+        return None
+
+
+def _run_in_app(app, product_id, source_path, source_url):
+    with app.app_context():
+        return process_product_image(product_id, source_path, source_url)
+
+
+def _get_executor(app):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, int(app.config.get("IMAGE_WORKERS", 2))),
+                thread_name_prefix="images",
+            )
+        return _executor
+
+
+def schedule_product_image(product_id: int, source_path: str, source_url: str):
+    """Encola el procesado (llamar después del commit). Devuelve el Future, o el resultado si es síncrono."""
+    app = current_app._get_current_object()
+    if not app.config.get("IMAGE_PROCESSING_ASYNC", True):
+        return _run_in_app(app, product_id, source_path, source_url)
+    logger.info("[images.process.queued] product=%s", product_id)
+    return _get_executor(app).submit(_run_in_app, app, product_id, source_path, source_url)
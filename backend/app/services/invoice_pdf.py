@@ -0,0 +1,428 @@
+# app/services/invoice_pdf.py – BlitzShop (PDF de facturas: pool de procesos + caché en disco)
+"""
+Render de facturas en PDF fuera del hilo de la petición y caché de artefactos.
+
+- ``snapshot(invoice, settings)`` copia a un dict plano todo lo que pinta el PDF
+  (factura, líneas del pedido y los campos de ajustes que usa la plantilla,
+  ``SETTINGS_RENDERED_FIELDS``). Es picklable: ``render_pdf`` corre en un
+  ``ProcessPoolExecutor`` (``INVOICE_PDF_WORKERS`` procesos, arranque ``spawn``
+  para no heredar conexiones ni hilos del servidor). ReportLab es Python puro y
+  no suelta el GIL: en un proceso aparte no frena al resto de peticiones.
+  Con ``INVOICE_PDF_WORKERS=0`` se renderiza en línea (scripts/tests).
+- El PDF se guarda direccionado por contenido en ``INVOICE_PDF_DIR``
+  (``<sha256 del snapshot>.pdf``, escritura atómica) y la factura apunta a él con
+  ``pdf_url``/``pdf_generated_at``. Las descargas siguientes sirven esos bytes
+  sin cargar el pedido ni renderizar.
+- ``invalidate(invoice)`` borra la referencia cuando cambia un campo pintado
+  (``admin_update_invoice``, anulación); ``invalidate_all()`` cuando cambia un
+  ajuste pintado. El fichero viejo no se borra: si el contenido vuelve a ser el
+  mismo, la clave coincide y se reutiliza.
+"""
+import copy
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from io import BytesIO
+from time import perf_counter
+
+from flask import current_app
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+    from reportlab.lib.enums import TA_CENTER
+    PDF_SUPPORT = True
+except ImportError:
+    PDF_SUPPORT = False
+    logging.warning("ReportLab not installed. PDF generation disabled.")
+
+logger = logging.getLogger(__name__)
+
+# Sube al cambiar la plantilla: cambia la clave de todos los PDFs cacheados
+TEMPLATE_VERSION = 1
+
+# Campos de la factura que aparecen en el PDF (cambiar otro no invalida la caché)
+INVOICE_RENDERED_FIELDS = (
+    "invoice_number", "issue_date", "due_date", "status", "currency",
+    "subtotal", "tax_rate", "tax_amount", "shipping_cost", "discount_amount", "total_amount",
+    "billing_name", "billing_email", "billing_address", "billing_city", "billing_postal_code",
+    "company_name", "company_tax_id", "company_address", "company_city", "company_postal_code",
+    "company_email", "notes", "terms_conditions",
+)
+
+# Ajustes globales que lee la plantilla al renderizar (el resto se copia a la factura al crearla)
+SETTINGS_RENDERED_FIELDS = ("footer_text",)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+# -----------------------------
+# Render (se ejecuta en el pool: solo datos planos, nada de ORM ni app)
+# -----------------------------
+
+class InvoiceTemplate:
+    """
+    Partes fijas del documento, construidas una vez por proceso: hoja de estilos,
+    ``TableStyle`` de cada tabla y los párrafos estáticos (título, cabeceras de
+    notas/términos, pie). Los párrafos se copian (``copy.copy``) en cada
+    documento: la copia comparte el texto ya parseado y guarda su propio layout.
+    Fuentes: Helvetica es una de las 14 estándar de PDF, no hay que registrar nada.
+    """
+
+    def __init__(self):
+        self.styles = getSampleStyleSheet()
+        self.title_style = ParagraphStyle(
+            'CustomTitle',
+            parent=self.styles['Heading1'],
+            fontSize=24,
+            textColor=colors.HexColor('#2c3e50'),
+            alignment=TA_CENTER
+        )
+        self.normal = self.styles['Normal']
+
+        self.title = Paragraph("INVOICE", self.title_style)
+        self.notes_heading = Paragraph("Notes:", self.styles['Heading3'])
+        self.terms_heading = Paragraph("Terms & Conditions:", self.styles['Heading3'])
+
+        self.details_style = TableStyle([
+            ('FONT', (0, 0), (-1, -1), 'Helvetica', 10),
+            ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ])
+        self.parties_style = TableStyle([
+            ('FONT', (0, 0), (-1, -1), 'Helvetica', 10),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ])
+        self.items_style = TableStyle([
+            ('FONT', (0, 0), (-1, -1), 'Helvetica', 10),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+            ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#ecf0f1')),
+        ])
+        self.totals_style = TableStyle([
+            ('FONT', (0, 0), (-1, -1), 'Helvetica', 10),
+            ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, -1), (-1, -1), 12),
+            ('LINEABOVE', (0, -1), (-1, -1), 2, colors.black),
+        ])
+
+        # Textos que se repiten en casi todas las facturas (términos y pie salen de los ajustes)
+        self._paragraphs = {}
+        self._paragraphs_lock = threading.Lock()
+
+    def paragraph(self, text, style):
+        """Párrafo de texto repetido (términos, pie): parseado una vez, copiado por documento."""
+        key = (text, style.name)
+        with self._paragraphs_lock:
+            cached = self._paragraphs.get(key)
+            if cached is None:
+                if len(self._paragraphs) >= 256:
+                    self._paragraphs.clear()
+                cached = self._paragraphs[key] = Paragraph(text, style)
+        return copy.copy(cached)
+
+    def fixed(self, flowable):
+        return copy.copy(flowable)
+
+
+_template = None
+_template_lock = threading.Lock()
+
+
+def get_template() -> InvoiceTemplate:
+    global _template
+    if _template is None:
+        with _template_lock:
+            if _template is None:
+                _template = InvoiceTemplate()
+    return _template
+
+
+def render_pdf(doc: dict, template: InvoiceTemplate = None) -> bytes:
+    """PDF de la factura a partir de ``snapshot()``."""
+    if not PDF_SUPPORT:
+        raise RuntimeError("PDF generation not available")
+
+    t = template or get_template()
+    currency = doc["currency"]
+    buffer = BytesIO()
+    pdf = SimpleDocTemplate(buffer, pagesize=A4)
+    story = []
+
+    # Title
+    story.append(t.fixed(t.title))
+    story.append(Spacer(1, 20))
+
+    # Invoice details
+    invoice_data = [
+        ['Invoice Number:', doc["invoice_number"]],
+        ['Date:', doc["issue_date"].strftime('%Y-%m-%d')],
+        ['Due Date:', doc["due_date"].strftime('%Y-%m-%d') if doc["due_date"] else 'N/A'],
+        ['Status:', doc["status"].upper()]
+    ]
+
+    story.append(Table(invoice_data, colWidths=[100, 200], style=t.details_style))
+    story.append(Spacer(1, 20))
+
+    # Company and billing info
+    company_billing_data = [
+        ['FROM:', 'BILL TO:'],
+        [doc["company_name"] or 'Company Name', doc["billing_name"]],
+        [doc["company_address"] or '', doc["billing_address"] or ''],
+        [f"{doc['company_city']}, {doc['company_postal_code']}",
+         f"{doc['billing_city']}, {doc['billing_postal_code']}" if doc["billing_city"] else ''],
+        [doc["company_email"] or '', doc["billing_email"]],
+    ]
+
+    story.append(Table(company_billing_data, colWidths=[250, 250], style=t.parties_style))
+    story.append(Spacer(1, 30))
+
+    # Order items
+    if doc["items"]:
+        items_data = [['Description', 'Qty', 'Price', 'Total']]
+        for item in doc["items"]:
+            items_data.append([
+                item["name"],
+                str(item["quantity"]),
+                f"{currency} {item['unit_price']:.2f}",
+                f"{currency} {(item['quantity'] * item['unit_price']):.2f}"
+            ])
+
+        story.append(Table(items_data, colWidths=[250, 50, 100, 100], style=t.items_style))
+        story.append(Spacer(1, 20))
+
+    # Totals
+    totals_data = [
+        ['Subtotal:', f"{currency} {doc['subtotal']:.2f}"],
+        [f"Tax ({doc['tax_rate']}%):", f"{currency} {doc['tax_amount']:.2f}"],
+        ['Shipping:', f"{currency} {doc['shipping_cost']:.2f}"],
+    ]
+
+    if doc["discount_amount"] > 0:
+        totals_data.append(['Discount:', f"-{currency} {doc['discount_amount']:.2f}"])
+
+    totals_data.append(['TOTAL:', f"{currency} {doc['total_amount']:.2f}"])
+
+    story.append(Table(totals_data, colWidths=[400, 100], style=t.totals_style))
+
+    # Notes and terms
+    if doc["notes"]:
+        story.append(Spacer(1, 30))
+        story.append(t.fixed(t.notes_heading))
+        story.append(Paragraph(doc["notes"], t.normal))
+
+    if doc["terms_conditions"]:
+        story.append(Spacer(1, 20))
+        story.append(t.fixed(t.terms_heading))
+        story.append(t.paragraph(doc["terms_conditions"], t.normal))
+
+    # Footer (ajustes de facturación)
+    if doc["settings"].get("footer_text"):
+        story.append(Spacer(1, 30))
+        story.append(t.paragraph(doc["settings"]["footer_text"], t.styles['Italic']))
+
+    # Build PDF
+    pdf.build(story)
+    return buffer.getvalue()
+
+
+# -----------------------------
+# Snapshot y caché
+# -----------------------------
+
+def settings_values(settings) -> dict:
+    return {name: getattr(settings, name, None) for name in SETTINGS_RENDERED_FIELDS}
+
+
+def snapshot(invoice, settings=None) -> dict:
+    """Datos planos que pinta el PDF (pedido y productos deben venir cargados: perfil ``invoice.pdf``)."""
+    doc = {name: getattr(invoice, name) for name in INVOICE_RENDERED_FIELDS}
+    items = invoice.order.items if invoice.order else []
+    doc["items"] = [
+        {
+            "name": item.product.name if item.product else 'Product',
+            "quantity": item.quantity,
+            "unit_price": item.unit_price,
+        }
+        for item in items
+    ]
+    doc["settings"] = settings_values(settings)
+    doc["template_version"] = TEMPLATE_VERSION
+    return doc
+
+
+def cache_key(doc: dict) -> str:
+    raw = json.dumps(doc, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def pdf_dir():
+    return current_app.config.get("INVOICE_PDF_DIR") or os.path.join(current_app.instance_path, "invoice_pdfs")
+
+
+def _path(key_or_url: str) -> str:
+    # pdf_url guarda el nombre del artefacto; nunca una ruta fuera del directorio
+    return os.path.join(pdf_dir(), os.path.basename(key_or_url))
+
+
+def _get_executor():
+    global _executor
+    workers = current_app.config.get("INVOICE_PDF_WORKERS", 2)
+    if workers <= 0:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+def _discard_executor(executor):
+    """Un proceso del pool murió (OOM, kill): el pool queda roto, se crea otro en la próxima llamada."""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def render_one(doc: dict) -> bytes:
+    executor = _get_executor()
+    if executor is None:
+        return render_pdf(doc)
+    try:
+        return executor.submit(render_pdf, doc).result(timeout=current_app.config.get("INVOICE_PDF_TIMEOUT", 30))
+    except BrokenProcessPool:
+        _discard_executor(executor)
+        logger.warning("[invoice_pdf.pool_broken] rendering inline invoice=%s", doc.get("invoice_number"))
+        return render_pdf(doc)
+
+
+def render_many(docs) -> list:
+    """Renderiza un lote de snapshots en paralelo en el pool. Lista de bytes, en orden."""
+    executor = _get_executor()
+    if executor is None or len(docs) <= 1:
+        return [render_one(doc) for doc in docs]
+    try:
+        return list(executor.map(render_pdf, docs, timeout=current_app.config.get("INVOICE_PDF_TIMEOUT", 30) * len(docs)))
+    except BrokenProcessPool:
+        _discard_executor(executor)
+        logger.warning("[invoice_pdf.pool_broken] rendering %s invoices inline", len(docs))
+        return [render_pdf(doc) for doc in docs]
+
+
+def ensure_pdfs(invoices, settings) -> list:
+    """
+    PDFs de un lote de facturas (pedido y productos cargados: perfil ``invoice.pdf``):
+    los cacheados se leen del disco, el resto se renderiza en paralelo y se guarda.
+    Devuelve los bytes en el orden de ``invoices``. Sin commit.
+    """
+    result = [read_cached(invoice) for invoice in invoices]
+    missing = [i for i, data in enumerate(result) if data is None]
+    if missing:
+        t0 = perf_counter()
+        docs = [snapshot(invoices[i], settings) for i in missing]
+        rendered = render_many(docs)
+        keep = _settings_unchanged(settings)
+        for i, doc, data in zip(missing, docs, rendered):
+            if keep:
+                store(invoices[i], doc, data)
+            result[i] = data
+        logger.info("[invoice_pdf.render_batch] invoices=%s rendered=%s ms=%.2f",
+                    len(invoices), len(missing), (perf_counter() - t0) * 1000)
+    return result
+
+
+def _settings_unchanged(settings) -> bool:
+    """
+    Los ajustes no cambiaron mientras se renderizaba. Si cambiaron, el
+    ``invalidate_all()`` del PUT ya corrió: guardar ``pdf_url`` ahora dejaría
+    servido para siempre un PDF con el pie viejo. Se devuelve sin guardar.
+    """
+    from app.models.invoice import InvoiceSettings
+
+    if getattr(settings, "updated_at", None) == InvoiceSettings.current_version():
+        return True
+    logger.warning("[invoice_pdf.settings_changed] rendered with outdated settings, not cached")
+    return False
+
+
+def read_cached(invoice):
+    """Bytes del PDF cacheado de la factura, o None si no hay (o el fichero desapareció)."""
+    if not invoice.pdf_url:
+        return None
+    try:
+        with open(_path(invoice.pdf_url), "rb") as fh:
+            return fh.read()
+    except FileNotFoundError:
+        return None
+
+
+def store(invoice, doc, data: bytes):
+    """Guarda el artefacto (si no existe ya) y apunta la factura a él. Sin commit."""
+    name = f"{cache_key(doc)}.pdf"
+    path = _path(name)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, path)  # nunca se sirve un fichero a medio escribir
+    invoice.pdf_url = name
+    invoice.pdf_generated_at = datetime.now(timezone.utc)
+
+
+def get_pdf(invoice):
+    """
+    ``(bytes, cached)`` del PDF de la factura. Con caché no toca la base de datos;
+    sin caché carga pedido/productos, renderiza en el pool, guarda y hace commit.
+    """
+    from app import db
+    from app.models.invoice import Invoice, InvoiceSettings
+    from app.services import loading
+
+    t0 = perf_counter()
+    data = read_cached(invoice)
+    if data is not None:
+        logger.info("[invoice_pdf.hit] invoice_id=%s bytes=%s ms=%.2f", invoice.id, len(data), (perf_counter() - t0) * 1000)
+        return data, True
+
+    # Pedido + líneas + productos que pinta el PDF, en 2 consultas
+    invoice = Invoice.query.options(*loading.profile("invoice.pdf")).filter_by(id=invoice.id).first()
+    settings = InvoiceSettings.cached()
+    doc = snapshot(invoice, settings)
+    data = render_one(doc)
+    if _settings_unchanged(settings):
+        store(invoice, doc, data)
+        db.session.commit()
+    logger.info("[invoice_pdf.render] invoice_id=%s bytes=%s ms=%.2f", invoice.id, len(data), (perf_counter() - t0) * 1000)
+    return data, False
+
+
+def invalidate(invoice):
+    """La factura cambió en un campo pintado: el próximo download renderiza de nuevo. Sin commit."""
+    invoice.pdf_url = None
+    invoice.pdf_generated_at = None
+
+
+def invalidate_all():
+    """Un ajuste pintado cambió: invalida todas las facturas. Sin commit."""
+    from app import db
+    from app.models.invoice import Invoice
+
+    return (
+        db.session.query(Invoice)
+        .filter(Invoice.pdf_url.isnot(None))
+        .update({Invoice.pdf_url: None, Invoice.pdf_generated_at: None}, synchronize_session=False)
+    )
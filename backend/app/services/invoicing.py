@@ -0,0 +1,192 @@
+# app/services/invoicing.py – BlitzShop (facturación masiva de pedidos pagados)
+"""
+Facturas para todos los pedidos ``paid`` que aún no tienen, por lotes.
+
+Por lote (keyset sobre ``orders.id``, ``INVOICE_BULK_BATCH_SIZE`` pedidos):
+
+- 1 consulta: pedidos pagados sin factura + su usuario;
+- 1 consulta: subtotales ``SUM(quantity * unit_price)`` agrupados por pedido
+  (impuesto y total con la misma aritmética Decimal que ``Invoice.calculate_totals``);
+- 1 sentencia: bloque de números consecutivos (``Invoice.allocate_invoice_numbers``);
+- 1 INSERT multi-fila de facturas y 1 commit.
+
+Los ajustes de facturación se leen por lote (``InvoiceSettings.cached()``: un
+cambio hecho desde otro proceso llega en ``INVOICE_SETTINGS_VERSION_CHECK`` s). Con ``render_pdfs``
+cada lote encola un evento ``invoices.created`` en el outbox (misma
+transacción) y el worker genera los PDFs en el pool de procesos.
+
+Pensado para pedidos pagados antes de ``INVOICE_AUTO_CREATE`` o con él
+desactivado. Concurrencia (worker del outbox, otra ejecución masiva, admin):
+la garantía es ``uq_invoices_order_id``, no la comprobación ``NOT EXISTS``.
+En PostgreSQL los pedidos candidatos se bloquean con ``FOR UPDATE SKIP
+LOCKED`` (dos ejecuciones masivas se reparten los pedidos); si aun así el
+INSERT choca con una factura creada entre medias, el lote entero se deshace
+(también sus números) y se vuelve a seleccionar, hasta ``MAX_BATCH_ATTEMPTS``.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from time import perf_counter
+
+from flask import current_app
+from sqlalchemy import exists, insert
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.invoice import Invoice, InvoiceSettings
+from app.models.order import Order, OrderItem
+from app.models.user import User
+from app.services import outbox
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+MAX_BATCH_ATTEMPTS = 3
+
+
+class InvoicingReport:
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.batches = 0
+        self.orders = 0
+        self.created = 0
+        self.pdf_batches_queued = 0
+        self.first_number = None
+        self.last_number = None
+        self.elapsed_ms = 0.0
+
+    def to_dict(self):
+        return {
+            "dry_run": self.dry_run,
+            "batches": self.batches,
+            "orders": self.orders,
+            "created": self.created,
+            "pdf_batches_queued": self.pdf_batches_queued,
+            "first_number": self.first_number,
+            "last_number": self.last_number,
+            "elapsed_ms": round(self.elapsed_ms, 2),
+        }
+
+
+def _uninvoiced_paid_orders(after_id, batch_size, lock=False):
+    query = (
+        db.session.query(Order.id, Order.user_id, User)
+        .join(User, User.id == Order.user_id)
+        .filter(
+            Order.status == "paid",
+            Order.id > after_id,
+            ~exists().where(Invoice.order_id == Order.id),
+        )
+        .order_by(Order.id)
+        .limit(batch_size)
+    )
+    if lock and db.engine.dialect.name == "postgresql":
+        query = query.with_for_update(of=Order, skip_locked=True)
+    return query.all()
+
+
+def _subtotals(order_ids):
+    rows = (
+        db.session.query(OrderItem.order_id, db.func.sum(OrderItem.quantity * OrderItem.unit_price))
+        .filter(OrderItem.order_id.in_(order_ids))
+        .group_by(OrderItem.order_id)
+        .all()
+    )
+    return {order_id: Decimal(str(subtotal or 0)) for order_id, subtotal in rows}
+
+
+def _insert_batch(rows, render_pdfs):
+    """Facturas del lote (sin commit). Devuelve ``(numbers, invoice_ids)``."""
+    settings = InvoiceSettings.cached()
+    company = Invoice.company_fields(settings)
+    tax_rate = Decimal(str(settings.default_tax_rate))
+    subtotals = _subtotals([r.id for r in rows])
+    numbers = Invoice.allocate_invoice_numbers(settings.invoice_prefix, len(rows))
+    now = datetime.now(timezone.utc)
+    due = now + timedelta(days=settings.payment_terms_days)
+    tax_factor = tax_rate / Decimal('100')
+    zero = Decimal('0.00')
+
+    values = []
+    for row, number in zip(rows, numbers):
+        subtotal = subtotals.get(row.id, Decimal('0'))
+        tax_amount = subtotal * tax_factor
+        values.append({
+            "invoice_number": number,
+            "order_id": row.id,
+            "user_id": row.user_id,
+            "issue_date": now,
+            "due_date": due,
+            "subtotal": subtotal,
+            "tax_rate": tax_rate,
+            "tax_amount": tax_amount,
+            "shipping_cost": zero,
+            "discount_amount": zero,
+            "total_amount": subtotal + tax_amount,
+            # Pedido ya cobrado (mismo criterio que el handler invoice.create)
+            "status": "paid",
+            "payment_method": "stripe",
+            "notes": "",
+            "created_at": now,
+            "updated_at": now,
+            **Invoice.billing_fields(row.User, settings),
+            **company,
+        })
+
+    invoice_ids = list(db.session.scalars(
+        insert(Invoice).returning(Invoice.id, sort_by_parameter_order=True), values
+    ))
+    if render_pdfs:
+        outbox.enqueue("invoices.created", {"invoice_ids": invoice_ids}, aggregate_type="invoice_batch")
+    return numbers, invoice_ids
+
+
+def invoice_paid_orders(batch_size=None, limit=None, render_pdfs=False, dry_run=False) -> InvoicingReport:
+    """Crea las facturas que faltan. ``limit`` acota el nº de pedidos facturados."""
+    batch_size = batch_size or current_app.config.get("INVOICE_BULK_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+
+    report = InvoicingReport(dry_run=dry_run)
+    t0 = perf_counter()
+    after_id = 0
+    while limit is None or report.orders < limit:
+        size = batch_size if limit is None else min(batch_size, limit - report.orders)
+        if dry_run:
+            rows = _uninvoiced_paid_orders(after_id, size)
+            if not rows:
+                break
+            after_id = rows[-1].id
+            report.batches += 1
+            report.orders += len(rows)
+            continue
+
+        tb = perf_counter()
+        for attempt in range(1, MAX_BATCH_ATTEMPTS + 1):
+            rows = _uninvoiced_paid_orders(after_id, size, lock=True)
+            if not rows:
+                break
+            try:
+                numbers, invoice_ids = _insert_batch(rows, render_pdfs)
+                db.session.commit()
+                break
+            except IntegrityError:
+                # Algún pedido del lote se facturó entre la selección y el INSERT
+                db.session.rollback()
+                if attempt == MAX_BATCH_ATTEMPTS:
+                    raise
+                logger.warning("[invoicing.batch.conflict] after_id=%s attempt=%s", after_id, attempt)
+        if not rows:
+            break
+
+        after_id = rows[-1].id
+        report.batches += 1
+        report.orders += len(rows)
+        report.created += len(invoice_ids)
+        report.pdf_batches_queued += 1 if render_pdfs else 0
+        report.first_number = report.first_number or numbers[0]
+        report.last_number = numbers[-1]
+        logger.info("[invoicing.batch.ok] batch=%s invoices=%s numbers=%s..%s ms=%.2f",
+                    report.batches, len(invoice_ids), numbers[0], numbers[-1], (perf_counter() - tb) * 1000)
+
+    report.elapsed_ms = (perf_counter() - t0) * 1000
+    logger.info("[invoicing.ok] %s", report.to_dict())
+    return report
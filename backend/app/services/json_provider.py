@@ -0,0 +1,78 @@
+# app/services/json_provider.py – BlitzShop (JSON rápido para toda la app)
+"""
+Proveedor JSON de Flask basado en orjson (opcional; si no está instalado se
+usa el de Flask tal cual).
+
+La salida es compatible con la de ``DefaultJSONProvider``: claves ordenadas,
+``Decimal``/``UUID`` como string y fechas en formato HTTP. orjson resuelve en C
+dicts, listas, strings y números, y solo llama a ``_default`` para esos tipos.
+
+``dumps_bytes`` / ``json_response`` permiten montar respuestas a partir de
+fragmentos ya codificados (ver ``product_fragment`` en routes/products.py).
+"""
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date
+
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+    ORJSON_SUPPORT = True
+    _OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+except ImportError:
+    orjson = None
+    ORJSON_SUPPORT = False
+
+
+def _default(o):
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj) -> bytes:
+    """JSON compacto en bytes, mismo formato que las respuestas de la app."""
+    if ORJSON_SUPPORT:
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+    return json.dumps(obj, default=_default, sort_keys=True, separators=(",", ":")).encode()
+
+
+def json_response(body: bytes, status: int = 200):
+    """Respuesta a partir de JSON ya codificado (sin pasar por jsonify)."""
+    return current_app.response_class(body, status=status, mimetype="application/json")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        if not ORJSON_SUPPORT or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=_OPTIONS).decode()
+
+    def loads(self, s, **kwargs):
+        if not ORJSON_SUPPORT or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # En debug se mantiene el JSON indentado de Flask
+        if not ORJSON_SUPPORT or self._app.debug:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
+
+
+def init_app(app):
+    if app.config.get("FAST_JSON", True):
+        app.json = FastJSONProvider(app)
+    app.logger.info("[app.json] provider=%s", "orjson" if ORJSON_SUPPORT and app.config.get("FAST_JSON", True) else "stdlib")
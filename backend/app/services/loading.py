@@ -0,0 +1,45 @@
+# app/services/loading.py – BlitzShop (perfiles de carga de relaciones)
+"""
+Perfiles con nombre de eager-loading para los listados.
+
+Cada perfil dice qué relaciones toca el serializador y cómo cargarlas:
+
+- many-to-one (``Order.user``, ``Review.user``, ``Invoice.order``):
+  ``joinedload`` -> LEFT JOIN en la misma consulta; no altera COUNT ni LIMIT.
+- one-to-many (``Order.items``): ``selectinload`` -> una sola
+  consulta ``WHERE order_id IN (...)`` por página, sin multiplicar filas.
+
+Uso::
+
+    query = Order.query.options(*loading.profile("order.full"))
+
+Los perfiles se construyen al pedirlos (no al importar): los backrefs como
+``Order.user`` solo existen cuando los mappers ya están configurados.
+"""
+from sqlalchemy.orm import joinedload, selectinload
+
+from app.models.invoice import Invoice
+from app.models.order import Order, OrderItem
+from app.models.review import Review
+
+_PROFILES = {
+    # Order
+    "order.items": lambda: (selectinload(Order.items),),
+    "order.user": lambda: (joinedload(Order.user),),
+    "order.full": lambda: (joinedload(Order.user), selectinload(Order.items)),  # Order.to_dict
+    # Invoice
+    "invoice.pdf": lambda: (
+        joinedload(Invoice.order).selectinload(Order.items).joinedload(OrderItem.product),
+    ),
+    # Review
+    "review.user": lambda: (joinedload(Review.user),),  # Review.to_dict
+}
+
+
+def profile(name: str) -> tuple:
+    """Opciones de carga del perfil ``name`` (``KeyError`` si no existe)."""
+    return _PROFILES[name]()
+
+
+def names() -> list:
+    return sorted(_PROFILES)
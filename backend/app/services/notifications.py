@@ -0,0 +1,38 @@
+# app/services/notifications.py – BlitzShop (envío de emails)
+"""
+Envío de emails por SMTP (``MAIL_SERVER``/``MAIL_PORT``/``MAIL_USERNAME``/
+``MAIL_PASSWORD``/``MAIL_USE_TLS``/``MAIL_FROM``).
+
+Sin ``MAIL_SERVER`` (desarrollo) el email solo se registra en el log. Se llama
+desde los handlers del outbox, nunca desde una petición.
+"""
+import logging
+import smtplib
+from email.message import EmailMessage
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+
+def send_email(to, subject, body):
+    config = current_app.config
+    server = config.get("MAIL_SERVER")
+    if not server:
+        logger.info("[notifications.email.skipped] to=%s subject=%r (MAIL_SERVER not configured)", to, subject)
+        return False
+
+    msg = EmailMessage()
+    msg["From"] = config.get("MAIL_FROM") or "no-reply@blitzshop.com"
+    msg["To"] = to
+    msg["Subject"] = subject
+    msg.set_content(body)
+
+    with smtplib.SMTP(server, int(config.get("MAIL_PORT", 587)), timeout=10) as smtp:
+        if config.get("MAIL_USE_TLS", True):
+            smtp.starttls()
+        if config.get("MAIL_USERNAME"):
+            smtp.login(config["MAIL_USERNAME"], config.get("MAIL_PASSWORD") or "")
+        smtp.send_message(msg)
+    logger.info("[notifications.email.sent] to=%s subject=%r", to, subject)
+    return True
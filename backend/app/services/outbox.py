@@ -0,0 +1,220 @@
+# app/services/outbox.py – BlitzShop (outbox transaccional de efectos secundarios)
+"""
+Outbox transaccional: los efectos secundarios de un pedido (factura, emails,
+alertas de stock) no se ejecutan en la petición.
+
+- ``enqueue(event_type, ...)`` añade a la sesión una fila ``outbox_events`` por
+  cada handler suscrito al evento (``EVENT_HANDLERS``), sin commit: viaja en la
+  misma transacción que el pedido o el cambio de estado. Si esa transacción hace
+  rollback, el evento no existe; si hace commit, el evento no se pierde.
+- El worker (``python -m scripts.outbox_worker``) reclama lotes con un
+  ``UPDATE ... lock_token`` (``FOR UPDATE SKIP LOCKED`` en PostgreSQL, así
+  varios workers no se pisan), ejecuta cada handler en su propia transacción
+  y marca ``done``. Un fallo reprograma la fila con backoff exponencial
+  (``OUTBOX_BACKOFF_BASE`` * 2^intentos, con tope y jitter) hasta
+  ``OUTBOX_MAX_ATTEMPTS``; después queda en ``failed`` para revisión manual.
+- Una fila en ``processing`` más vieja que ``OUTBOX_LOCK_TIMEOUT`` (worker
+  caído) se vuelve a reclamar: los handlers deben ser idempotentes.
+
+Añadir un efecto secundario = un handler en ``outbox_handlers.py`` y su nombre
+en ``EVENT_HANDLERS``; el checkout solo inserta una fila más.
+"""
+import logging
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+
+from flask import current_app
+from sqlalchemy import select, update
+
+from app import db
+from app.models.outbox import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+# evento -> handlers (nombres registrados con @handler en outbox_handlers.py)
+EVENT_HANDLERS = {
+    "order.created": ("stock.alert",),
+    "order.paid": ("invoice.create", "email.order_paid"),
+    "order.cancelled": ("email.order_cancelled",),
+    "stripe.event_received": ("stripe.process",),
+    "invoices.created": ("invoice.render_pdfs",),
+}
+
+# Estados de pedido que generan evento al cambiar
+ORDER_STATUS_EVENTS = {
+    "paid": "order.paid",
+    "cancelled": "order.cancelled",
+}
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_MAX_ATTEMPTS = 8
+DEFAULT_BACKOFF_BASE = 5
+DEFAULT_BACKOFF_MAX = 3600
+DEFAULT_LOCK_TIMEOUT = 300
+
+_HANDLERS = {}
+
+
+class OutboxBatch:
+    def __init__(self):
+        self.claimed = 0
+        self.done = 0
+        self.retried = 0
+        self.failed = 0
+
+    def to_dict(self):
+        return {"claimed": self.claimed, "done": self.done, "retried": self.retried, "failed": self.failed}
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _config(name, default):
+    return current_app.config.get(name, default)
+
+
+def handler(name):
+    """Registra ``fn(payload, event)`` como handler ``name``."""
+
+    def decorator(fn):
+        _HANDLERS[name] = fn
+        return fn
+
+    return decorator
+
+
+def enqueue(event_type, payload=None, aggregate_type=None, aggregate_id=None):
+    """Añade los eventos a la sesión actual (sin commit). Devuelve las filas."""
+    rows = [
+        OutboxEvent(
+            event_type=event_type,
+            handler=name,
+            aggregate_type=aggregate_type,
+            aggregate_id=aggregate_id,
+            payload=payload or {},
+            status="pending",
+            attempts=0,
+            available_at=_utcnow(),
+        )
+        for name in EVENT_HANDLERS.get(event_type, ())
+    ]
+    db.session.add_all(rows)
+    return rows
+
+
+def enqueue_order_status(order, old_status):
+    """Evento de cambio de estado del pedido (si el nuevo estado tiene suscriptores)."""
+    event_type = ORDER_STATUS_EVENTS.get(order.status)
+    if event_type is None or order.status == old_status:
+        return []
+    return enqueue(
+        event_type,
+        {"order_id": order.id, "old_status": old_status, "status": order.status},
+        aggregate_type="order",
+        aggregate_id=order.id,
+    )
+
+
+def _backoff(attempts):
+    base = _config("OUTBOX_BACKOFF_BASE", DEFAULT_BACKOFF_BASE)
+    delay = min(_config("OUTBOX_BACKOFF_MAX", DEFAULT_BACKOFF_MAX), base * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_batch(batch_size=None):
+    """Marca hasta ``batch_size`` eventos como ``processing`` y los devuelve (commit incluido)."""
+    batch_size = batch_size or _config("OUTBOX_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+    now = _utcnow()
+    stale = now - timedelta(seconds=_config("OUTBOX_LOCK_TIMEOUT", DEFAULT_LOCK_TIMEOUT))
+    token = uuid.uuid4().hex
+
+    candidates = (
+        select(OutboxEvent.id)
+        .where(
+            ((OutboxEvent.status == "pending") & (OutboxEvent.available_at <= now))
+            | ((OutboxEvent.status == "processing") & (OutboxEvent.locked_at < stale))
+        )
+        .order_by(OutboxEvent.id)
+        .limit(batch_size)
+    )
+    if db.engine.dialect.name == "postgresql":
+        candidates = candidates.with_for_update(skip_locked=True)
+
+    db.session.execute(
+        update(OutboxEvent)
+        .where(OutboxEvent.id.in_(candidates.scalar_subquery()))
+        .values(status="processing", locked_at=now, lock_token=token)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return OutboxEvent.query.filter_by(lock_token=token, status="processing").order_by(OutboxEvent.id).all()
+
+
+def _process_one(event, batch):
+    fn = _HANDLERS.get(event.handler)
+    t0 = perf_counter()
+    try:
+        if fn is None:
+            raise LookupError(f"No outbox handler registered for {event.handler!r}")
+        fn(event.payload or {}, event)
+        event.status = "done"
+        event.processed_at = _utcnow()
+        event.attempts += 1
+        event.last_error = None
+        event.lock_token = None
+        db.session.commit()
+        batch.done += 1
+        logger.info("[outbox.event.ok] id=%s handler=%s ms=%.2f", event.id, event.handler, (perf_counter() - t0) * 1000)
+    except Exception as e:
+        db.session.rollback()
+        event = db.session.get(OutboxEvent, event.id)
+        event.attempts += 1
+        event.last_error = f"{type(e).__name__}: {e}"[:2000]
+        event.lock_token = None
+        if event.attempts >= _config("OUTBOX_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS):
+            event.status = "failed"
+            batch.failed += 1
+            logger.error("[outbox.event.failed] id=%s handler=%s attempts=%s err=%s",
+                         event.id, event.handler, event.attempts, e)
+        else:
+            event.status = "pending"
+            event.available_at = _utcnow() + timedelta(seconds=_backoff(event.attempts))
+            batch.retried += 1
+            logger.warning("[outbox.event.retry] id=%s handler=%s attempts=%s next=%s err=%s",
+                           event.id, event.handler, event.attempts, event.available_at.isoformat(), e)
+        db.session.commit()
+
+
+def process_batch(batch_size=None) -> OutboxBatch:
+    # Registro de handlers (import diferido: tocan modelos y servicios de toda la app)
+    from app.services import outbox_handlers  # noqa: F401
+
+    batch = OutboxBatch()
+    events = claim_batch(batch_size)
+    batch.claimed = len(events)
+    for event in events:
+        _process_one(event, batch)
+    return batch
+
+
+def run_worker(poll_interval=2.0, batch_size=None, once=False, stop=None):
+    """Bucle del worker: vacía lotes seguidos mientras haya trabajo y duerme si no."""
+    while True:
+        batch = process_batch(batch_size)
+        if batch.claimed:
+            logger.info("[outbox.batch.ok] %s", batch.to_dict())
+        if once and not batch.claimed:
+            return
+        if stop is not None and stop():
+            return
+        if not batch.claimed:
+            time.sleep(poll_interval)
+
+
+def stats():
+    rows = db.session.query(OutboxEvent.status, db.func.count(OutboxEvent.id)).group_by(OutboxEvent.status).all()
+    return {status: count for status, count in rows}
@@ -0,0 +1,118 @@
+# app/services/outbox_handlers.py – BlitzShop (handlers del outbox)
+"""
+Efectos secundarios de pedidos, ejecutados por el worker del outbox.
+
+Cada handler recibe ``(payload, event)`` y corre dentro de la transacción que
+marca el evento como ``done``: si lanza excepción, nada de lo que escribió se
+guarda y el evento se reintenta. Deben ser idempotentes (un worker caído a
+mitad puede hacer que se ejecuten dos veces).
+"""
+import logging
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.invoice import Invoice, InvoiceSettings
+from app.models.order import Order, OrderItem
+from app.models.product import Product
+from app.services import invoice_pdf, loading, notifications, stripe_events
+from app.services.outbox import handler
+
+logger = logging.getLogger(__name__)
+
+
+def _load_order(payload):
+    order = Order.query.options(*loading.profile("order.full")).filter_by(id=payload["order_id"]).first()
+    if order is None:
+        raise LookupError(f"Order {payload['order_id']} not found")
+    return order
+
+
+@handler("invoice.create")
+def create_invoice(payload, event):
+    """Factura automática al pagarse el pedido (una por pedido)."""
+    if not current_app.config.get("INVOICE_AUTO_CREATE", True):
+        return
+    order = _load_order(payload)
+    if Invoice.query.filter_by(order_id=order.id).first():
+        return
+    invoice = Invoice.from_order(order, InvoiceSettings.cached())
+    invoice.status = "paid" if order.status == "paid" else invoice.status
+    db.session.add(invoice)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # Otra transacción (facturación masiva, admin) facturó el pedido entre la
+        # comprobación y el INSERT: uq_invoices_order_id. El rollback devuelve el número.
+        db.session.rollback()
+        if Invoice.query.filter_by(order_id=payload["order_id"]).first() is None:
+            raise
+        logger.info("[outbox.invoice.exists] order_id=%s", payload["order_id"])
+        return
+    logger.info("[outbox.invoice.created] order_id=%s invoice=%s", order.id, invoice.invoice_number)
+
+
+@handler("invoice.render_pdfs")
+def render_invoice_pdfs(payload, event):
+    """PDFs de un lote de facturas (facturación masiva), en paralelo en el pool."""
+    invoices = (
+        Invoice.query.options(*loading.profile("invoice.pdf"))
+        .filter(Invoice.id.in_(payload["invoice_ids"]))
+        .order_by(Invoice.id)
+        .all()
+    )
+    invoice_pdf.ensure_pdfs(invoices, InvoiceSettings.cached())
+
+
+def _notify_user(order, subject, body):
+    user = order.user
+    if user is None or not user.email or user.email_notifications is False:
+        return
+    notifications.send_email(user.email, subject, body)
+
+
+@handler("email.order_paid")
+def email_order_paid(payload, event):
+    order = _load_order(payload)
+    lines = "\n".join(f"  {i.quantity} x {i.product_name}  {i.unit_price}" for i in order.items)
+    _notify_user(
+        order,
+        f"BlitzShop – payment received for order #{order.id}",
+        f"Thanks for your purchase!\n\nOrder #{order.id}\n{lines}\n\nTotal: {order.total_amount}\n",
+    )
+
+
+@handler("email.order_cancelled")
+def email_order_cancelled(payload, event):
+    order = _load_order(payload)
+    _notify_user(
+        order,
+        f"BlitzShop – order #{order.id} cancelled",
+        f"Your order #{order.id} has been cancelled. No charge has been made.\n",
+    )
+
+
+@handler("stripe.process")
+def process_stripe_events(payload, event):
+    """Eventos de webhook pendientes del mismo payment intent, en orden."""
+    stripe_events.process_events(payload["stripe_event_id"], payload.get("payment_intent_id"))
+
+
+@handler("stock.alert")
+def stock_alert(payload, event):
+    """Aviso de stock bajo para los productos del pedido."""
+    threshold = current_app.config.get("STOCK_ALERT_THRESHOLD", 5)
+    rows = (
+        db.session.query(Product.id, Product.name, Product.stock)
+        .join(OrderItem, OrderItem.product_id == Product.id)
+        .filter(OrderItem.order_id == payload["order_id"], Product.stock <= threshold)
+        .all()
+    )
+    if not rows:
+        return
+    lines = "\n".join(f"  #{r.id} {r.name}: {r.stock} left" for r in rows)
+    logger.warning("[outbox.stock_alert] order_id=%s products=%s", payload["order_id"], [r.id for r in rows])
+    to = current_app.config.get("STOCK_ALERT_EMAIL")
+    if to:
+        notifications.send_email(to, f"BlitzShop – low stock ({len(rows)} products)", f"Low stock after order #{payload['order_id']}:\n{lines}\n")
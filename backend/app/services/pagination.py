@@ -0,0 +1,82 @@
+# app/services/pagination.py – BlitzShop (paginación keyset / cursor)
+"""
+Modo cursor (opt-in) para los listados.
+
+Los endpoints siguen aceptando ``page``/``per_page`` (contrato legacy). Si la
+petición trae ``cursor`` (vacío = primera página) se usa paginación keyset
+sobre ``(created_at, id)`` descendente: sin OFFSET y sin COUNT, salvo que se
+pida ``with_total=true``.
+"""
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from flask import request
+from sqlalchemy import and_, or_
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+KeysetPage = namedtuple("KeysetPage", ["items", "next_cursor", "has_next", "total"])
+
+
+def cursor_requested() -> bool:
+    return "cursor" in request.args
+
+
+def total_requested() -> bool:
+    return str(request.args.get("with_total", "")).lower() in ("1", "true", "yes")
+
+
+def encode_cursor(created_at, row_id) -> str:
+    raw = json.dumps([created_at.isoformat() if created_at else None, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        ts, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return (datetime.fromisoformat(ts) if ts else None), int(row_id)
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
+
+
+def keyset_page(query, model, limit: int) -> KeysetPage:
+    """
+    Aplica la paginación keyset a ``query`` (ya filtrada) usando los args de la petición.
+
+    Cualquier ORDER BY previo se reemplaza por ``created_at DESC NULLS LAST, id DESC``
+    (p.ej. en búsqueda se pierde el orden por relevancia en modo cursor).
+    """
+    created_col, id_col = model.created_at, model.id
+
+    total = None
+    if total_requested():
+        total = query.order_by(None).count()
+
+    token = request.args.get("cursor") or ""
+    if token:
+        last_ts, last_id = decode_cursor(token)
+        if last_ts is None:
+            query = query.filter(and_(created_col.is_(None), id_col < last_id))
+        else:
+            query = query.filter(or_(
+                created_col < last_ts,
+                and_(created_col == last_ts, id_col < last_id),
+                created_col.is_(None),
+            ))
+
+    rows = (
+        query.order_by(None)
+        .order_by(created_col.desc().nullslast(), id_col.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    has_next = len(rows) > limit
+    items = rows[:limit]
+    next_cursor = encode_cursor(items[-1].created_at, items[-1].id) if has_next and items else None
+    return KeysetPage(items, next_cursor, has_next, total)
@@ -0,0 +1,341 @@
+# app/services/payment_gateway.py – BlitzShop (pasarela de pago: Stripe o fake)
+"""
+Acceso a la pasarela de pago con límites de tiempo y aislamiento de fallos.
+
+``get_gateway()`` devuelve la pasarela configurada en ``PAYMENT_GATEWAY``:
+
+- ``stripe``: ``StripeClient`` sobre una ``requests.Session`` con pool de
+  conexiones persistentes (``STRIPE_POOL_SIZE``), sin reintentos de la
+  librería. Cada operación tiene su presupuesto de tiempo
+  (``STRIPE_CREATE_TIMEOUT`` / ``STRIPE_RETRIEVE_TIMEOUT``, connect+read) y
+  un máximo de ``STRIPE_MAX_RETRIES`` reintentos con backoff, solo para
+  errores transitorios (conexión, 429, 5xx). Los ``create`` siempre llevan
+  idempotency key, así un reintento no crea un segundo intent.
+- ``fake``: pasarela en memoria (latencia ``PAYMENT_FAKE_LATENCY_MS`` y tasa
+  de fallos ``PAYMENT_FAKE_FAILURE_RATE``) para benchmarks y pruebas sin red.
+
+Un circuit breaker por proceso corta las llamadas tras
+``PAYMENT_BREAKER_THRESHOLD`` fallos transitorios seguidos y deja pasar una de
+prueba pasados ``PAYMENT_BREAKER_RESET`` segundos: con Stripe caído los
+workers responden 503 al momento en vez de quedarse bloqueados esperando.
+"""
+import logging
+import os
+from abc import ABC, abstractmethod
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PaymentIntent:
+    id: str
+    client_secret: str | None
+    status: str
+    amount: int
+    currency: str
+    metadata: dict = field(default_factory=dict)
+
+
+class PaymentGatewayError(Exception):
+    """Error de la pasarela. ``status`` es el HTTP que debe devolver la API."""
+
+    def __init__(self, message, status=400, retryable=False):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.retryable = retryable
+
+
+class GatewayUnavailable(PaymentGatewayError):
+    def __init__(self, message="Payment provider unavailable"):
+        super().__init__(message, status=503, retryable=True)
+
+
+class CircuitBreaker:
+    """closed -> open (tras ``threshold`` fallos seguidos) -> half-open (1 prueba) -> closed."""
+
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = max(1, int(threshold))
+        self.reset_timeout = float(reset_timeout)
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+    def to_dict(self):
+        return {"state": self.state, "failures": self.failures}
+
+
+class PaymentGateway(ABC):
+    name = "base"
+    pool_size = 8
+
+    def __init__(self, breaker=None, max_retries=2, backoff=0.2):
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max(0, int(max_retries))
+        self.backoff = float(backoff)
+
+    # --- a implementar por cada pasarela ---
+    @abstractmethod
+    def _create_intent(self, amount, currency, metadata, idempotency_key):
+        ...
+
+    @abstractmethod
+    def _retrieve_intent(self, intent_id):
+        ...
+
+    # --- API pública ---
+    def create_intent(self, amount, currency, metadata=None, idempotency_key=None) -> PaymentIntent:
+        # Clave fija para todos los intentos: Stripe deduplica los reintentos
+        key = idempotency_key or f"blitz-{uuid.uuid4().hex}"
+        return self._call("create_intent", self._create_intent, amount, currency, metadata or {}, key)
+
+    def retrieve_intent(self, intent_id) -> PaymentIntent:
+        return self._call("retrieve_intent", self._retrieve_intent, intent_id)
+
+    def retrieve_intents(self, intent_ids, max_workers=None) -> dict:
+        """
+        Varios intents en paralelo sobre el pool de conexiones (Stripe no tiene
+        retrieve por lotes). Devuelve ``{id: PaymentIntent | PaymentGatewayError}``;
+        si el breaker se abre a mitad, el resto de ids devuelve ``GatewayUnavailable``.
+        """
+        intent_ids = list(dict.fromkeys(intent_ids))
+        if not intent_ids:
+            return {}
+
+        def fetch(intent_id):
+            try:
+                return self.retrieve_intent(intent_id)
+            except PaymentGatewayError as e:
+                return e
+
+        workers = max(1, min(max_workers or self.pool_size, len(intent_ids)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return dict(zip(intent_ids, pool.map(fetch, intent_ids)))
+
+    def _call(self, op, fn, *args):
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                logger.warning("[payments.gateway.breaker_open] gateway=%s op=%s", self.name, op)
+                raise GatewayUnavailable()
+            t0 = time.perf_counter()
+            try:
+                result = fn(*args)
+            except PaymentGatewayError as e:
+                dt = (time.perf_counter() - t0) * 1000
+                if not e.retryable:
+                    # Error del cliente (tarjeta, parámetros): la pasarela funciona
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                logger.warning("[payments.gateway.error] gateway=%s op=%s attempt=%s ms=%.2f err=%s",
+                               self.name, op, attempt + 1, dt, e.message)
+                if attempt >= self.max_retries:
+                    raise GatewayUnavailable(e.message) from e
+                attempt += 1
+                time.sleep(self.backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+                continue
+            except Exception:
+                # Fallo inesperado (bug del SDK, respuesta rara): cuenta como fallo y libera
+                # la prueba half-open; si no, el breaker se quedaría abierto para siempre
+                self.breaker.record_failure()
+                logger.exception("[payments.gateway.unexpected] gateway=%s op=%s attempt=%s", self.name, op, attempt + 1)
+                raise
+            self.breaker.record_success()
+            logger.info("[payments.gateway.ok] gateway=%s op=%s attempt=%s ms=%.2f",
+                        self.name, op, attempt + 1, (time.perf_counter() - t0) * 1000)
+            return result
+
+
+class StripeGateway(PaymentGateway):
+    name = "stripe"
+
+    def __init__(self, api_key, pool_size=10, create_timeout=(3.0, 10.0), retrieve_timeout=(3.0, 5.0), **kwargs):
+        super().__init__(**kwargs)
+        self.pool_size = pool_size
+        import requests
+        import stripe
+        from requests.adapters import HTTPAdapter
+
+        self._stripe = stripe
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        session.mount("https://", adapter)
+        self.session = session
+
+        def client(timeout):
+            return stripe.StripeClient(
+                api_key or "",
+                http_client=stripe.RequestsClient(session=session, timeout=timeout),
+                max_network_retries=0,  # los reintentos los controla _call
+            )
+
+        # Mismo pool de conexiones, presupuesto de tiempo distinto por operación
+        self._create_client = client(create_timeout)
+        self._retrieve_client = client(retrieve_timeout)
+
+    def _wrap(self, intent) -> PaymentIntent:
+        return PaymentIntent(
+            id=intent.id,
+            client_secret=intent.client_secret,
+            status=intent.status,
+            amount=intent.amount,
+            currency=intent.currency,
+            metadata=dict(intent.metadata or {}),
+        )
+
+    def _translate(self, e):
+        err = self._stripe.error
+        if isinstance(e, (err.APIConnectionError, err.RateLimitError)):
+            return PaymentGatewayError(str(e), status=503, retryable=True)
+        if isinstance(e, err.APIError) or (getattr(e, "http_status", None) or 0) >= 500:
+            return PaymentGatewayError(str(e), status=503, retryable=True)
+        return PaymentGatewayError(str(e), status=400, retryable=False)
+
+    def _create_intent(self, amount, currency, metadata, idempotency_key):
+        try:
+            intent = self._create_client.payment_intents.create(
+                params={"amount": amount, "currency": currency, "metadata": metadata},
+                options={"idempotency_key": idempotency_key},
+            )
+        except self._stripe.error.StripeError as e:
+            raise self._translate(e) from e
+        return self._wrap(intent)
+
+    def _retrieve_intent(self, intent_id):
+        try:
+            intent = self._retrieve_client.payment_intents.retrieve(intent_id)
+        except self._stripe.error.StripeError as e:
+            raise self._translate(e) from e
+        return self._wrap(intent)
+
+
+class FakeGateway(PaymentGateway):
+    """Pasarela en memoria: mismos contratos que Stripe, sin red."""
+    name = "fake"
+
+    def __init__(self, latency_ms=0.0, failure_rate=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = float(latency_ms) / 1000.0
+        self.failure_rate = float(failure_rate)
+        self.intents = {}
+        self._by_key = {}
+        self._lock = threading.Lock()
+
+    def _simulate(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise PaymentGatewayError("Simulated gateway failure", status=503, retryable=True)
+
+    def _create_intent(self, amount, currency, metadata, idempotency_key):
+        self._simulate()
+        with self._lock:
+            if idempotency_key in self._by_key:
+                return self.intents[self._by_key[idempotency_key]]
+            intent_id = f"pi_fake_{uuid.uuid4().hex[:24]}"
+            intent = PaymentIntent(
+                id=intent_id,
+                client_secret=f"{intent_id}_secret_{uuid.uuid4().hex[:12]}",
+                status="requires_payment_method",
+                amount=amount,
+                currency=currency,
+                metadata=dict(metadata),
+            )
+            self.intents[intent_id] = intent
+            self._by_key[idempotency_key] = intent_id
+            return intent
+
+    def _retrieve_intent(self, intent_id):
+        self._simulate()
+        intent = self.intents.get(intent_id)
+        if intent is None:
+            raise PaymentGatewayError(f"No such payment_intent: '{intent_id}'", status=400)
+        return intent
+
+    def set_status(self, intent_id, status):
+        """Simula la confirmación en el cliente (``succeeded``, ``canceled``...)."""
+        self.intents[intent_id].status = status
+
+
+def create_gateway(config) -> PaymentGateway:
+    common = {
+        "breaker": CircuitBreaker(config.get("PAYMENT_BREAKER_THRESHOLD", 5), config.get("PAYMENT_BREAKER_RESET", 30)),
+        "max_retries": config.get("STRIPE_MAX_RETRIES", 2),
+        "backoff": config.get("STRIPE_RETRY_BACKOFF", 0.2),
+    }
+    kind = (config.get("PAYMENT_GATEWAY") or "stripe").lower()
+    if kind == "fake":
+        return FakeGateway(
+            latency_ms=config.get("PAYMENT_FAKE_LATENCY_MS", 0),
+            failure_rate=config.get("PAYMENT_FAKE_FAILURE_RATE", 0),
+            **common,
+        )
+    if kind != "stripe":
+        raise ValueError(f"Unknown PAYMENT_GATEWAY: {kind!r}")
+    connect = config.get("STRIPE_CONNECT_TIMEOUT", 3.0)
+    return StripeGateway(
+        # payments.py carga .env al importarse, después de create_app
+        api_key=config.get("STRIPE_SECRET_KEY") or os.environ.get("STRIPE_SECRET_KEY"),
+        pool_size=config.get("STRIPE_POOL_SIZE", 10),
+        create_timeout=(connect, config.get("STRIPE_CREATE_TIMEOUT", 10.0)),
+        retrieve_timeout=(connect, config.get("STRIPE_RETRIEVE_TIMEOUT", 5.0)),
+        **common,
+    )
+
+
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> PaymentGateway:
+    """Pasarela de la app (una por proceso, creada en la primera llamada)."""
+    app = current_app._get_current_object()
+    gateway = app.extensions.get("payment_gateway")
+    if gateway is None:
+        with _gateway_lock:
+            gateway = app.extensions.get("payment_gateway")
+            if gateway is None:
+                gateway = create_gateway(app.config)
+                app.extensions["payment_gateway"] = gateway
+                logger.info("[payments.gateway.init] gateway=%s", gateway.name)
+    return gateway
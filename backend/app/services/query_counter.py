@@ -0,0 +1,84 @@
+# app/services/query_counter.py – BlitzShop (contador de consultas SQL por petición)
+"""
+Cuenta las sentencias SQL de cada petición (evento ``before_cursor_execute``).
+
+- ``X-Query-Count`` en la respuesta si ``QUERY_COUNT_HEADER`` está activo
+  (por defecto en debug/testing).
+- ``@max_queries(n)`` fija el presupuesto de un endpoint. Si se supera: en
+  testing o con ``QUERY_BUDGET_STRICT`` lanza ``QueryBudgetExceeded`` (la
+  regresión N+1 rompe la petición en desarrollo/CI); en producción solo
+  ``logger.warning``.
+- ``count_queries()`` cuenta un bloque de código (scripts, consola).
+"""
+import logging
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+HEADER = "X-Query-Count"
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def _on_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        g._query_count = g.get("_query_count", 0) + 1
+
+
+def current_count() -> int:
+    return g.get("_query_count", 0) if has_app_context() else 0
+
+
+@contextmanager
+def count_queries():
+    """``with count_queries() as c: ...`` -> ``c.count`` al salir."""
+
+    class _Counter:
+        count = 0
+
+    counter = _Counter()
+    start = current_count()
+    try:
+        yield counter
+    finally:
+        counter.count = current_count() - start
+
+
+def max_queries(limit: int):
+    """Presupuesto de consultas SQL para una vista (ver docstring del módulo)."""
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = current_count()
+            rv = fn(*args, **kwargs)
+            used = current_count() - start
+            if used > limit:
+                msg = f"{request.endpoint} ran {used} SQL queries (budget {limit})"
+                if current_app.testing or current_app.config.get("QUERY_BUDGET_STRICT"):
+                    raise QueryBudgetExceeded(msg)
+                logger.warning("[db.query_budget.exceeded] endpoint=%s queries=%s budget=%s",
+                               request.endpoint, used, limit)
+            return rv
+
+        return wrapper
+
+    return decorator
+
+
+def init_app(app):
+    if not event.contains(Engine, "before_cursor_execute", _on_execute):
+        event.listen(Engine, "before_cursor_execute", _on_execute)
+
+    @app.after_request
+    def _query_count_header(response):
+        if app.config.get("QUERY_COUNT_HEADER") or app.debug or app.testing:
+            response.headers[HEADER] = str(current_count())
+        return response
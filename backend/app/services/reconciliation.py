@@ -0,0 +1,161 @@
+# app/services/reconciliation.py – BlitzShop (conciliación de pagos pendientes)
+"""
+Conciliación de órdenes ``pending`` con payment intent contra Stripe.
+
+Una orden se queda en ``pending`` si el webhook no llega y el usuario no vuelve
+a ``/api/payments/confirm``. ``reconcile_pending`` recorre esas órdenes (más
+viejas que ``min_age``) por lotes keyset sobre ``id``, sin OFFSET:
+
+1. consulta los intents del lote en paralelo (``gateway.retrieve_intents``);
+2. relee las órdenes del lote que sigan ``pending`` (``FOR UPDATE`` en
+   PostgreSQL: un webhook o un confirm puede haberlas cambiado mientras tanto);
+3. aplica ``INTENT_ORDER_STATUS`` con las mismas reglas que los webhooks
+   (``stripe_events.apply_payment_status``: transición válida + evento en el
+   outbox) y hace un único commit por lote.
+
+Un intent que no se pudo consultar cuenta como error y la orden no se toca. Si
+el breaker de la pasarela se abre, la pasada se corta y el informe lo indica.
+"""
+import logging
+from datetime import datetime, timedelta
+from time import perf_counter
+
+from flask import current_app
+
+from app import db
+from app.models.order import Order
+from app.services import payment_gateway, stripe_events
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MIN_AGE_MINUTES = 30
+MAX_REPORTED_ERRORS = 20
+
+
+class ReconcileReport:
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.batches = 0
+        self.scanned = 0
+        self.paid = 0
+        self.cancelled = 0
+        self.unchanged = 0
+        self.skipped = 0  # cambiadas por otro proceso durante la pasada
+        self.errors = 0
+        self.aborted = False
+        self.error_samples = []
+        self.elapsed_ms = 0.0
+
+    def add_error(self, order_id, intent_id, message):
+        self.errors += 1
+        if len(self.error_samples) < MAX_REPORTED_ERRORS:
+            self.error_samples.append({"order_id": order_id, "payment_intent_id": intent_id, "error": message})
+
+    def to_dict(self):
+        return {
+            "dry_run": self.dry_run,
+            "batches": self.batches,
+            "scanned": self.scanned,
+            "paid": self.paid,
+            "cancelled": self.cancelled,
+            "unchanged": self.unchanged,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "aborted": self.aborted,
+            "error_samples": self.error_samples,
+            "elapsed_ms": round(self.elapsed_ms, 2),
+        }
+
+
+def _pending_batch(after_id, cutoff, batch_size):
+    return (
+        db.session.query(Order.id, Order.stripe_payment_intent_id)
+        .filter(
+            Order.status == "pending",
+            Order.stripe_payment_intent_id.isnot(None),
+            Order.created_at < cutoff,
+            Order.id > after_id,
+        )
+        .order_by(Order.id)
+        .limit(batch_size)
+        .all()
+    )
+
+
+def _apply_batch(rows, intents, report):
+    query = Order.query.filter(Order.id.in_([r.id for r in rows]), Order.status == "pending")
+    if db.engine.dialect.name == "postgresql":
+        query = query.with_for_update()
+    orders = {o.id: o for o in query.all()}
+    report.skipped += len(rows) - len(orders)
+
+    for row in rows:
+        order = orders.get(row.id)
+        if order is None:
+            continue
+        result = intents.get(row.stripe_payment_intent_id)
+        if isinstance(result, payment_gateway.PaymentGatewayError) or result is None:
+            report.add_error(row.id, row.stripe_payment_intent_id, getattr(result, "message", "not fetched"))
+            continue
+        # El intent guardado pudo reemplazarse (nuevo create-intent) mientras se consultaba
+        if order.stripe_payment_intent_id != row.stripe_payment_intent_id:
+            report.skipped += 1
+            continue
+        new_status = stripe_events.INTENT_ORDER_STATUS.get(result.status)
+        if new_status is None:
+            report.unchanged += 1
+            continue
+        if report.dry_run:
+            changed = order.status in stripe_events.ALLOWED_TRANSITIONS.get(new_status, ())
+        else:
+            changed = stripe_events.apply_payment_status(order, new_status)
+        if not changed:
+            report.unchanged += 1
+        elif new_status == "paid":
+            report.paid += 1
+        else:
+            report.cancelled += 1
+
+    if report.dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+
+
+def reconcile_pending(batch_size=None, min_age=None, limit=None, dry_run=False) -> ReconcileReport:
+    """Concilia las órdenes pendientes con intent. ``limit`` acota el nº de órdenes revisadas."""
+    batch_size = batch_size or current_app.config.get("RECONCILE_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+    if min_age is None:
+        min_age = timedelta(minutes=current_app.config.get("RECONCILE_MIN_AGE_MINUTES", DEFAULT_MIN_AGE_MINUTES))
+    # created_at se guarda naive en UTC (datetime.utcnow)
+    cutoff = datetime.utcnow() - min_age
+    gateway = payment_gateway.get_gateway()
+
+    report = ReconcileReport(dry_run=dry_run)
+    t0 = perf_counter()
+    after_id = 0
+    while limit is None or report.scanned < limit:
+        size = batch_size if limit is None else min(batch_size, limit - report.scanned)
+        rows = _pending_batch(after_id, cutoff, size)
+        db.session.rollback()  # no mantener la transacción abierta durante las llamadas a Stripe
+        if not rows:
+            break
+        after_id = rows[-1].id
+        report.batches += 1
+        report.scanned += len(rows)
+
+        tb = perf_counter()
+        intents = gateway.retrieve_intents([r.stripe_payment_intent_id for r in rows])
+        _apply_batch(rows, intents, report)
+        logger.info("[reconcile.batch.ok] batch=%s orders=%s last_id=%s ms=%.2f",
+                    report.batches, len(rows), after_id, (perf_counter() - tb) * 1000)
+
+        if gateway.breaker.state == "open":
+            report.aborted = True
+            logger.warning("[reconcile.aborted] breaker open after batch=%s last_id=%s", report.batches, after_id)
+            break
+
+    report.elapsed_ms = (perf_counter() - t0) * 1000
+    logger.info("[reconcile.ok] %s", {k: v for k, v in report.to_dict().items() if k != "error_samples"})
+    return report
@@ -0,0 +1,182 @@
+# app/services/search.py – BlitzShop (búsqueda full-text del catálogo)
+"""
+Índice full-text de productos.
+
+- SQLite: tabla virtual FTS5 ``products_fts`` (rowid = products.id), ranking bm25.
+- PostgreSQL: columna ``products.search_vector`` (tsvector) + índice GIN, ranking ts_rank.
+- Cualquier otro motor (o SQLite sin FTS5): fallback a ILIKE como antes.
+
+El índice se mantiene sincronizado explícitamente desde las rutas que escriben
+productos (``sync_products`` / ``remove_products``) dentro de la misma
+transacción, y ``ensure_search_index`` lo crea y pone al día al arrancar.
+"""
+import logging
+import re
+
+from flask import current_app
+from sqlalchemy import bindparam, func, literal_column, or_, text, Float, Integer
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from app import db
+from app.models.product import Product
+
+logger = logging.getLogger(__name__)
+
+BACKEND_FTS5 = "fts5"
+BACKEND_TSVECTOR = "tsvector"
+
+# Configuración de texto de Postgres: 'simple' porque el catálogo mezcla ES/EN
+TS_CONFIG = "simple"
+MAX_TERMS = 8
+# Peso del nombre frente a la descripción en el ranking
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_TSVECTOR_EXPR = (
+    f"setweight(to_tsvector('{TS_CONFIG}', coalesce(name, '')), 'A') || "
+    f"setweight(to_tsvector('{TS_CONFIG}', coalesce(description, '')), 'B')"
+)
+
+
+def _dialect() -> str:
+    try:
+        return db.engine.dialect.name
+    except Exception:
+        return "unknown"
+
+
+def search_backend():
+    """Backend activo ('fts5', 'tsvector') o None si se usa ILIKE."""
+    return current_app.extensions.get("product_search")
+
+
+def _tokens(q: str):
+    return _TOKEN_RE.findall((q or "").lower())[:MAX_TERMS]
+
+
+# -----------------------------
+# Creación / mantenimiento del índice
+# -----------------------------
+
+def ensure_search_index():
+    """Crea el índice si falta e indexa los productos que no lo estén. Llamar con app context."""
+    dialect = _dialect()
+    backend = None
+    try:
+        if dialect == "sqlite":
+            db.session.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts "
+                "USING fts5(name, description, tokenize = 'unicode61 remove_diacritics 2')"
+            ))
+            # Puesta al día: filas creadas por scripts/seeds sin pasar por las rutas
+            db.session.execute(text(
+                "INSERT INTO products_fts (rowid, name, description) "
+                "SELECT id, name, coalesce(description, '') FROM products "
+                "WHERE id NOT IN (SELECT rowid FROM products_fts)"
+            ))
+            db.session.execute(text(
+                "DELETE FROM products_fts WHERE rowid NOT IN (SELECT id FROM products)"
+            ))
+            backend = BACKEND_FTS5
+        elif dialect == "postgresql":
+            db.session.execute(text("ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector"))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_products_search_vector "
+                "ON products USING GIN (search_vector)"
+            ))
+            db.session.execute(text(
+                f"UPDATE products SET search_vector = {_TSVECTOR_EXPR} WHERE search_vector IS NULL"
+            ))
+            backend = BACKEND_TSVECTOR
+        db.session.commit()
+    except (OperationalError, ProgrammingError) as e:
+        db.session.rollback()
+        logger.warning("[search.ensure.error] dialect=%s err=%s (fallback ILIKE)", dialect, str(e))
+        backend = None
+
+    current_app.extensions["product_search"] = backend
+    logger.info("[search.ensure.ok] dialect=%s backend=%s", dialect, backend or "ilike")
+    return backend
+
+
+def sync_products(product_ids):
+    """
+    Reindexa los productos indicados en la transacción actual.
+    Llamar después de flush() y antes de commit().
+    """
+    ids = [int(i) for i in product_ids if i is not None]
+    if not ids:
+        return
+    backend = search_backend()
+    if backend == BACKEND_FTS5:
+        db.session.execute(
+            text("DELETE FROM products_fts WHERE rowid IN :ids").bindparams(bindparam("ids", expanding=True)),
+            {"ids": ids},
+        )
+        db.session.execute(
+            text(
+                "INSERT INTO products_fts (rowid, name, description) "
+                "SELECT id, name, coalesce(description, '') FROM products WHERE id IN :ids"
+            ).bindparams(bindparam("ids", expanding=True)),
+            {"ids": ids},
+        )
+    elif backend == BACKEND_TSVECTOR:
+        db.session.execute(
+            text(f"UPDATE products SET search_vector = {_TSVECTOR_EXPR} WHERE id IN :ids")
+            .bindparams(bindparam("ids", expanding=True)),
+            {"ids": ids},
+        )
+
+
+def remove_products(product_ids):
+    """Quita productos borrados físicamente del índice (Postgres lo hace con la fila)."""
+    ids = [int(i) for i in product_ids if i is not None]
+    if ids and search_backend() == BACKEND_FTS5:
+        db.session.execute(
+            text("DELETE FROM products_fts WHERE rowid IN :ids").bindparams(bindparam("ids", expanding=True)),
+            {"ids": ids},
+        )
+
+
+# -----------------------------
+# Consulta
+# -----------------------------
+
+def apply_search(query, q: str):
+    """
+    Filtra ``query`` (sobre Product) por el texto ``q``.
+
+    Devuelve ``(query, rank_order)``; ``rank_order`` es la expresión de
+    ORDER BY por relevancia, o None cuando se usa el fallback ILIKE.
+    Los términos se buscan como prefijos ("cof" encuentra "coffee") y
+    todos deben aparecer (AND), igual que al teclear en el buscador.
+    """
+    terms = _tokens(q)
+    backend = search_backend()
+
+    if terms and backend == BACKEND_FTS5:
+        match = " ".join(f'"{t}"*' for t in terms)
+        fts = (
+            text(
+                f"SELECT rowid AS product_id, bm25(products_fts, {NAME_WEIGHT}, {DESCRIPTION_WEIGHT}) AS rank "
+                "FROM products_fts WHERE products_fts MATCH :match"
+            )
+            .bindparams(match=match)
+            .columns(product_id=Integer, rank=Float)
+            .subquery("fts")
+        )
+        query = query.join(fts, Product.id == fts.c.product_id)
+        # bm25: más negativo = más relevante
+        return query, fts.c.rank.asc()
+
+    if terms and backend == BACKEND_TSVECTOR:
+        tsquery = func.to_tsquery(TS_CONFIG, " & ".join(f"{t}:*" for t in terms))
+        vector = literal_column("products.search_vector")
+        query = query.filter(vector.op("@@")(tsquery))
+        return query, func.ts_rank(vector, tsquery).desc()
+
+    like = f"%{q}%"
+    query = query.filter(or_(Product.name.ilike(like), Product.description.ilike(like)))
+    return query, None
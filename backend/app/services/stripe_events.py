@@ -0,0 +1,148 @@
+# app/services/stripe_events.py – BlitzShop (ingesta de webhooks de Stripe)
+"""
+Webhooks de Stripe: guardar rápido, procesar después.
+
+1. ``record_event`` (en la petición del webhook): guarda el evento verificado
+   en ``stripe_events`` con su id de Stripe como clave única y encola
+   ``stripe.event_received`` en el outbox, en la misma transacción. Un evento
+   reenviado choca con la clave única y se responde 2xx sin hacer nada más.
+2. ``process_events`` (worker del outbox): aplica los eventos pendientes de un
+   payment intent en orden (``created`` de Stripe, luego id local), con las
+   filas bloqueadas en PostgreSQL para que dos workers no intercalen eventos
+   del mismo intent.
+
+Transiciones: ``paid`` solo desde pending/cancelled; ``cancelled`` solo desde
+pending. Un ``payment_failed`` que llega tarde no deshace un pago.
+"""
+import logging
+from datetime import datetime, timezone
+
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.order import Order
+from app.models.stripe_event import StripeEvent
+from app.services import outbox
+
+logger = logging.getLogger(__name__)
+
+EVENT_ORDER_STATUS = {
+    "payment_intent.succeeded": "paid",
+    "payment_intent.canceled": "cancelled",
+    "payment_intent.payment_failed": "cancelled",
+}
+
+# Estado del PaymentIntent consultado en Stripe -> estado de la orden (None = sigue pendiente)
+INTENT_ORDER_STATUS = {
+    "succeeded": "paid",
+    "canceled": "cancelled",
+    "requires_payment_method": "cancelled",
+}
+
+ALLOWED_TRANSITIONS = {
+    "paid": ("pending", "cancelled"),
+    "cancelled": ("pending",),
+}
+
+
+def _intent_object(event: dict) -> dict:
+    obj = (event.get("data") or {}).get("object") or {}
+    return obj if obj.get("object", "payment_intent") == "payment_intent" else {}
+
+
+def record_event(event: dict):
+    """Guarda el evento (ya verificado) y encola su procesado. Devuelve ``(row, created)``."""
+    existing = StripeEvent.query.filter_by(stripe_event_id=event["id"]).first()
+    if existing:
+        return existing, False
+
+    intent = _intent_object(event)
+    row = StripeEvent(
+        stripe_event_id=event["id"],
+        event_type=event.get("type") or "unknown",
+        payment_intent_id=intent.get("id"),
+        stripe_created=event.get("created"),
+        livemode=bool(event.get("livemode")),
+        payload=event,
+        status="pending",
+    )
+    db.session.add(row)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # Reentrega concurrente del mismo evento: el otro INSERT ganó
+        db.session.rollback()
+        return StripeEvent.query.filter_by(stripe_event_id=event["id"]).first(), False
+
+    outbox.enqueue(
+        "stripe.event_received",
+        {"stripe_event_id": row.stripe_event_id, "payment_intent_id": row.payment_intent_id},
+        aggregate_type="stripe_event",
+        aggregate_id=row.id,
+    )
+    db.session.commit()
+    return row, True
+
+
+def apply_payment_status(order, new_status) -> bool:
+    """Cambia el estado del pedido si la transición es válida (+ evento en el outbox)."""
+    if order.status == new_status or order.status not in ALLOWED_TRANSITIONS.get(new_status, ()):
+        return False
+    old_status = order.status
+    order.status = new_status
+    outbox.enqueue_order_status(order, old_status)
+    return True
+
+
+def _find_order(event: StripeEvent):
+    intent = _intent_object(event.payload)
+    order_id = (intent.get("metadata") or {}).get("order_id")
+    order = None
+    if order_id:
+        try:
+            order = db.session.get(Order, int(order_id))
+        except (TypeError, ValueError):
+            order = None
+    if order is None and event.payment_intent_id:
+        order = Order.query.filter_by(stripe_payment_intent_id=event.payment_intent_id).first()
+    return order
+
+
+def apply_event(event: StripeEvent):
+    new_status = EVENT_ORDER_STATUS.get(event.event_type)
+    event.processed_at = datetime.now(timezone.utc)
+    if new_status is None:
+        event.status = "ignored"
+        return
+
+    order = _find_order(event)
+    if order is None:
+        event.status = "ignored"
+        logger.warning("[stripe_events.order_not_found] event=%s pi=%s", event.stripe_event_id, event.payment_intent_id)
+        return
+
+    event.order_id = order.id
+    changed = apply_payment_status(order, new_status)
+    event.status = "processed"
+    logger.info("[stripe_events.applied] event=%s type=%s order_id=%s status=%s changed=%s",
+                event.stripe_event_id, event.event_type, order.id, order.status, changed)
+
+
+def process_events(stripe_event_id, payment_intent_id=None) -> int:
+    """
+    Aplica los eventos pendientes del intent (o solo ``stripe_event_id`` si el
+    evento no es de un intent). Sin commit: lo hace quien llama (el outbox).
+    """
+    query = StripeEvent.query.filter(StripeEvent.status == "pending")
+    if payment_intent_id:
+        query = query.filter(StripeEvent.payment_intent_id == payment_intent_id)
+    else:
+        query = query.filter(StripeEvent.stripe_event_id == stripe_event_id)
+    query = query.order_by(StripeEvent.stripe_created, StripeEvent.id)
+    if db.engine.dialect.name == "postgresql":
+        query = query.with_for_update()
+
+    events = query.all()
+    for event in events:
+        apply_event(event)
+    return len(events)
@@ -0,0 +1,70 @@
+# app/services/uploads.py – BlitzShop (servir static/uploads)
+"""
+Entrega de ficheros subidos con caché HTTP de larga duración.
+
+- Nombres direccionados por contenido (variantes ``<hash>_<variante>.<ext>``) y
+  originales con prefijo UUID nunca cambian de contenido: ``Cache-Control:
+  public, max-age=31536000, immutable``. El resto, una hora.
+- ETag / Last-Modified / Range (206) los resuelve ``send_from_directory``.
+- ``UPLOADS_SENDFILE_MODE``: ``x-accel`` (nginx) o ``x-sendfile`` (Apache /
+  lighttpd) devuelve solo cabeceras y el proxy envía los bytes; el worker de
+  Python no transmite la imagen. Con nginx: ``location /_uploads/ { internal;
+  alias <backend>/static/uploads/; }`` (prefijo en ``UPLOADS_ACCEL_PREFIX``).
+"""
+import mimetypes
+import os
+import re
+
+from flask import abort, current_app, send_from_directory
+from werkzeug.security import safe_join
+
+from app.services import images
+
+IMMUTABLE_MAX_AGE = 31536000  # 1 año
+DEFAULT_MAX_AGE = 3600
+
+_IMMUTABLE_NAME_RE = re.compile(
+    r"^(?:[0-9a-f]{24}_(?:thumb|medium|large)\.(?:webp|jpg)"        # variantes por hash
+    r"|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}_.+)$"  # originales uuid_
+)
+
+
+def is_immutable(filename: str) -> bool:
+    return bool(_IMMUTABLE_NAME_RE.match(filename))
+
+
+def cache_control(filename: str) -> str:
+    if is_immutable(filename):
+        return f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    return f"public, max-age={DEFAULT_MAX_AGE}"
+
+
+def send_upload(filename: str):
+    uploads_dir = os.path.abspath(images.upload_folder())
+    mode = (current_app.config.get("UPLOADS_SENDFILE_MODE") or "").lower()
+
+    if mode in ("x-accel", "x-sendfile"):
+        path = safe_join(uploads_dir, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        response = current_app.response_class(status=200)
+        response.mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        if mode == "x-accel":
+            prefix = current_app.config.get("UPLOADS_ACCEL_PREFIX", "/_uploads")
+            response.headers["X-Accel-Redirect"] = f"{prefix.rstrip('/')}/{filename}"
+        else:
+            response.headers["X-Sendfile"] = path
+        # El proxy calcula ETag/Range; aquí solo la política de caché
+        response.headers["Cache-Control"] = cache_control(filename)
+        return response
+
+    immutable = is_immutable(filename)
+    response = send_from_directory(
+        uploads_dir,
+        filename,
+        max_age=IMMUTABLE_MAX_AGE if immutable else DEFAULT_MAX_AGE,
+        conditional=True,
+        etag=True,
+    )
+    response.headers["Cache-Control"] = cache_control(filename)
+    return response
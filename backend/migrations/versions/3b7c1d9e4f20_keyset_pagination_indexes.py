@@ -0,0 +1,30 @@
+"""Keyset pagination indexes on (created_at, id)
+
+Revision ID: 3b7c1d9e4f20
+Revises: e54fed43482a
+Create Date: 2026-10-16 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7c1d9e4f20'
+down_revision = 'e54fed43482a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_orders_created_at_id', 'orders', ['created_at', 'id'])
+    op.create_index('ix_orders_user_created_at_id', 'orders', ['user_id', 'created_at', 'id'])
+    op.create_index('ix_invoices_user_created_at_id', 'invoices', ['user_id', 'created_at', 'id'])
+    op.create_index('ix_products_active_created_at_id', 'products', ['is_active', 'created_at', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_products_active_created_at_id', table_name='products')
+    op.drop_index('ix_invoices_user_created_at_id', table_name='invoices')
+    op.drop_index('ix_orders_user_created_at_id', table_name='orders')
+    op.drop_index('ix_orders_created_at_id', table_name='orders')
@@ -0,0 +1,34 @@
+"""One invoice per order: unique constraint on invoices.order_id
+
+Revision ID: 5d81b3f0a6c2
+Revises: c2f9a7d4e813
+Create Date: 2026-10-16 17:42:09.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d81b3f0a6c2'
+down_revision = 'c2f9a7d4e813'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Duplicates need manual review (each one has its own invoice number): fail instead of deleting
+    duplicates = op.get_bind().execute(sa.text(
+        "SELECT order_id, COUNT(*) FROM invoices GROUP BY order_id HAVING COUNT(*) > 1"
+    )).fetchall()
+    if duplicates:
+        listed = ", ".join(f"order {order_id} ({count})" for order_id, count in duplicates[:20])
+        raise RuntimeError(f"Orders with more than one invoice, resolve before upgrading: {listed}")
+
+    with op.batch_alter_table('invoices', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_invoices_order_id', ['order_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('invoices', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_invoices_order_id', type_='unique')
@@ -0,0 +1,26 @@
+"""Indexes for conditional GET fingerprints (MAX(updated_at))
+
+Revision ID: 8a4e2c6b1d57
+Revises: 3b7c1d9e4f20
+Create Date: 2026-10-16 11:03:27.540912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4e2c6b1d57'
+down_revision = '3b7c1d9e4f20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_products_updated_at', 'products', ['updated_at'])
+    op.create_index('ix_reviews_product_updated_at', 'reviews', ['product_id', 'updated_at'])
+
+
+def downgrade():
+    op.drop_index('ix_reviews_product_updated_at', table_name='reviews')
+    op.drop_index('ix_products_updated_at', table_name='products')
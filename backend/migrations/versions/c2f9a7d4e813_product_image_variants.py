@@ -0,0 +1,26 @@
+"""Add products.image_variants (resized WebP/JPEG variants)
+
+Revision ID: c2f9a7d4e813
+Revises: 8a4e2c6b1d57
+Create Date: 2026-10-16 12:20:05.118734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2f9a7d4e813'
+down_revision = '8a4e2c6b1d57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image_variants', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('products', schema=None) as batch_op:
+        batch_op.drop_column('image_variants')
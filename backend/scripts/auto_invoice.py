@@ -0,0 +1,51 @@
+"""
+Factura todos los pedidos pagados que aún no tienen factura (cierre de mes).
+
+Números consecutivos reservados por bloques, totales calculados por lote y un
+INSERT multi-fila por lote. Con ``--render-pdfs`` los PDFs se encolan en el
+outbox y los genera el worker (``python -m scripts.outbox_worker``).
+
+Uso (desde backend/):
+    python -m scripts.auto_invoice --dry-run
+    python -m scripts.auto_invoice --render-pdfs
+    python -m scripts.auto_invoice --batch-size 1000 --limit 5000
+"""
+import argparse
+import sys
+
+from app import create_app
+from app.services import invoicing
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create invoices for paid orders without one")
+    parser.add_argument("--batch-size", type=int, default=None, help="Por defecto INVOICE_BULK_BATCH_SIZE")
+    parser.add_argument("--limit", type=int, default=None, help="Máximo de pedidos a facturar")
+    parser.add_argument("--render-pdfs", action="store_true", help="Encolar la generación de PDFs en el outbox")
+    parser.add_argument("--dry-run", action="store_true", help="Solo contar los pedidos pendientes de facturar")
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    with app.app_context():
+        report = invoicing.invoice_paid_orders(
+            batch_size=args.batch_size,
+            limit=args.limit,
+            render_pdfs=args.render_pdfs,
+            dry_run=args.dry_run,
+        )
+
+    summary = report.to_dict()
+    if args.dry_run:
+        print(f"▶ (dry-run) {summary['orders']} pedidos pagados sin factura")
+        return 0
+    print(f"▶ {summary['created']} facturas en {summary['batches']} lotes "
+          f"({summary['elapsed_ms'] / 1000:.2f}s)"
+          + (f": {summary['first_number']} .. {summary['last_number']}" if summary["created"] else ""))
+    if args.render_pdfs and summary["pdf_batches_queued"]:
+        print(f"  {summary['pdf_batches_queued']} lotes de PDFs encolados en el outbox")
+    print("✅ Facturación completada")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+Micro-benchmark del render de facturas y de la lectura de ajustes.
+
+- PDF: mismo snapshot renderizado N veces construyendo estilos y párrafos fijos
+  en cada documento (``InvoiceTemplate()`` nuevo = como antes) y con la
+  plantilla precompilada del proceso (``get_template()``).
+- Ajustes: ``InvoiceSettings.get_settings()`` (consulta por llamada) frente a
+  ``InvoiceSettings.cached()`` (caché del proceso), contando también las
+  consultas SQL emitidas: en una SQLite local el tiempo de ida y vuelta es casi
+  cero, el nº de consultas no. ``--database-url`` mide contra otra base
+  (p.ej. una PostgreSQL de pruebas; se crea la fila de ajustes si falta).
+
+Por defecto usa una SQLite temporal: no toca la base de datos configurada ni la red.
+
+Uso (desde backend/):
+    python -m scripts.bench_invoice_pdf
+    python -m scripts.bench_invoice_pdf --iterations 500 --items 25
+    python -m scripts.bench_invoice_pdf --database-url postgresql://.../blitz_bench
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+
+def _sample_doc(items):
+    from app.services import invoice_pdf
+
+    doc = {name: "" for name in invoice_pdf.INVOICE_RENDERED_FIELDS}
+    subtotal = sum(Decimal("19.99") * (i % 3 + 1) for i in range(items))
+    tax = subtotal * Decimal("0.21")
+    doc.update(
+        invoice_number="INV-2025-00042",
+        issue_date=datetime(2025, 3, 31),
+        due_date=datetime(2025, 3, 31) + timedelta(days=30),
+        status="paid",
+        currency="EUR",
+        subtotal=subtotal,
+        tax_rate=Decimal("21.00"),
+        tax_amount=tax,
+        shipping_cost=Decimal("0.00"),
+        discount_amount=Decimal("0.00"),
+        total_amount=subtotal + tax,
+        billing_name="Ana García",
+        billing_email="ana@example.com",
+        billing_address="Calle Mayor 1",
+        billing_city="Madrid",
+        billing_postal_code="28013",
+        company_name="BlitzShop Demo Company",
+        company_address="Calle Principal 123",
+        company_city="Madrid",
+        company_postal_code="28001",
+        company_email="invoices@blitzshop.com",
+        terms_conditions="Payment due within 30 days. Late payments subject to 2% monthly interest.",
+    )
+    doc["items"] = [
+        {"name": f"Product {i}", "quantity": i % 3 + 1, "unit_price": Decimal("19.99")}
+        for i in range(items)
+    ]
+    doc["settings"] = {"footer_text": "Thank you for your business!"}
+    doc["template_version"] = invoice_pdf.TEMPLATE_VERSION
+    return doc
+
+
+def _timed(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def _report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"  {label:<34} mean={statistics.mean(samples):8.3f}ms  "
+          f"p50={statistics.median(samples):8.3f}ms  p95={p95:8.3f}ms")
+    return statistics.mean(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Invoice PDF / settings micro-benchmark")
+    parser.add_argument("--iterations", type=int, default=200, help="PDFs por variante")
+    parser.add_argument("--items", type=int, default=10, help="Líneas por factura")
+    parser.add_argument("--settings-iterations", type=int, default=2000)
+    parser.add_argument("--database-url", help="Base para medir los ajustes (por defecto SQLite temporal)")
+    args = parser.parse_args(argv)
+
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+
+    from sqlalchemy import event
+
+    from app import create_app, db
+    from app.models.invoice import InvoiceSettings
+    from app.services import invoice_pdf
+
+    if not invoice_pdf.PDF_SUPPORT:
+        print("❌ ReportLab no está instalado")
+        return 1
+
+    app = create_app()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    doc = _sample_doc(args.items)
+    # Calentamiento: imports perezosos de ReportLab, métricas de fuentes, plantilla del proceso
+    invoice_pdf.render_pdf(doc)
+
+    print(f"▶ PDF ({args.items} líneas, {args.iterations} iteraciones)")
+    before = _report("estilos por documento (antes)",
+                     _timed(lambda: invoice_pdf.render_pdf(doc, template=invoice_pdf.InvoiceTemplate()), args.iterations))
+    after = _report("plantilla precompilada (después)",
+                    _timed(lambda: invoice_pdf.render_pdf(doc), args.iterations))
+    print(f"  ahorro por PDF: {before - after:.3f}ms ({(before - after) / before * 100:.1f}%)")
+
+    with app.app_context():
+        InvoiceSettings.get_settings()  # crea la fila por defecto
+        queries = [0]
+
+        def count(*_):
+            queries[0] += 1
+
+        event.listen(db.engine, "before_cursor_execute", count)
+        print(f"▶ Ajustes de facturación ({args.settings_iterations} lecturas, {db.engine.dialect.name})")
+        before = _report("get_settings() (consulta)",
+                         _timed(InvoiceSettings.get_settings, args.settings_iterations))
+        print(f"    consultas SQL: {queries[0]}")
+        InvoiceSettings.invalidate_cache()
+        queries[0] = 0
+        after = _report("cached() (caché del proceso)",
+                        _timed(InvoiceSettings.cached, args.settings_iterations))
+        print(f"    consultas SQL: {queries[0]} "
+              f"(comprobación de versión cada {app.config['INVOICE_SETTINGS_VERSION_CHECK']}s)")
+        event.remove(db.engine, "before_cursor_execute", count)
+        print(f"  ahorro por lectura: {before - after:.3f}ms")
+
+    print("✅ Benchmark completado")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
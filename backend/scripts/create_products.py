@@ -6,6 +6,7 @@ INCLUYE MOCCAMASTER - Sin alimentos, belleza, juguetes ni libros
 
 from app import create_app, db
 from app.models.product import Product
+from app.services.search import ensure_search_index
 
 def create_test_products():
     app = create_app()
@@ -201,6 +202,7 @@ def create_test_products():
             print(f"✅ Creando: {product_data['name']} - €{product_data['price']} ({product_data['category']})")
         
         db.session.commit()
+        ensure_search_index()  # indexar los productos nuevos para la búsqueda full-text
         print(f"\n🎉 {len(products)} productos VARIADOS creados!")
         print("✅ Incluye tu Moccamaster KBG Select")
         print("✅ Categorías: Electrónica, Ropa, Hogar, Deportes, Oficina, Herramientas")
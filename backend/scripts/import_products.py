@@ -0,0 +1,54 @@
+"""
+Importación masiva de productos desde CSV o JSON lines (upsert por lotes).
+
+Uso (desde backend/):
+    python -m scripts.import_products catalogo.csv --key shopify_product_id
+    python -m scripts.import_products productos.jsonl --key name --batch-size 1000
+
+La base de datos destino es la de la app (DATABASE_URL).
+"""
+import argparse
+import sys
+
+from app import create_app
+from app.services import catalog_import
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk product import (CSV / JSON lines)")
+    parser.add_argument("path", help="Fichero CSV o .jsonl/.ndjson ('-' = stdin)")
+    parser.add_argument("--key", choices=catalog_import.IMPORT_KEYS, default="shopify_product_id")
+    parser.add_argument("--format", choices=catalog_import.FORMATS, default=None)
+    parser.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    with app.app_context():
+        batch_size = args.batch_size or app.config.get("IMPORT_BATCH_SIZE")
+        fmt = args.format or catalog_import.detect_format(args.path if args.path != "-" else None)
+
+        def progress(result):
+            print(f"  lote {result.batches}: {result.processed} filas "
+                  f"(+{result.inserted} nuevos, ~{result.updated} actualizados, "
+                  f"{result.failed} errores) {result.elapsed_ms / 1000:.1f}s", flush=True)
+
+        if args.path == "-":
+            rows = catalog_import.iter_rows(sys.stdin, fmt)
+            result = catalog_import.import_products(rows, key=args.key, batch_size=batch_size, progress=progress)
+        else:
+            with open(args.path, "rb") as fh:
+                rows = catalog_import.iter_rows(fh, fmt)
+                result = catalog_import.import_products(rows, key=args.key, batch_size=batch_size,
+                                                        progress=progress)
+
+        for err in result.errors:
+            print(f"  ❌ línea {err['line']}: {err['error']}")
+        if result.failed > len(result.errors):
+            print(f"  ... y {result.failed - len(result.errors)} errores más")
+        print(f"✅ {result.processed} filas procesadas: {result.inserted} insertadas, "
+              f"{result.updated} actualizadas, {result.failed} con error")
+    return 1 if result.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+"""
+Worker del outbox: ejecuta en segundo plano los efectos secundarios de los
+pedidos (facturas, emails, alertas de stock).
+
+Uso (desde backend/):
+    python -m scripts.outbox_worker                 # bucle continuo
+    python -m scripts.outbox_worker --once          # vacía lo pendiente y sale (cron)
+    python -m scripts.outbox_worker --batch-size 200 --poll-interval 1
+
+Se pueden lanzar varios workers en paralelo contra PostgreSQL (SKIP LOCKED).
+"""
+import argparse
+import signal
+import sys
+
+from app import create_app
+from app.services import outbox
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Outbox worker (post-order side effects)")
+    parser.add_argument("--once", action="store_true", help="Procesar lo pendiente y salir")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--poll-interval", type=float, default=None)
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    stopping = {"flag": False}
+
+    def _stop(signum, frame):
+        stopping["flag"] = True
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    with app.app_context():
+        poll = args.poll_interval or app.config.get("OUTBOX_POLL_INTERVAL", 2)
+        print(f"▶ outbox worker (batch={args.batch_size or app.config.get('OUTBOX_BATCH_SIZE')}, poll={poll}s)", flush=True)
+        outbox.run_worker(poll_interval=poll, batch_size=args.batch_size, once=args.once,
+                          stop=lambda: stopping["flag"])
+        print(f"✅ outbox: {outbox.stats()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""
+Genera las variantes (thumb/medium/large, WebP + JPEG) de las imágenes ya subidas.
+
+Procesa los productos con imagen local (``UPLOAD_URL_PREFIX``) y sin ``image_variants``;
+el original se borra al terminar.
+
+Uso (desde backend/):
+    python -m scripts.process_images
+"""
+import os
+import sys
+from concurrent.futures import Future
+
+from app import create_app
+from app.models.product import Product
+from app.services import images
+
+
+def main():
+    app = create_app()
+    with app.app_context():
+        pending = [
+            (p.id, p.image_url)
+            for p in Product.query.filter(Product.image_variants.is_(None), Product.image_url.isnot(None))
+        ]
+        jobs = []
+        for product_id, url in pending:
+            if not images.is_local_upload(url):
+                continue
+            filename = url.rsplit("/", 1)[-1]
+            path = os.path.join(images.upload_folder(), filename)
+            if not os.path.exists(path):
+                continue
+            jobs.append((product_id, images.schedule_product_image(product_id, path, url)))
+
+        done = 0
+        for product_id, job in jobs:
+            result = job.result() if isinstance(job, Future) else job
+            if result:
+                done += 1
+                print(f"  ✅ producto {product_id}")
+            else:
+                print(f"  ❌ producto {product_id} (ver log)")
+        print(f"✅ {done}/{len(jobs)} imágenes procesadas")
+    return 0 if done == len(jobs) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
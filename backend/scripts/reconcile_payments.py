@@ -0,0 +1,59 @@
+"""
+Concilia con Stripe las órdenes que siguen en ``pending`` con payment intent.
+
+Recorre las órdenes por lotes (keyset sobre id), consulta los intents en
+paralelo a través de la pasarela y aplica pagos/cancelaciones con un commit por
+lote (eventos del outbox incluidos). Pensado para cron, p.ej. cada hora.
+
+Uso (desde backend/):
+    python -m scripts.reconcile_payments
+    python -m scripts.reconcile_payments --dry-run --min-age-minutes 60
+    python -m scripts.reconcile_payments --batch-size 200 --limit 5000 --json
+"""
+import argparse
+import json
+import sys
+from datetime import timedelta
+
+from app import create_app
+from app.services import reconciliation
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconcile pending orders with Stripe payment intents")
+    parser.add_argument("--batch-size", type=int, default=None, help="Por defecto RECONCILE_BATCH_SIZE")
+    parser.add_argument("--min-age-minutes", type=int, default=None, help="Por defecto RECONCILE_MIN_AGE_MINUTES")
+    parser.add_argument("--limit", type=int, default=None, help="Máximo de órdenes a revisar")
+    parser.add_argument("--dry-run", action="store_true", help="Consultar Stripe sin cambiar órdenes")
+    parser.add_argument("--json", action="store_true", help="Informe en JSON")
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    with app.app_context():
+        report = reconciliation.reconcile_pending(
+            batch_size=args.batch_size,
+            min_age=timedelta(minutes=args.min_age_minutes) if args.min_age_minutes is not None else None,
+            limit=args.limit,
+            dry_run=args.dry_run,
+        )
+
+    summary = report.to_dict()
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        prefix = "▶ (dry-run) " if args.dry_run else "▶ "
+        print(f"{prefix}{summary['scanned']} órdenes en {summary['batches']} lotes "
+              f"({summary['elapsed_ms'] / 1000:.1f}s): {summary['paid']} pagadas, "
+              f"{summary['cancelled']} canceladas, {summary['unchanged']} sin cambios, "
+              f"{summary['skipped']} cambiadas por otro proceso, {summary['errors']} errores")
+        for err in summary["error_samples"]:
+            print(f"  ❌ order={err['order_id']} pi={err['payment_intent_id']}: {err['error']}")
+        if report.aborted:
+            print("❌ Pasarela no disponible (breaker abierto): conciliación interrumpida")
+        elif not report.errors:
+            print("✅ Conciliación completada")
+    return 1 if report.aborted or report.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
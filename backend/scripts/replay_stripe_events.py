@@ -0,0 +1,108 @@
+"""
+Reproduce eventos de Stripe grabados a través del pipeline del webhook, sin red.
+
+Cada evento se firma localmente con STRIPE_WEBHOOK_SECRET (o uno temporal) y
+se envía a ``POST /api/payments/webhook`` con el test client de Flask: misma
+verificación de firma, deduplicación y guardado que en producción. Con
+``--process`` se vacía después el outbox (lo que haría el worker) y se
+muestra el estado final de cada evento.
+
+Entrada: ficheros con un evento JSON, una lista de eventos o JSON lines
+(p.ej. ``stripe events list --limit 100 > eventos.json`` -> campo ``data``,
+o los cuerpos guardados de ``stripe listen --print-json``).
+
+Uso (desde backend/):
+    python -m scripts.replay_stripe_events eventos.json --process
+    python -m scripts.replay_stripe_events eventos.ndjson --database-url sqlite:////tmp/replay.db --process
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import sys
+import tempfile
+import time
+
+
+def load_events(path):
+    with open(path, "r", encoding="utf-8") as fh:
+        text = fh.read().strip()
+    if not text:
+        return []
+    if text[0] == "[":
+        return json.loads(text)
+    if text[0] == "{":
+        try:
+            doc = json.loads(text)
+        except json.JSONDecodeError:
+            doc = None
+        if isinstance(doc, dict):
+            # Respuesta de la API de listado: {"object": "list", "data": [...]}
+            return doc["data"] if doc.get("object") == "list" else [doc]
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def sign(payload: bytes, secret: str, timestamp=None) -> str:
+    timestamp = int(timestamp or time.time())
+    signed = f"{timestamp}.".encode() + payload
+    signature = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded Stripe webhook events locally")
+    parser.add_argument("paths", nargs="+", help="Ficheros JSON / JSON lines con eventos")
+    parser.add_argument("--database-url", default=None, help="Por defecto DATABASE_URL (o SQLite temporal con --temp-db)")
+    parser.add_argument("--temp-db", action="store_true", help="Usar una base SQLite temporal vacía")
+    parser.add_argument("--process", action="store_true", help="Vaciar el outbox tras enviar los eventos")
+    args = parser.parse_args(argv)
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    elif args.temp_db:
+        os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/replay.db"
+    # payments.py lee el secreto al importarse
+    os.environ.setdefault("STRIPE_WEBHOOK_SECRET", "whsec_local_replay")
+    secret = os.environ["STRIPE_WEBHOOK_SECRET"]
+
+    from app import create_app
+    from app.models.stripe_event import StripeEvent
+    from app.services import outbox
+
+    app = create_app()
+    client = app.test_client()
+
+    events = [event for path in args.paths for event in load_events(path)]
+    sent = duplicates = errors = 0
+    for event in events:
+        payload = json.dumps(event, separators=(",", ":")).encode()
+        resp = client.post("/api/payments/webhook", data=payload, content_type="application/json",
+                           headers={"Stripe-Signature": sign(payload, secret)})
+        body = resp.get_json(silent=True) or {}
+        if resp.status_code != 200:
+            errors += 1
+            print(f"  ❌ {event.get('id')} {event.get('type')}: {resp.status_code} {body}")
+        elif body.get("duplicate"):
+            duplicates += 1
+            print(f"  ↺ {event.get('id')} {event.get('type')} (duplicado)")
+        else:
+            sent += 1
+            print(f"  ✅ {event.get('id')} {event.get('type')}")
+
+    with app.app_context():
+        if args.process:
+            outbox.run_worker(once=True)
+        ids = [e.get("id") for e in events if e.get("id")]
+        for row in StripeEvent.query.filter(StripeEvent.stripe_event_id.in_(ids)).order_by(
+            StripeEvent.payment_intent_id, StripeEvent.stripe_created, StripeEvent.id
+        ):
+            print(f"  {row.stripe_event_id} {row.event_type} pi={row.payment_intent_id} "
+                  f"status={row.status} order={row.order_id}")
+
+    print(f"▶ {len(events)} eventos: {sent} nuevos, {duplicates} duplicados, {errors} errores")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
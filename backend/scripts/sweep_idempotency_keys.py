@@ -0,0 +1,25 @@
+"""
+Borra las claves Idempotency-Key caducadas (y reservas abandonadas).
+
+La app ya barre cada IDEMPOTENCY_SWEEP_INTERVAL segundos mientras recibe
+peticiones; este script es para cron cuando el tráfico es bajo.
+
+Uso (desde backend/):
+    python -m scripts.sweep_idempotency_keys
+"""
+import sys
+
+from app import create_app
+from app.services import idempotency
+
+
+def main():
+    app = create_app()
+    with app.app_context():
+        deleted = idempotency.sweep_expired()
+        print(f"✅ {deleted} claves borradas")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())